@@ -0,0 +1,310 @@
+"""
+offline benchmarks, no database is needed
+
+    python benchmark.py {generator,mapping,compare,loop,all} [--output FILE] [--against FILE]
+
+generator: QueryGenerator.random_query throughput (generation and rendering)
+mapping: ClauseMapping.main latency by query length, optionally against
+    the clause_map.py of another git revision (--baseline REV)
+compare: result_analysis on synthetic result sets of 10 to 10^6 rows
+loop: full testing iterations against in-process stub connectors,
+    with an injectable per-statement latency (--latency SECONDS), or
+    against two in-process sqlite databases (--backend sqlite)
+
+results are written as JSON (with the git revision) to --output, and
+--against prints the ratio of every measure to a previous results file
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import random
+import argparse
+import tempfile
+import subprocess
+import main
+from metrics import Metrics
+from bug_index import BugIndex
+from clause_map import ClauseMapping
+from clause_identification import clauses_identifying
+from query_generation import QueryGenerator
+
+# upper bounds (characters) of the query length groups of the mapping benchmark
+MAPPING_LENGTHS = (200, 500, 1000, 2000)
+COMPARE_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+# rows returned by every SELECT of the stub connectors
+STUB_ROWS = 100
+
+def load_module_at(revision, path, name):
+    # loads one module of this repository as it was at a git revision
+    source = subprocess.check_output(["git", "show", f"{revision}:{path}"], text=True)
+    module = types.ModuleType(name)
+    exec(compile(source, f"{revision}:{path}", "exec"), module.__dict__)
+    return module
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return None
+
+def offline_generator(seed):
+    # tables are only named by init_table, which needs the databases
+    query_generator = QueryGenerator(clauses_identifying(None, None), True, seed=seed)
+    query_generator.tables = [query_generator.random_create_query()[0] for _ in range(3)]
+    return query_generator
+
+def mapping_corpus(size, seed):
+    # unmapped renderings of generated statements, the ClauseMapping.main input
+    query_generator = offline_generator(seed)
+    return [query_generator.random_statement().render(None) for _ in range(size)]
+
+def measure(function, inputs, repeat):
+    # best of repeat runs, in calls per second
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for each in inputs:
+            function(each)
+        elapsed = time.perf_counter()-started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(inputs)/best
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter()-started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+class StubStream:
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+
+    def fetchmany(self, size):
+        chunk = self.rows[self.position:self.position+size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+class StubPool:
+    def stats(self):
+        return {}
+
+class StubConnector:
+    """
+    in-process stand-in for QuestDBConnector/PostgresConnector
+    every statement sleeps latency seconds, SELECTs return rows derived
+    from the query text, so both stubs agree on every pair
+    """
+
+    def __init__(self, latency=0.0, rows=STUB_ROWS):
+        self.latency = latency
+        self.rows = rows
+        self.pool = StubPool()
+
+    def prune(self):
+        pass
+
+    def query_stream(self, query, budget=None):
+        if self.latency>0:
+            time.sleep(self.latency)
+        key = len(query)
+        return StubStream([(i, key*0.5, f"s{i%7}") for i in range(self.rows)])
+
+    def write_query(self, query, budget=None):
+        if self.latency>0:
+            time.sleep(self.latency)
+        return None
+
+def synthetic_rows(size, rng):
+    return [(rng.randint(-1000, 1000), rng.random(), f"s{rng.randint(0, 999)}") for _ in range(size)]
+
+def silence_main():
+    # benchmarks must not append to the logs, the bug index or the metrics of a real run
+    main.set_log_sink(lambda path, logstr: None)
+    main.set_record_store(None)
+    main.set_bug_index(BugIndex(None))
+    main.set_metrics(Metrics(f"{tempfile.gettempdir()}/benchmark_metrics"))
+
+def bench_generator(args):
+    query_generator = offline_generator(args.seed)
+    count = args.queries
+    generate = best_time(lambda: [query_generator.random_statement() for _ in range(count)], args.repeat)
+    statements = [query_generator.random_statement() for _ in range(count)]
+    render = best_time(lambda: [query_generator.render(statement) for statement in statements], args.repeat)
+    total = best_time(lambda: [query_generator.random_query() for _ in range(count)], args.repeat)
+    results = {
+        "random_query_per_second": count/total,
+        "random_statement_per_second": count/generate,
+        "render_per_second": count/render,
+    }
+    print(f"random_query: {results['random_query_per_second']:.0f}/s "
+          f"(generate {results['random_statement_per_second']:.0f}/s, render {results['render_per_second']:.0f}/s)")
+    return results
+
+def mapping_latencies(mapping, corpus, repeat):
+    # best per-query latency (seconds) of every query
+    latencies = [None]*len(corpus)
+    for _ in range(repeat):
+        for i, query in enumerate(corpus):
+            started = time.perf_counter()
+            mapping(query)
+            elapsed = time.perf_counter()-started
+            latencies[i] = elapsed if latencies[i] is None else min(latencies[i], elapsed)
+    return latencies
+
+def length_group(length):
+    for bound in MAPPING_LENGTHS:
+        if length<=bound:
+            return f"<={bound}"
+    return f">{MAPPING_LENGTHS[-1]}"
+
+def latency_groups(corpus, latencies):
+    groups = {}
+    for query, latency in zip(corpus, latencies):
+        groups.setdefault(length_group(len(query)), []).append(latency)
+    results = {}
+    # shortest group first
+    order = [f"<={bound}" for bound in MAPPING_LENGTHS]+[f">{MAPPING_LENGTHS[-1]}"]
+    for group, values in sorted(groups.items(), key=lambda item: order.index(item[0])):
+        values.sort()
+        results[group] = {
+            "queries": len(values),
+            "mean_us": sum(values)/len(values)*1e6,
+            "p50_us": values[len(values)//2]*1e6,
+            "p99_us": values[min(len(values)-1, len(values)*99//100)]*1e6,
+        }
+    return results
+
+def bench_mapping(args):
+    corpus = mapping_corpus(args.queries, args.seed)
+    print(f"corpus: {len(corpus)} queries, {sum(len(q) for q in corpus)/len(corpus):.0f} chars on average")
+    current = measure(ClauseMapping().main, corpus, args.repeat)
+    print(f"current: {current:.0f} queries/s")
+    results = {
+        "queries_per_second": current,
+        "latency_by_length": latency_groups(corpus, mapping_latencies(ClauseMapping().main, corpus, args.repeat)),
+    }
+    for group, latency in results["latency_by_length"].items():
+        print(f"  {group} chars: {latency['queries']} queries, mean {latency['mean_us']:.1f}us, p99 {latency['p99_us']:.1f}us")
+    if args.baseline:
+        baseline_module = load_module_at(args.baseline, "clause_map.py", "baseline_clause_map")
+        baseline = measure(baseline_module.ClauseMapping().main, corpus, args.repeat)
+        print(f"baseline ({args.baseline}): {baseline:.0f} queries/s")
+        print(f"speedup: {current/baseline:.2f}x")
+        results["baseline"] = {"revision": args.baseline, "queries_per_second": baseline}
+    return results
+
+def bench_compare(args):
+    silence_main()
+    rng = random.Random(args.seed)
+    query = ["SELECT c0 FROM t", "SELECT c0 FROM t"]
+    results = {}
+    for size in COMPARE_SIZES:
+        if size>args.max_rows:
+            break
+        rows = synthetic_rows(size, rng)
+        # same multiset in another order, the common agreeing case
+        shuffled = rows[:]
+        rng.shuffle(shuffled)
+        # huge sets are timed once, they take seconds each
+        repeat = args.repeat if size<=100000 else 1
+        elapsed = best_time(lambda: main.result_analysis(query, StubStream(rows), StubStream(shuffled)), repeat)
+        results[str(size)] = {"seconds": elapsed, "rows_per_second": 2*size/elapsed}
+        print(f"result_analysis {size} rows: {elapsed*1e3:.2f}ms ({2*size/elapsed:.0f} rows/s)")
+    return results
+
+def bench_loop(args):
+    silence_main()
+    main.EVAL_CONFIG_SEED_ROWS = 0
+    main.EVAL_CONFIG_ROUND_QUERIES = args.queries
+    if args.backend=="sqlite":
+        # real statements, in-process: the same database work on both sides
+        main.EVAL_CONFIG_BACKENDS = ("sqlite", "sqlite")
+        questdb_api, postgres_api = main.connect_backends(main.EVAL_CONFIG_POOL_SIZE)
+    else:
+        questdb_api = StubConnector(args.latency)
+        postgres_api = StubConnector(args.latency)
+    query_generator = QueryGenerator(clauses_identifying(None, None), True, seed=args.seed, dialects=main.EVAL_CONFIG_BACKENDS)
+    executor = main.ThreadPoolExecutor(max_workers=1, thread_name_prefix="questdb") if main.EVAL_CONFIG_CONCURRENT_EXECUTION else None
+    no_report = lambda *_: None
+    started = time.perf_counter()
+    main.run_testing(questdb_api, postgres_api, query_generator, executor, no_report, max_rounds=1, show_progress=False)
+    elapsed = time.perf_counter()-started
+    if executor is not None:
+        executor.shutdown()
+    snapshot = main.metrics.snapshot()
+    results = {
+        "backend": args.backend,
+        "latency": args.latency,
+        "pairs_per_second": args.queries/elapsed,
+        "stage_mean_us": {
+            stage: histogram["sum"]/histogram["count"]*1e6
+            for stage, histogram in snapshot["stages"].items() if histogram["count"]>0
+        },
+    }
+    print(f"loop ({args.backend}, {args.latency*1e3:.1f}ms per stub statement): {results['pairs_per_second']:.0f} pairs/s")
+    for stage, mean in results["stage_mean_us"].items():
+        print(f"  {stage}: {mean:.1f}us")
+    return results
+
+BENCHMARKS = {
+    "generator": bench_generator,
+    "mapping": bench_mapping,
+    "compare": bench_compare,
+    "loop": bench_loop,
+}
+
+def flatten(results, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}, numeric leaves only
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def print_against(results, path):
+    with open(path) as f:
+        previous = json.load(f)
+    print(f"against {path} ({previous.get('revision')}):")
+    current = flatten(results)
+    for key, value in flatten(previous["results"]).items():
+        if key in current and value:
+            print(f"  {key}: {current[key]/value:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offline benchmarks")
+    parser.add_argument("benchmark", choices=list(BENCHMARKS)+["all"])
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=None, help="git revision to compare the mapping against")
+    parser.add_argument("--backend", choices=["stub", "sqlite"], default="stub", help="connectors of the loop benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every stub statement takes")
+    parser.add_argument("--max-rows", type=int, default=COMPARE_SIZES[-1], help="largest compared result set")
+    parser.add_argument("--output", default="./benchmark.json")
+    parser.add_argument("--against", default=None, help="previous results file to compare with")
+    args = parser.parse_args()
+    names = list(BENCHMARKS) if args.benchmark=="all" else [args.benchmark]
+    results = {name: BENCHMARKS[name](args) for name in names}
+    with open(args.output, "w") as f:
+        json.dump({
+            "revision": git_revision(),
+            "time": time.time(),
+            "python": sys.version.split()[0],
+            "arguments": vars(args),
+            "results": results,
+        }, f, indent=1)
+    if args.against:
+        print_against(results, args.against)
@@ -0,0 +1,137 @@
+"""
+deduplication of reported mismatches
+every mismatch is fingerprinted by the clauses its query uses, the query
+skeleton (tables and literals abstracted out) and the shape of the result
+difference; only the first examples of a fingerprint are reported, later
+ones are counted. the index is kept in memory and persisted as JSON
+"""
+
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+
+DEFAULT_INDEX_PATH = "./bug_index.json"
+# reported examples per fingerprint
+DEFAULT_EXAMPLES = 5
+# seconds between two saves of a changed index (and on exit)
+DEFAULT_SAVE_INTERVAL = 10
+
+# clause name (as in clause_identification) -> text of the clause in a generated query
+CLAUSE_MARKERS = [
+    ("UNION", " UNION "), ("EXCEPT", " EXCEPT "), ("INTERSECT", " INTERSECT "),
+    ("CROSS_JOIN", " CROSS JOIN "), ("INNER_JOIN", " INNER JOIN "), ("JOIN", " JOIN "),
+    ("IN", " IN ("), ("BETWEEN", " BETWEEN "), ("CASE", "(CASE WHEN True "),
+    ("OVER_PARTITION", " OVER(PARTITION BY "), ("OVER_PARTITION_ORDER", " ORDER BY "),
+    ("SAMPLE", " SAMPLE BY "), ("CAST", "CAST(T"), ("TABLE_SUBQUERY", "FROM (SELECT "),
+    ("WITH", "WITH "), ("COUNT", " COUNT(T"),
+]
+
+STRING_LITERAL = re.compile(r"'[^']*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+TABLE_NAME = re.compile(r"\b(FROM|JOIN|INTO|UPDATE) (?!\()\w+")
+COLUMN = re.compile(r"\b(?:T\d+\.)?c\d\b")
+COLUMN_CAST = re.compile(r"CAST\(c AS (\w+)(?:\(\d+\))?\)")
+LITERAL_LIST = re.compile(r"\?(?:,\?)+")
+SELECT_DATA = re.compile(r"SELECT (.*?) FROM ")
+OPERAND = r"(?:NOW\(\)|[\w.?:]+)"
+PREDICATE = re.compile(rf"{OPERAND} (?:NOT )?(?:IN \([^)]*\)|BETWEEN (?:SYMMETRIC )?{OPERAND} AND {OPERAND})")
+
+def query_clauses(query):
+    return [name for name, marker in CLAUSE_MARKERS if marker in query]
+
+def abstract_query(query):
+    query = STRING_LITERAL.sub("?", query)
+    query = NUMBER_LITERAL.sub("?", query)
+    query = TABLE_NAME.sub(r"\1 t", query)
+    # the literals already tell the column types apart
+    query = COLUMN.sub("c", query)
+    query = COLUMN_CAST.sub(r"c::\1", query)
+    # IN (0,1,2,NULL) and IN (0,NULL) behave alike
+    return LITERAL_LIST.sub("?", query)
+
+def query_skeleton(query):
+    """
+    the distinct selected expressions and predicates of the query, with
+    tables, columns and literals abstracted out; the nesting of set
+    operations and joins is only represented by the clause set, so that
+    the same faulty predicate in differently composed queries matches
+    """
+    query = abstract_query(query)
+    data = sorted(set(SELECT_DATA.findall(query)))
+    predicates = sorted(set(PREDICATE.findall(query)))
+    return f"{' | '.join(data)} WHERE {' AND '.join(predicates)}"
+
+def difference_shape(comparison):
+    # how the results differ, not by how much
+    rows = comparison.rows
+    relation = "=" if rows[0]==rows[1] else ("<" if rows[0]<rows[1] else ">")
+    empty = "".join(side for side, count in zip("qp", rows) if count==0)
+    return f"rows{relation}{'' if empty=='' else ' empty:'+empty}"
+
+def bug_fingerprint(query, comparison):
+    """
+    returns (fingerprint, details) of a mismatching pair, the questdb
+    query is the one the clauses and skeleton are taken from
+    """
+    details = {
+        "clauses": query_clauses(query[0]),
+        "skeleton": query_skeleton(query[0]),
+        "difference": difference_shape(comparison),
+    }
+    key = f"{','.join(details['clauses'])}|{details['skeleton']}|{details['difference']}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest(), details
+
+class BugIndex:
+    def __init__(self, path=DEFAULT_INDEX_PATH, examples=DEFAULT_EXAMPLES, save_interval=DEFAULT_SAVE_INTERVAL):
+        self.path = path
+        self.examples = examples
+        self.save_interval = save_interval
+        self.saved_at = time.monotonic()
+        self.lock = threading.Lock()
+        # fingerprint -> {"count", "clauses", "skeleton", "difference", "examples"}
+        self.entries = {}
+        self.changed = False
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        atexit.register(self.save)
+
+    def record(self, fingerprint, details, example, report=None):
+        # returns whether the example is new enough to be reported
+        # (report, the bug.log record, is only needed by forwarding indexes)
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                entry = dict(details, count=0, examples=[])
+                self.entries[fingerprint] = entry
+            entry["count"] += 1
+            keep = len(entry["examples"])<self.examples
+            if keep:
+                entry["examples"].append(list(example))
+            self.changed = True
+            save = time.monotonic()-self.saved_at>=self.save_interval
+        if save:
+            self.save()
+        return keep
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            if not self.changed:
+                return
+            # written next to the index and renamed, a crash never leaves half a file
+            with open(self.path+".tmp", "w") as f:
+                json.dump(self.entries, f)
+            os.replace(self.path+".tmp", self.path)
+            self.changed = False
+            self.saved_at = time.monotonic()
+
+    def summary(self):
+        # [(count, fingerprint, details)], most frequent first
+        with self.lock:
+            return sorted(((entry["count"], fingerprint, entry) for fingerprint, entry in self.entries.items()), reverse=True)
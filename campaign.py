@@ -0,0 +1,140 @@
+"""
+multi-process fuzzing campaign
+every worker owns a seed, a table-name prefix and its own connectors,
+the coordinator (this process) is the only writer of the log files
+"""
+
+import os
+import time
+import random
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import main
+from driver import *
+from metrics import Metrics
+from scheduler import Scheduler
+from clause_identification import clauses_identifying
+from query_generation import QueryGenerator
+
+CAMPAIGN_WORKERS = os.cpu_count() or 1
+# seconds between two merged statistic prints
+CAMPAIGN_REPORT_INTERVAL = 10
+
+class ForwardingBugIndex:
+    # mismatches are deduplicated by the coordinator, which reports them
+    def __init__(self, worker_id, channel):
+        self.worker_id = worker_id
+        self.channel = channel
+
+    def record(self, fingerprint, details, example, report=None):
+        self.channel.put(("bug", self.worker_id, (fingerprint, details, example, report)))
+        return False
+
+class ForwardingRecordStore:
+    # the coordinator is the only writer of the record store
+    def __init__(self, worker_id, channel):
+        self.worker_id = worker_id
+        self.channel = channel
+
+    def append(self, query, testing_round=None, outcome=None):
+        self.channel.put(("record", self.worker_id, (list(query), testing_round, outcome)))
+
+    def flush(self):
+        pass
+
+def worker(worker_id, seed, channel, max_rounds):
+    # each record is one message, so records of workers never interleave
+    main.set_log_sink(lambda path, logstr: channel.put(("log", worker_id, (path, logstr))))
+    main.set_bug_index(ForwardingBugIndex(worker_id, channel))
+    if main.record_store is not None:
+        main.set_record_store(ForwardingRecordStore(worker_id, channel))
+    # metrics files are per worker, a scraper merges them by the worker label
+    main.set_metrics(Metrics(f"{main.EVAL_CONFIG_METRICS}_w{worker_id}", {"worker": str(worker_id)}, main.EVAL_CONFIG_METRICS_INTERVAL))
+    questdb_api, postgres_api = main.connect_backends(main.EVAL_CONFIG_POOL_SIZE)
+    shared_clauses = clauses_identifying(questdb_api, postgres_api)
+    scheduler = None
+    if main.EVAL_CONFIG_SCHEDULER:
+        # one weights file per worker, a campaign with as many workers resumes them
+        weights_path, extension = os.path.splitext(main.EVAL_CONFIG_SCHEDULER_WEIGHTS)
+        scheduler = Scheduler(f"{weights_path}_w{worker_id}{extension}")
+    query_generator = QueryGenerator(shared_clauses, main.EVAL_CONFIG_CLAUSE_MAPPING, table_prefix=f"{main.EVAL_CONFIG_TABLE_PREFIX}w{worker_id}_", seed=seed,
+                                     dialects=main.EVAL_CONFIG_BACKENDS, scheduler=scheduler)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="questdb") if main.EVAL_CONFIG_CONCURRENT_EXECUTION else None
+    # statistics are sent as deltas against the previous report
+    last = {"round": 0, "executed": 0, "questdb": 0, "postgres": 0}
+    def report_stats(questdb_api, postgres_api, testing_round, executed, questdb_success_query_count, postgres_success_query_count):
+        if testing_round!=last["round"]:
+            last.update(round=testing_round, executed=0, questdb=0, postgres=0)
+        channel.put(("stats", worker_id, (
+            executed-last["executed"],
+            questdb_success_query_count-last["questdb"],
+            postgres_success_query_count-last["postgres"],
+        )))
+        last.update(executed=executed, questdb=questdb_success_query_count, postgres=postgres_success_query_count)
+    try:
+        main.run_testing(questdb_api, postgres_api, query_generator, executor, report_stats, max_rounds, show_progress=False)
+    finally:
+        channel.put(("done", worker_id, None))
+
+def print_campaign_stats(stats, started):
+    executed = sum(each[0] for each in stats.values())
+    if executed==0:
+        return
+    questdb_success = sum(each[1] for each in stats.values())
+    postgres_success = sum(each[2] for each in stats.values())
+    elapsed = time.monotonic()-started
+    print(f"workers:{len(stats)} queries:{executed} ({executed/elapsed:.1f}/s)")
+    print(f"questdb query success rate:{float(questdb_success/executed)}")
+    print(f"postgres query success rate:{float(postgres_success/executed)}")
+
+def run_campaign(workers=CAMPAIGN_WORKERS, base_seed=None, max_rounds=None):
+    main.rotate_logs()
+    if base_seed is None:
+        base_seed = random.randrange(2**32)
+    print(f"campaign seed {base_seed} with {workers} workers")
+    channel = multiprocessing.Queue()
+    processes = []
+    for worker_id in range(workers):
+        process = multiprocessing.Process(
+            target=worker, args=(worker_id, base_seed+worker_id, channel, max_rounds), daemon=True)
+        process.start()
+        processes.append(process)
+    stats = {worker_id: [0, 0, 0] for worker_id in range(workers)}
+    running = workers
+    started = time.monotonic()
+    last_report = started
+    try:
+        while running>0:
+            kind, worker_id, payload = channel.get()
+            if kind=="log":
+                main.log_writer.write(*payload)
+            elif kind=="record":
+                main.record_store.append(*payload, worker=worker_id)
+            elif kind=="bug":
+                if main.bug_index.record(*payload):
+                    main.bug_log(payload[3])
+            elif kind=="stats":
+                for i in range(3):
+                    stats[worker_id][i] += payload[i]
+            elif kind=="done":
+                running -= 1
+            if time.monotonic()-last_report>=CAMPAIGN_REPORT_INTERVAL:
+                print_campaign_stats(stats, started)
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    print_campaign_stats(stats, started)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="run a multi-process fuzzing campaign")
+    parser.add_argument("--workers", type=int, default=CAMPAIGN_WORKERS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rounds", type=int, default=None, help="testing rounds per worker (default: unlimited)")
+    args = parser.parse_args()
+    run_campaign(args.workers, args.seed, args.rounds)
@@ -1,4 +1,3 @@
-import re
 from random import choice
 
 # map structure: {syntax_in_questdb: syntax_in_postgres}
@@ -12,108 +11,117 @@ def valid_expression():
     ]
     return choice(valid_expressions)
 
-class ClauseMapping:
-
-    def __init__(self):
-        pass
-
-    def extract_in_operations(self, query):
-        in_operations = []
-        # assume no continous spaces in the query
-        query_splits = query.split(' ')
-        for i in range(len(query_splits)):
-            if query_splits[i]=="IN":
-                in_operations.append(
-                    f"{query_splits[i-1]} IN {query_splits[i+1]}"
-                ) if query_splits[i-1]!="NOT" else in_operations.append(
-                    f"{query_splits[i-2]} NOT IN {query_splits[i+1]}"
-                )
-        return in_operations
-
-    def _clause_mapping_in_mutation(self, query):
-        # this mapping aims to bridge the semantic gap in questdb
-        # NULL in questdb is a specific value
+# per-dialect mapping profiles
+# each clause mapping is a compiled rule: matched clause parts -> mapped text
+MAPPING_PROFILES = {
+    "questdb": {
+        "types": {"STRING": "SYMBOL"},
+        # NULL in questdb is a specific value,
         # we need to nullify results when necessary, which aligns with postgres
+        "in": lambda target, in_not, in_list, clause:
+            f"CASE WHEN {target} IS NULL THEN NULL::BOOLEAN ELSE {clause} END",
+        "between": lambda a, between_not, b, c, clause:
+            f"CASE WHEN {a} IS NULL THEN NULL::BOOLEAN WHEN {b} IS NULL THEN NULL::BOOLEAN WHEN {c} IS NULL THEN NULL::BOOLEAN ELSE {clause} END",
+        "sample_by": False,
+        "designated_timestamp": True,
+        "now": "NOW()",
+        "compound": lambda left, operator, right: f"({left}) {operator} ({right})",
+        # placeholder of the i-th (1-based) parameter of a prepared statement
+        "param": "${}".format,
+    },
+    "postgres": {
+        "types": {"STRING": "VARCHAR(64)"},
+        "in": lambda target, in_not, in_list, clause:
+            f"CASE WHEN {target} IS NULL THEN NULL ELSE {clause.replace(',NULL','').replace('(NULL)','()')} END",
+        "between": lambda a, between_not, b, c, clause:
+            f"{a} {between_not}BETWEEN SYMMETRIC {b} AND {c}",
+        # SAMPLE BY is mapped back to valid clauses in postgres
+        "sample_by": True,
+        "day": lambda column: f"EXTRACT(DAY FROM {column})",
+        "designated_timestamp": False,
+        "now": "NOW()",
+        "compound": lambda left, operator, right: f"({left}) {operator} ({right})",
+        "param": "${}".format,
+    },
+    "sqlite": {
+        # a declared STRING or TIMESTAMP would have numeric affinity,
+        # timestamps are stored as text
+        "types": {"STRING": "TEXT", "TIMESTAMP": "TEXT"},
+        # sqlite follows the NULL semantics of postgres
+        "in": lambda target, in_not, in_list, clause:
+            f"CASE WHEN {target} IS NULL THEN NULL ELSE {clause.replace(',NULL','').replace('(NULL)','()')} END",
+        # no BETWEEN SYMMETRIC, the multi-argument min/max are NULL on a NULL bound
+        "between": lambda a, between_not, b, c, clause:
+            f"{a} {between_not}BETWEEN MIN({b},{c}) AND MAX({b},{c})",
+        "sample_by": True,
+        # YYYY-MM-DD..., in both timestamp text formats
+        "day": lambda column: f"CAST(substr({column},9,2) AS INTEGER)",
+        "designated_timestamp": False,
+        "now": "strftime('%Y-%m-%d %H:%M:%f','now')",
+        # operands of a compound select cannot be parenthesized
+        "compound": lambda left, operator, right: f"SELECT * FROM ({left}) {operator} SELECT * FROM ({right})",
+        "param": lambda i: "?",
+    },
+}
+
+# rule table: keyword token -> (rule, number of tokens after the keyword)
+# the mapped clause spans the operand before the keyword (and an optional NOT)
+MAPPING_RULES = {
+    "IN": ("in", 1),            # A [NOT] IN (...)
+    "BETWEEN": ("between", 3),  # A [NOT] BETWEEN B AND C
+}
+
+def operation_start(operation):
+    return operation[1]
 
-        # query[0] -> questdb query
-
-        # for questdb
-        in_operations = self.extract_in_operations(query[0])
-        for each_in_operation in in_operations:
-            in_target = each_in_operation.split(' ')[0]
-            in_list = each_in_operation.split(' ')[-1]
-            if "'" not in in_list:
-                in_list = in_list.replace('0',"'0'").replace('1',"'1'").replace('2',"'2'")
-            query[0] = query[0].replace(
-                each_in_operation,
-                f"CASE WHEN {in_target} IS NULL THEN NULL::BOOLEAN ELSE {each_in_operation} END"
-                )
-
-        # for postgres
-        in_operations = self.extract_in_operations(query[1])
-        for each_in_operation in in_operations:
-            in_target = each_in_operation.split(' ')[0]
-            in_list = each_in_operation.split(' ')[-1]
-            if "'" not in in_list:
-                in_list = in_list.replace('0',"'0'").replace('1',"'1'").replace('2',"'2'")
-            new_in_operation = each_in_operation.replace(',NULL','').replace('(NULL)','()')
-            query[1] = query[1].replace(
-                each_in_operation,
-                f"CASE WHEN {in_target} IS NULL THEN NULL ELSE {new_in_operation} END"
-                )
-
-        return query
-
-    def extract_between_operations(self, query):
-        between_operations = []
-        # assume no continous spaces in the query
-        query_splits = query.split(' ')
-        for i in range(len(query_splits)):
-            if query_splits[i]=="BETWEEN":
-                between_operations.append(
-                    f"{query_splits[i-1]} BETWEEN {query_splits[i+1]} {query_splits[i+2]} {query_splits[i+3]}"
-                ) if query_splits[i-1]!="NOT" else between_operations.append(
-                    f"{query_splits[i-2]} NOT BETWEEN {query_splits[i+1]} {query_splits[i+2]} {query_splits[i+3]}"
-                )
-        return between_operations
-
-    def _clause_mapping_between_mutation(self, query):
-        # this mapping aims to bridge the semantic gap in questdb
-        # NULL in questdb is a specific value
-        # we need to nullify results when necessary, which aligns with postgres
-
-        # query[0] -> questdb query
-
-        between_operations = self.extract_between_operations(query[0])
-        for each_between_operation in between_operations:
-            between_keyword = "NOT BETWEEN" if "NOT BETWEEN" in each_between_operation else "BETWEEN"
-            # A BETWEEN B AND C
-            A = each_between_operation.split(f' {between_keyword}')[0]
-            B = each_between_operation.split(f'{between_keyword} ')[1].split(' AND')[0]
-            C = each_between_operation.split('AND ')[1]
-            query[0] = query[0].replace(
-                each_between_operation,
-                f"CASE WHEN {A} IS NULL THEN NULL::BOOLEAN WHEN {B} IS NULL THEN NULL::BOOLEAN WHEN {C} IS NULL THEN NULL::BOOLEAN ELSE {each_between_operation} END"
-                )
-        return query
-
-    def _clause_mapping_string_type(self, query):
-        questdb_map = {"STRING": "SYMBOL"}
-        postgres_map = {"STRING": "VARCHAR(64)"}
-        query[0] = query[0].replace("STRING", questdb_map["STRING"])
-        query[1] = query[1].replace("STRING", postgres_map["STRING"])
-        return query
+class ClauseMapping:
+    """
+    all clause mappings are compiled into one rule table (MAPPING_RULES),
+    the mapped clauses of a query are located once and every dialect
+    output is built from the same clause list
+    """
 
-    def _clause_mapping_between_symmetric(self, query):
-        query[1] = query[1].replace(" BETWEEN ", " BETWEEN SYMMETRIC ")
-        return query
+    def __init__(self, dialects=("questdb", "postgres")):
+        self.dialects = list(dialects)
+        self.profiles = [MAPPING_PROFILES[dialect] for dialect in self.dialects]
 
-    def _clause_mapping_count_distinct(self, query):
-        # Note: the syntax here is not complete for easier match
-        query[1] = query[1].replace(" COUNT_DISTINCT(", " COUNT(DISTINCT")
-        return query
-
-    def _clause_mapping_sample_by(self, query):
+    def extract_operations(self, query):
+        """
+        locates every clause of the rule table in the formatted query,
+        tokens are only split around the matched keywords
+        returns [(rule, start offset, end offset, clause parts)]
+        """
+        operations = []
+        for keyword, (rule, after) in MAPPING_RULES.items():
+            needle = f" {keyword} "
+            pos = query.find(needle)
+            while pos!=-1:
+                # the operand (and an optional NOT) before the keyword
+                start = query.rfind(' ', 0, pos)+1
+                negated = query[start:pos]=="NOT"
+                if negated:
+                    operand_end = start-1
+                    start = query.rfind(' ', 0, operand_end)+1
+                else:
+                    operand_end = pos
+                # the tokens after the keyword, B AND C is split into B and C
+                parts = [query[start:operand_end], "NOT " if negated else ""]
+                end = pos+len(needle)-1
+                for i in range(after):
+                    token_start = end+1
+                    end = query.find(' ', token_start)
+                    if end==-1:
+                        end = len(query)
+                    if i%2==0:
+                        parts.append(query[token_start:end])
+                if start<operand_end and parts[-1]!="":
+                    operations.append((rule, start, end, parts))
+                pos = query.find(needle, pos+1)
+        if len(operations)>1:
+            operations.sort(key=operation_start)
+        return operations
+
+    def _clause_mapping_sample_by(self, query, profile):
         """
         a bit complex to map SAMPLE BY: (e.g., SAMPLE BY 1d)
         1. add one new column to extract day: EXTRACT(DAY FROM c2) AS d
@@ -125,7 +133,7 @@ class ClauseMapping:
         # this is just an demo implementation
         # ASSUMPTION: only fetct COUNT(*), use SAMPLE BY 1d
         # step 1 and step 3:
-        col = 'COUNT(*) AS sample_by_result, EXTRACT(DAY FROM T1.c2) AS d'
+        col = f"COUNT(*) AS sample_by_result, {profile['day']('T1.c2')} AS d"
         query = query.replace('COUNT(*)', col)
         # step 2:
         query = query.replace('SAMPLE BY 1d', 'GROUP BY d')
@@ -136,32 +144,41 @@ class ClauseMapping:
     def main(self, query):
 
         # format queries before mapping
-        mapped_query = [self.formatting_query(query), self.formatting_query(query)]
-
-        # mapping IN clause
-        mapped_query = self._clause_mapping_in_mutation(mapped_query)
-
-        # mapping STRING type
-        mapped_query = self._clause_mapping_string_type(mapped_query)
-
-        # mapping BETWEEN clause
-        mapped_query = self._clause_mapping_between_symmetric(mapped_query)
-
-        # mapping SAMPLE BY clause
-        if "SAMPLE BY" in mapped_query[0]:
-            # when SAMPLE BY is used in questdb query
-            # we map SAMPLE BY back to valid clauses in postgres
-            mapped_query[1] = self._clause_mapping_sample_by(mapped_query[1])
-
-        # map NULL with between:
-        mapped_query = self._clause_mapping_between_mutation(mapped_query)
-
+        query = self.formatting_query(query)
+
+        # mapping IN and BETWEEN clauses
+        operations = self.extract_operations(query)
+        sample_by = "SAMPLE BY" in query
+
+        mapped_query = []
+        for profile in self.profiles:
+            mapped = []
+            last = 0
+            for rule, start, end, parts in operations:
+                if start<last:
+                    # overlapping clauses are only mapped once
+                    continue
+                mapped.append(query[last:start])
+                mapped.append(profile[rule](*parts, query[start:end]))
+                last = end
+            mapped.append(query[last:])
+            mapped = ''.join(mapped)
+            # mapping STRING type
+            for source, target in profile["types"].items():
+                mapped = mapped.replace(source, target)
+            if profile["now"]!="NOW()":
+                mapped = mapped.replace("NOW()", profile["now"])
+            # mapping SAMPLE BY clause
+            if sample_by and profile["sample_by"]:
+                mapped = self._clause_mapping_sample_by(mapped, profile)
+            mapped_query.append(mapped)
         return mapped_query
 
     def formatting_query(self, query):
         # we format the query for easier mapping:
         # 1. no continuous spaces
-        query = re.sub('[ ]+', ' ', query)
+        while "  " in query:
+            query = query.replace("  ", " ")
         # 2. no space between commas
-        query = re.sub(', ', ',', query)
-        return query
\ No newline at end of file
+        query = query.replace(', ', ',')
+        return query
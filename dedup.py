@@ -0,0 +1,130 @@
+"""
+duplicate-query elimination before execution
+a SELECT pair is a repeat when the same mapped pair already ran against
+the same contents of the tables it reads; contents are tracked as one
+version per table, bumped by every statement writing to it. seen keys
+are kept in a scalable Bloom filter, so memory stays bounded and a
+repeat is never missed, while a new pair is skipped with (at most) the
+error rate of the filter
+"""
+
+import re
+import math
+import hashlib
+
+DEFAULT_CAPACITY = 100000
+DEFAULT_ERROR_RATE = 0.001
+# keys remembered at most, the filter starts over beyond that
+DEFAULT_MAX_KEYS = 2000000
+
+# generated statements are rendered with single spaces, WITH clauses use "from"
+READ_TABLE = re.compile(r"(?:FROM|from|JOIN) (\w+)")
+WRITE_TABLE = re.compile(r"^\s*(?:INSERT\s+INTO|UPDATE|CREATE\s+TABLE|DROP\s+TABLE(?:\s+IF\s+EXISTS)?)\s+(\w+)", re.IGNORECASE)
+
+def statement_tables(text):
+    # (tables read, table written or None) of a generated statement
+    write = WRITE_TABLE.match(text)
+    return set(READ_TABLE.findall(text)), None if write is None else write.group(1)
+
+class BloomFilter:
+    """
+    fixed-capacity Bloom filter, the bit positions of a key are derived
+    from one 128-bit digest by double hashing
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, int(-capacity*math.log(error_rate)/math.log(2)**2))
+        self.hashes = max(1, round(self.bits/capacity*math.log(2)))
+        self.array = bytearray((self.bits+7)//8)
+        self.count = 0
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1+i*h2)%self.bits for i in range(self.hashes)]
+
+    def __contains__(self, digest):
+        array = self.array
+        return all(array[position>>3]&(1<<(position&7)) for position in self._positions(digest))
+
+    def add(self, digest):
+        array = self.array
+        for position in self._positions(digest):
+            array[position>>3] |= 1<<(position&7)
+        self.count += 1
+
+class ScalableBloomFilter:
+    """
+    a chain of Bloom filters (Almeida et al.), a full filter is followed by
+    a twice as large one with a tighter error rate, so that the overall
+    error rate stays below error_rate however many keys are added
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, max_keys=DEFAULT_MAX_KEYS):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_keys = max_keys
+        self.reset()
+
+    def reset(self):
+        self.filters = [BloomFilter(self.capacity, self.error_rate/2)]
+        self.count = 0
+
+    def __contains__(self, digest):
+        return any(digest in each for each in self.filters)
+
+    def add(self, digest):
+        if self.count>=self.max_keys:
+            self.reset()
+        last = self.filters[-1]
+        if last.count>=last.capacity:
+            last = BloomFilter(last.capacity*2, self.error_rate/2**(len(self.filters)+1))
+            self.filters.append(last)
+        last.add(digest)
+        self.count += 1
+
+    def size(self):
+        # bytes of all bit arrays
+        return sum(len(each.array) for each in self.filters)
+
+class SeenQueries:
+    """
+    check returns whether a pair is a repeated SELECT, writes never are:
+    they bump the version of their table, which makes every SELECT
+    reading it new again
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, max_keys=DEFAULT_MAX_KEYS):
+        self.seen = ScalableBloomFilter(capacity, error_rate, max_keys)
+        # table -> number of writes to it
+        self.versions = {}
+        self.selects = 0
+        self.duplicates = 0
+
+    def reset(self):
+        # e.g., a new round created new tables, no earlier key can match
+        self.seen.reset()
+        self.versions = {}
+
+    def check(self, query):
+        write = WRITE_TABLE.match(query[0])
+        if write is not None:
+            table = write.group(1)
+            self.versions[table] = self.versions.get(table, 0)+1
+            return False
+        if "SELECT " not in query[0]:
+            return False
+        self.selects += 1
+        tables = sorted(set(READ_TABLE.findall(query[0])))
+        versions = ','.join(f"{table}:{self.versions.get(table, 0)}" for table in tables)
+        # rendering is deterministic, the same statement is the same text
+        digest = hashlib.blake2b(f"{versions}\0{query[0]}\0{query[1]}".encode(), digest_size=16).digest()
+        if digest in self.seen:
+            self.duplicates += 1
+            return True
+        self.seen.add(digest)
+        return False
+
+    def duplicate_rate(self):
+        return self.duplicates/self.selects if self.selects>0 else 0.0
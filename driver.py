@@ -1,40 +1,699 @@
+import re
+import time
+import queue
+import socket
+import sqlite3
+import datetime
+import threading
+import itertools
+import contextlib
+import collections
 import psycopg2
 
+DEFAULT_POOL_SIZE = 2
+# idle connections older than this (seconds) are pinged before reuse
+DEFAULT_PING_INTERVAL = 30
+# server-side prepared statements kept per connection, least recently used are deallocated
+DEFAULT_STATEMENT_CACHE = 128
+# errors of the connection itself (server gone, connection closed), as
+# opposed to errors of a statement
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# SQLSTATE of an EXECUTE naming a prepared statement the session does not have
+MISSING_STATEMENT = "26000"
+# how often (seconds) the watchdog looks for statements past their deadline
+DEFAULT_WATCHDOG_INTERVAL = 0.05
+
+class StatementTimeout(Exception):
+    # the statement ran past its budget and was cancelled by the watchdog
+    pass
+
+class StatementBudget:
+    """
+    the time one statement may run, spent across its calls (execute and
+    the fetches of its stream); timeout None only measures the statement
+    elapsed: seconds spent on the connection, timed_out: it was cancelled,
+    cached: a cached result answered it, no statement ran
+    """
+    __slots__ = ("timeout", "elapsed", "timed_out", "cached")
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.elapsed = 0.0
+        self.timed_out = False
+        self.cached = False
+
+class Watchdog:
+    """
+    cancels statements running past their budget from a background thread:
+    PG-wire cancel requests (connection.cancel) for psycopg2 connections,
+    interrupt for sqlite; a statement is only watched while one of its calls
+    runs, a stream waiting for the comparison does not spend its budget
+    """
+
+    def __init__(self, interval=DEFAULT_WATCHDOG_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        # key -> (deadline, budget, cancel)
+        self.watched = {}
+        self.keys = itertools.count()
+        self.cancelled = 0
+        self.thread = None
+
+    @contextlib.contextmanager
+    def watch(self, budget, cancel):
+        if budget is None:
+            yield
+            return
+        started = time.monotonic()
+        key = None
+        if budget.timeout is not None:
+            key = next(self.keys)
+            with self.lock:
+                self.watched[key] = (started+budget.timeout-budget.elapsed, budget, cancel)
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="statement-watchdog", daemon=True)
+                    self.thread.start()
+        try:
+            yield
+        except Exception as e:
+            if budget.timed_out:
+                raise StatementTimeout(f"cancelled after {budget.timeout:.3f}s") from e
+            raise
+        finally:
+            if key is not None:
+                with self.lock:
+                    del self.watched[key]
+            budget.elapsed += time.monotonic()-started
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            # cancelled under the lock: a watched call cannot finish and hand
+            # its connection to another statement meanwhile
+            with self.lock:
+                for deadline, budget, cancel in self.watched.values():
+                    if deadline>now or budget.timed_out:
+                        continue
+                    budget.timed_out = True
+                    self.cancelled += 1
+                    try:
+                        cancel()
+                    except Exception:
+                        pass
+
+# one watchdog thread per process, started with the first watched statement
+watchdog = Watchdog()
+
+class CachingConnection(psycopg2.extensions.connection):
+    # a psycopg2 connection that remembers its prepared statements
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # template -> statement name, least recently used first
+        self.statements = collections.OrderedDict()
+        self.statement_ids = itertools.count()
+
+class ConnectionPool:
+    """
+    long-lived connections shared by the connectors
+    connections are health-checked before use and replaced when broken,
+    so a statement only pays a handshake when there is no healthy idle one
+    """
+
+    def __init__(self, connect, size=DEFAULT_POOL_SIZE, ping_interval=DEFAULT_PING_INTERVAL, setup=None):
+        self.connect = connect
+        self.size = size
+        self.ping_interval = ping_interval
+        self.setup = setup
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.handshakes = 0
+        self.handshakes_avoided = 0
+        self.reconnects = 0
+
+    def _open(self):
+        conn = self.connect()
+        if self.setup is not None:
+            self.setup(conn)
+        with self.lock:
+            self.handshakes += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.opened -= 1
+
+    def _is_broken(self, conn):
+        return conn.closed != 0 or \
+            conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+
+    def _is_healthy(self, conn, idle_since):
+        if self._is_broken(conn):
+            return False
+        # cheap local checks are enough for recently used connections
+        if time.monotonic()-idle_since < self.ping_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            cur.close()
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        while True:
+            try:
+                conn, idle_since = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(conn, idle_since):
+                with self.lock:
+                    self.handshakes_avoided += 1
+                return conn
+            self._discard(conn)
+            with self.lock:
+                self.reconnects += 1
+        with self.lock:
+            can_open = self.opened < self.size
+            if can_open:
+                self.opened += 1
+        if not can_open:
+            # pool exhausted: wait for another user to hand one back
+            conn, idle_since = self.idle.get()
+            if self._is_healthy(conn, idle_since):
+                with self.lock:
+                    self.handshakes_avoided += 1
+                return conn
+            self._discard(conn)
+            with self.lock:
+                self.reconnects += 1
+                self.opened += 1
+        try:
+            return self._open()
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    def release(self, conn):
+        if self._is_broken(conn):
+            self._discard(conn)
+            return
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+            # the failed statement aborted the transaction, reset it
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+        self.idle.put((conn, time.monotonic()))
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def prune(self):
+        # drop idle connections that are no longer usable
+        alive = []
+        while True:
+            try:
+                conn, idle_since = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_broken(conn):
+                self._discard(conn)
+                with self.lock:
+                    self.reconnects += 1
+            else:
+                alive.append((conn, idle_since))
+        for each in alive:
+            self.idle.put(each)
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "handshakes": self.handshakes,
+                "handshakes_avoided": self.handshakes_avoided,
+                "reconnects": self.reconnects,
+            }
+
+class ResultStream:
+    """
+    an executed query whose rows are fetched on demand in chunks
+    the connection goes back to the pool once the stream is closed
+    """
+
+    def __init__(self, pool, conn, cur, end_transaction=False, budget=None):
+        self.pool = pool
+        self.conn = conn
+        self.cur = cur
+        self.end_transaction = end_transaction
+        self.budget = budget
+
+    def fetchmany(self, size):
+        with watchdog.watch(self.budget, self.conn.cancel):
+            return self.cur.fetchmany(size)
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.cur.close()
+            if self.end_transaction:
+                # do not keep the read transaction (and its locks) open
+                self.conn.rollback()
+        except Exception:
+            pass
+        self.pool.release(self.conn)
+        self.conn = None
+
+def _open_stream(pool, query, cursor_name=None, end_transaction=False, budget=None):
+    conn = pool.acquire()
+    try:
+        cur = conn.cursor(name=cursor_name) if cursor_name else conn.cursor()
+        with watchdog.watch(budget, conn.cancel):
+            cur.execute(query)
+    except Exception:
+        pool.release(conn)
+        raise
+    return ResultStream(pool, conn, cur, end_transaction, budget)
+
+_cursor_ids = itertools.count()
+
 class PostgresConnector:
-    def __init__(self):
-        self.conn = psycopg2.connect(database="postgres", user = "postgres", password = "12344321", host = "127.0.0.1", port = "5432")
+    """
+    connectors share one interface: query, describe, query_stream,
+    write_query, prune and pool.stats(); describe, query_stream and
+    write_query take an optional StatementBudget, watched for timeouts; list_tables,
+    copy_table and truncate_table manage the fuzz tables; dialect names the mapping
+    profile (clause_map.MAPPING_PROFILES) their statements are rendered with
+    seed_methods: the bulk-load methods of seeding.py it supports
+    """
+    dialect = "postgres"
+    seed_methods = ("copy", "prepared", "insert")
+    # execute generated DML (query_ast.Prepared) through PREPARE/EXECUTE
+    prepare = False
+    statement_cache = DEFAULT_STATEMENT_CACHE
+    # writes committed per transaction (1: every write commits); grouped
+    # writes run on one connection, each behind a savepoint, and are
+    # committed before any other statement so that it sees them
+    group_commit = 1
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        connect = lambda: psycopg2.connect(database="postgres", user = "postgres", password = "12344321", host = "127.0.0.1", port = "5432",
+                                           connection_factory=CachingConnection)
+        self.pool = ConnectionPool(connect, pool_size)
+        # the write transaction holds its connection for the whole run, it is
+        # reserved outside the pool so that streams keep all pool_size of them
+        self.writer_pool = ConnectionPool(connect, 1)
+        # the connection of the open write transaction, and its writes
+        self.writer = None
+        self.writer_lock = threading.Lock()
+        self.pending = 0
+        self.commits = 0
+        self.savepoint_rollbacks = 0
+
+    def prune(self):
+        # after a connection error: the idle connections broken with it are
+        # dropped, the pool replaces them on the next use
+        self.pool.prune()
+        self.writer_pool.prune()
 
-    def reconnect(self):
-        self.conn = psycopg2.connect(database="postgres", user = "postgres", password = "12344321", host = "127.0.0.1", port = "5432")
+    def transaction_stats(self):
+        return {"commits": self.commits, "savepoint_rollbacks": self.savepoint_rollbacks}
+
+    def flush(self):
+        # commits the grouped writes
+        if self.pending==0:
+            return
+        with self.writer_lock:
+            if self.pending==0:
+                return
+            try:
+                self.writer.commit()
+                self.commits += 1
+            except Exception:
+                self._drop_writer()
+                raise
+            finally:
+                self.pending = 0
+
+    def _drop_writer(self):
+        # the open transaction (and its writes) is lost with the connection
+        writer, self.writer = self.writer, None
+        if writer is not None:
+            try:
+                writer.rollback()
+            except Exception:
+                pass
+            self.writer_pool.release(writer)
+
+    def _write_grouped(self, query, budget):
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = self.writer_pool.acquire()
+            conn = self.writer
+            cur = conn.cursor()
+            try:
+                # the savepoint is sent with the statement, no extra round-trip
+                with watchdog.watch(budget, conn.cancel):
+                    if self.prepare and getattr(query, "template", None) is not None:
+                        self._execute_prepared(conn, cur, query.template, [query.params], "SAVEPOINT fuzz_write;")
+                    else:
+                        cur.execute(f"SAVEPOINT fuzz_write;{query}")
+            except Exception:
+                # only the failed statement is undone, on the same connection
+                try:
+                    cur.execute("ROLLBACK TO SAVEPOINT fuzz_write")
+                    self.savepoint_rollbacks += 1
+                except Exception:
+                    self._drop_writer()
+                    self.pending = 0
+                raise
+            self.pending += 1
+            if self.pending>=self.group_commit:
+                conn.commit()
+                self.commits += 1
+                self.pending = 0
+            return None
 
     def query(self, query):
-        cur = self.conn.cursor()
-        cur.execute(query)
-        rows = cur.fetchall()
-        return rows
-
-    def write_query(self, query):
-        cur = self.conn.cursor()
-        cur.execute(query)
-        self.conn.commit()
-        return None
+        self.flush()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query)
+            rows = cur.fetchall()
+            # do not keep the read transaction (and its locks) open
+            conn.rollback()
+            return rows
+
+    def describe(self, query, budget=None):
+        self.flush()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            with watchdog.watch(budget, conn.cancel):
+                cur.execute(query)
+            columns = [(column.name, column.type_code) for column in cur.description]
+            conn.rollback()
+            return columns
+
+    def query_stream(self, query, budget=None):
+        self.flush()
+        # a named (server-side) cursor, rows stay on the server until fetched
+        return _open_stream(self.pool, query, f"fuzz_stream_{next(_cursor_ids)}", end_transaction=True, budget=budget)
+
+    def write_query(self, query, budget=None):
+        if self.group_commit>1:
+            return self._write_grouped(query, budget)
+        self.flush()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            with watchdog.watch(budget, conn.cancel):
+                if self.prepare and getattr(query, "template", None) is not None:
+                    self._execute_prepared(conn, cur, query.template, [query.params])
+                else:
+                    cur.execute(query)
+            conn.commit()
+            self.commits += 1
+            return None
+
+    def write_many(self, template, rows):
+        # one round-trip and one transaction for many parameter rows of a template
+        if len(rows)==0:
+            return None
+        self.flush()
+        with self.pool.connection() as conn:
+            self._execute_prepared(conn, conn.cursor(), template, rows)
+            conn.commit()
+            self.commits += 1
+            return None
+
+    def _execute_prepared(self, conn, cur, template, rows, prefix=""):
+        # params are SQL literals, the statement is only parsed and planned by PREPARE
+        # prefix: sent ahead of the first statement (e.g., a savepoint)
+        statements = conn.statements
+        name = statements.get(template)
+        if name is None:
+            if len(statements)>=self.statement_cache:
+                _, evicted = statements.popitem(last=False)
+                cur.execute(f"{prefix}DEALLOCATE {evicted}")
+                prefix = ""
+            name = f"fuzz_stmt_{next(conn.statement_ids)}"
+            cur.execute(f"{prefix}PREPARE {name} AS {template.rstrip(';')}")
+            prefix = ""
+            statements[template] = name
+        else:
+            statements.move_to_end(template)
+        try:
+            cur.execute(prefix+';'.join(f"EXECUTE {name}({','.join(params)})" for params in rows))
+        except Exception as e:
+            # PREPARE belongs to the session, not to the failed transaction: the
+            # statement stays usable (postgres re-plans it when its tables change)
+            # and cached, so that the cache keeps bounding the server-side ones;
+            # only a statement the session lost is prepared again
+            if getattr(e, "pgcode", None)==MISSING_STATEMENT:
+                del statements[template]
+            raise
+
+    def list_tables(self):
+        return [row[0] for row in self.query("SELECT tablename FROM pg_tables WHERE schemaname = current_schema()")]
+
+    def copy_table(self, source, target, timestamp=None):
+        # a new table with the columns and rows of source, in one statement
+        self.write_query(f"CREATE TABLE {target} AS SELECT * FROM {source};")
+
+    def truncate_table(self, table):
+        self.write_query(f"TRUNCATE TABLE {table};")
+
+    def copy_from(self, table, chunks):
+        # bulk load of COPY text chunks (file-like objects), one transaction
+        self.flush()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            for chunk in chunks:
+                cur.copy_expert(f"COPY {table} FROM STDIN", chunk)
+            conn.commit()
+            self.commits += 1
+            return None
+
+def _questdb_setup(conn):
+    # QuestDB seems no difference on write query, no need for transactions
+    conn.autocommit = True
 
 class QuestDBConnector:
+    dialect = "questdb"
+    seed_methods = ("ilp", "insert")
+    # questdb has no PREPARE, and psycopg2 does not bind server-side,
+    # generated DML is always sent as text
+    prepare = False
     conn_str = 'user=admin password=quest host=127.0.0.1 port=8812 dbname=qdb'
-    def __init__(self):
-        pass
+    # InfluxDB line protocol over TCP, used for bulk writes
+    ilp_address = ('127.0.0.1', 9009)
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, conn_str=None, ilp_address=None):
+        # another server (e.g., one build of a fan-out), the defaults otherwise
+        if conn_str is not None:
+            self.conn_str = conn_str
+        if ilp_address is not None:
+            self.ilp_address = tuple(ilp_address)
+        self.pool = ConnectionPool(lambda: psycopg2.connect(self.conn_str), pool_size, setup=_questdb_setup)
 
     def query(self, query):
-        with psycopg2.connect(self.conn_str) as connection:
+        with self.pool.connection() as connection:
             with connection.cursor() as cur:
                 cur.execute(query)
                 results = cur.fetchall()
                 return results
 
+    def describe(self, query, budget=None):
+        with self.pool.connection() as connection:
+            with connection.cursor() as cur:
+                with watchdog.watch(budget, connection.cancel):
+                    cur.execute(query)
+                return [(column.name, column.type_code) for column in cur.description]
+
+    def query_stream(self, query, budget=None):
+        return _open_stream(self.pool, query, budget=budget)
+
     # write query needs commits, but no need results
     # QuestDB seems no difference on write query
-    def write_query(self, query):
-        with psycopg2.connect(self.conn_str) as connection:
+    def write_query(self, query, budget=None):
+        with self.pool.connection() as connection:
             with connection.cursor() as cur:
-                cur.execute(query)
-                return None
\ No newline at end of file
+                with watchdog.watch(budget, connection.cancel):
+                    cur.execute(query)
+                return None
+
+    def list_tables(self):
+        return [row[0] for row in self.query("SHOW TABLES")]
+
+    def copy_table(self, source, target, timestamp=None):
+        # the designated timestamp is not inherited from the selected table
+        suffix = "" if timestamp is None else f" timestamp({timestamp})"
+        self.write_query(f"CREATE TABLE {target} AS (SELECT * FROM {source}){suffix};")
+
+    def truncate_table(self, table):
+        self.write_query(f"TRUNCATE TABLE {table};")
+
+    def send_lines(self, chunks):
+        # line protocol has no acknowledgements, the rows become visible
+        # once questdb commits them
+        with socket.create_connection(self.ilp_address) as sock:
+            for chunk in chunks:
+                sock.sendall(chunk)
+            return None
+
+# sqlite has no timestamp type, timestamps are stored as text in either
+# the isoformat or the generator format (2024-01-01 00:00:00.000000+00)
+SQLITE_TIMESTAMP = re.compile(r"(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?)(?:[+-]\d{2}(?::?\d{2})?)?")
+
+def _sqlite_value(value):
+    # timestamps are returned as datetimes, as by psycopg2
+    if type(value)==str:
+        match = SQLITE_TIMESTAMP.fullmatch(value)
+        if match is not None:
+            return datetime.datetime.fromisoformat(f"{match.group(1)} {match.group(2)}")
+    return value
+
+def _sqlite_rows(rows):
+    return [tuple(_sqlite_value(value) for value in row) for row in rows]
+
+def _sqlite_param(literal):
+    # SQL literal text of a generated statement -> bound value
+    if literal=="NULL":
+        return None
+    if literal.startswith("'"):
+        return literal[1:-1].replace("''", "'")
+    try:
+        return int(literal)
+    except ValueError:
+        return float(literal)
+
+class SQLitePool(ConnectionPool):
+    # in-process connections do not break and need no ping
+
+    def _is_broken(self, conn):
+        return False
+
+    def _is_healthy(self, conn, idle_since):
+        return True
+
+    def release(self, conn):
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+        self.idle.put((conn, time.monotonic()))
+
+class SQLiteResultStream(ResultStream):
+    def fetchmany(self, size):
+        with watchdog.watch(self.budget, self.conn.interrupt):
+            rows = self.cur.fetchmany(size)
+        return _sqlite_rows(rows)
+
+_sqlite_databases = itertools.count()
+
+class SQLiteConnector:
+    """
+    in-process reference engine, no server and no round-trips
+    every connector owns one shared-cache in-memory database, so that its
+    pooled connections see the same tables; the database lives as long as
+    the connector
+    """
+    dialect = "sqlite"
+    seed_methods = ("prepared", "insert")
+    # bind the params of generated DML, the sqlite3 module caches the
+    # compiled statement of every template per connection
+    prepare = False
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, database=None):
+        if database is None:
+            database = f"fuzz_{id(self)}_{next(_sqlite_databases)}"
+        self.uri = f"file:{database}?mode=memory&cache=shared"
+        # the last closed connection drops an in-memory database
+        self.keeper = self._connect()
+        self.pool = SQLitePool(self._connect, pool_size)
+
+    def _connect(self):
+        # autocommit, a pooled connection is used by one thread at a time
+        conn = sqlite3.connect(self.uri, uri=True, isolation_level=None, check_same_thread=False)
+        # readers of a shared cache must not wait for table locks of writers
+        conn.execute("PRAGMA read_uncommitted = 1")
+        return conn
+
+    def prune(self):
+        pass
+
+    def query(self, query):
+        with self.pool.connection() as conn:
+            return _sqlite_rows(conn.execute(query).fetchall())
+
+    def describe(self, query, budget=None):
+        with self.pool.connection() as conn:
+            with watchdog.watch(budget, conn.interrupt):
+                cur = conn.execute(query)
+            return [(column[0], None) for column in cur.description]
+
+    def query_stream(self, query, budget=None):
+        conn = self.pool.acquire()
+        try:
+            with watchdog.watch(budget, conn.interrupt):
+                cur = conn.execute(query)
+        except Exception:
+            self.pool.release(conn)
+            raise
+        return SQLiteResultStream(self.pool, conn, cur, budget=budget)
+
+    def write_query(self, query, budget=None):
+        with self.pool.connection() as conn:
+            with watchdog.watch(budget, conn.interrupt):
+                if self.prepare and getattr(query, "template", None) is not None:
+                    conn.execute(query.template, [_sqlite_param(param) for param in query.params])
+                else:
+                    conn.execute(query)
+            return None
+
+    def list_tables(self):
+        return [row[0] for row in self.query("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+    def copy_table(self, source, target, timestamp=None):
+        self.write_query(f"CREATE TABLE {target} AS SELECT * FROM {source};")
+
+    def truncate_table(self, table):
+        # no TRUNCATE, an unqualified DELETE is optimized into one
+        self.write_query(f"DELETE FROM {table};")
+
+    def write_many(self, template, rows):
+        with self.pool.connection() as conn:
+            conn.executemany(template, ([_sqlite_param(param) for param in params] for params in rows))
+            return None
+
+# backend name -> connector class
+CONNECTORS = {
+    "questdb": QuestDBConnector,
+    "postgres": PostgresConnector,
+    "sqlite": SQLiteConnector,
+}
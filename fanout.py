@@ -0,0 +1,389 @@
+"""
+fan-out testing: one reference execution compared against many targets
+the targets (main.EVAL_CONFIG_TARGETS, e.g. the nightly, stable and a
+patched build of questdb) share a dialect, so every generated statement
+is mapped once for them and once for the reference; it runs once on the
+reference and concurrently on every target, and each target result is
+compared with the reference result, read once for all of them
+every target has its own bug log, exception log, bug index, statement
+timeout and statistics; the testing loop is main.run_testing, with the
+targets as its tested connector
+"""
+
+import os
+import argparse
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor, wait
+import main
+from driver import StatementBudget, StatementTimeout
+from result_compare import FetchError, compare_streams
+from bug_index import BugIndex, bug_fingerprint
+from timeouts import slowdown
+from scheduler import Scheduler
+from clause_identification import clauses_identifying
+from query_generation import QueryGenerator
+
+class Target:
+    """
+    a tested server of a fan-out, named in its log files, e.g. ./bug_<name>.log
+    timeout: its adaptive statement timeout, None: no timeout
+    """
+
+    def __init__(self, name, api, timeout=None):
+        self.name = name
+        self.api = api
+        self.timeout = timeout
+        self.bug_path = f"./bug_{name}.log"
+        self.exception_path = f"./{name}_exception.log"
+        index_path, extension = os.path.splitext(main.EVAL_CONFIG_BUG_INDEX)
+        self.bug_index = BugIndex(f"{index_path}_{name}{extension}", main.EVAL_CONFIG_BUG_EXAMPLES)
+        self.lock = threading.Lock()
+        self.statements = 0
+        self.errors = 0
+        self.mismatches = 0
+        self.slow_pairs = 0
+
+    def record(self, success, mismatch):
+        with self.lock:
+            self.statements += 1
+            self.errors += not success
+            self.mismatches += mismatch
+
+    def slow_pair(self):
+        with self.lock:
+            self.slow_pairs += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "statements": self.statements,
+                "errors": self.errors,
+                "mismatches": self.mismatches,
+                "slow_pairs": self.slow_pairs,
+            }
+
+    def exception_log(self, query, error):
+        main.log_record(self.exception_path, f"\n===EXCEPTION===\n\nquery:{query}\n{error}\n")
+
+    def bug_log(self, bugstr):
+        main.log_record(self.bug_path, f"\n===Bug-inducing Cases===\n{bugstr}\n")
+
+class TargetPools:
+    # the pools of every target, their counters are summed
+    def __init__(self, pools):
+        self.pools = pools
+
+    def stats(self):
+        stats = {}
+        for pool in self.pools:
+            for counter, count in pool.stats().items():
+                stats[counter] = stats.get(counter, 0)+count
+        return stats
+
+class TargetGroup:
+    """
+    the targets as the tested connector of main.run_testing: tables are
+    created, seeded, copied and dropped on every target at once, the
+    statements of the pairs are run by fanout_testing
+    """
+
+    def __init__(self, targets):
+        dialects = {target.api.dialect for target in targets}
+        if len(dialects)!=1:
+            raise ValueError(f"fan-out targets must share a dialect, not {sorted(dialects)}")
+        names = [target.name for target in targets]
+        if len(set(names))!=len(names):
+            raise ValueError(f"fan-out target names must be unique, not {names}")
+        self.targets = targets
+        self.apis = [target.api for target in targets]
+        self.dialect = self.apis[0].dialect
+        # bulk-load methods every target supports, see seeding.supported_method
+        self.seed_methods = tuple(method for method in self.apis[0].seed_methods
+                                  if all(method in api.seed_methods for api in self.apis))
+        self.pool = TargetPools([api.pool for api in self.apis])
+        # one thread per target and pair in flight (main.EVAL_CONFIG_PIPELINE_EXECUTORS),
+        # for both broadcasts and pairs
+        self.executor = ThreadPoolExecutor(max_workers=len(targets)*max(main.EVAL_CONFIG_PIPELINE_EXECUTORS, 1),
+                                           thread_name_prefix="target")
+
+    def _broadcast(self, method, *args):
+        futures = [self.executor.submit(getattr(api, method), *args) for api in self.apis]
+        # every target finishes before the first error is raised
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def write_query(self, query, budget=None):
+        self._broadcast("write_query", query)
+        return None
+
+    def write_many(self, template, rows):
+        self._broadcast("write_many", template, rows)
+        return None
+
+    def send_lines(self, chunks):
+        # the chunks are generated once for every target
+        self._broadcast("send_lines", list(chunks))
+        return None
+
+    def copy_from(self, table, chunks):
+        self._broadcast("copy_from", table, list(chunks))
+        return None
+
+    def list_tables(self):
+        return sorted(set(table for tables in self._broadcast("list_tables") for table in tables))
+
+    def copy_table(self, source, target, timestamp=None):
+        self._broadcast("copy_table", source, target, timestamp)
+
+    def truncate_table(self, table):
+        self._broadcast("truncate_table", table)
+
+    def stats(self):
+        return {target.name: target.stats() for target in self.targets}
+
+    def close(self):
+        self.executor.shutdown()
+
+def target_round_trip(target, query, budget=None):
+    # same results as main.questdb_round_trip, logged per target
+    try:
+        if "SELECT " in query:
+            return target.api.query_stream(query, budget)
+        target.api.write_query(query, budget)
+        return None
+    except StatementTimeout as e:
+        main.timeout_log(target.name, query, e)
+        return -1
+    except Exception as e:
+        target.exception_log(query, e)
+        return -1
+
+class SharedStream:
+    """
+    the reference result stream read once for several readers, e.g. the
+    comparisons with every target running at the same time; a chunk is
+    kept until every reader fetched it, so memory follows the distance
+    between the fastest and the slowest reader, not the result size.
+    the stream is closed with its last reader
+    """
+
+    def __init__(self, stream, readers):
+        self.stream = stream
+        self.lock = threading.Lock()
+        # chunks not yet fetched by every reader, chunks[0] is chunk number base
+        self.chunks = collections.deque()
+        self.base = 0
+        self.positions = [0]*readers
+        self.open = readers
+        self.exhausted = False
+        # the reference failed while its rows were fetched, every reader sees the error
+        self.error = None
+        if readers==0:
+            stream.close()
+
+    def fetchmany(self, reader, size):
+        with self.lock:
+            position = self.positions[reader]
+            if position-self.base==len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                if self.exhausted:
+                    return []
+                try:
+                    chunk = self.stream.fetchmany(size)
+                except Exception as e:
+                    self.error = e
+                    raise
+                if len(chunk)==0:
+                    self.exhausted = True
+                    return []
+                self.chunks.append(chunk)
+            chunk = self.chunks[position-self.base]
+            self.positions[reader] = position+1
+            self._release()
+            return chunk
+
+    def _release(self):
+        # caller holds the lock: drop the chunks every open reader is past
+        oldest = min((position for position in self.positions if position is not None), default=self.base+len(self.chunks))
+        while self.base<oldest:
+            self.chunks.popleft()
+            self.base += 1
+
+    def close(self, reader):
+        with self.lock:
+            if self.positions[reader] is None:
+                return
+            self.positions[reader] = None
+            self.open -= 1
+            self._release()
+            if self.open==0:
+                self.stream.close()
+
+    def reader(self, reader):
+        return SharedReader(self, reader)
+
+class SharedReader:
+    def __init__(self, shared, reader):
+        self.shared = shared
+        self.reader = reader
+
+    def fetchmany(self, size):
+        return self.shared.fetchmany(self.reader, size)
+
+    def close(self):
+        self.shared.close(self.reader)
+
+def target_comparison(target, query, result, reference):
+    """
+    a target result against its reader of the reference result: whether
+    the target rows could be fetched, and the comparison (None if either failed)
+    """
+    try:
+        return True, compare_streams([result, reference], main.EVAL_CONFIG_FETCH_CHUNK)
+    except FetchError as e:
+        # reference errors are logged once, by fanout_testing
+        if e.side==1:
+            return True, None
+        if isinstance(e.error, StatementTimeout):
+            main.timeout_log(target.name, query, e.error)
+        else:
+            target.exception_log(query, e)
+        return False, None
+    finally:
+        main.close_result(result)
+        reference.close()
+
+def target_analysis(target, query, comparison, agreeing):
+    # agreeing: the targets with the reference result, e.g. stable when only nightly differs
+    fingerprint, details = bug_fingerprint(query, comparison)
+    bugstr = f"\nTarget:{target.name}\n"
+    bugstr += f"\nQuestDB Query:{query[0]}\n"
+    bugstr += f"\nPostgresDB Query:{query[1]}\n"
+    bugstr += f"\n\t{target.name}:{comparison.describe(0)}"
+    bugstr += f"\n\tpostgres:{comparison.describe(1)}"
+    bugstr += f"\n\tfingerprint:{fingerprint}"
+    bugstr += f"\n\tagreeing targets:{agreeing}"
+    if target.bug_index.record(fingerprint, details, query, bugstr):
+        target.bug_log(bugstr)
+
+def target_latency(target, query, budget, reference_budget, successes):
+    # main.latency_analysis of one target, against the shared reference execution
+    if target.timeout is not None and successes[0] and not budget.timed_out:
+        target.timeout.observe(budget.elapsed)
+    ratio = slowdown((budget, reference_budget), successes)
+    if ratio is None or ratio<main.EVAL_CONFIG_PERF_RATIO or budget.elapsed<main.EVAL_CONFIG_PERF_MIN_SECONDS:
+        return
+    target.slow_pair()
+    main.metrics.slow_pair()
+    perfstr = f"\nTarget:{target.name}\n"
+    perfstr += f"\nQuestDB Query:{query[0]}\n"
+    perfstr += f"\nPostgresDB Query:{query[1]}\n"
+    perfstr += f"\n\t{target.name}:{budget.elapsed:.3f}s{' (timed out)' if budget.timed_out else ''}"
+    perfstr += f"\n\tpostgres:{reference_budget.elapsed:.3f}s"
+    perfstr += f"\n\tslowdown:{ratio:.0f}x"
+    main.perf_log(perfstr)
+
+def fanout_testing(executor, group, postgres_api, query):
+    """
+    main.differential_testing for a TargetGroup, returns whether the
+    statement succeeded on every target and on the reference, and whether
+    a target result differs from the reference one
+    """
+    is_select = "SELECT " in query[0] and "SELECT " in query[1]
+    targets = group.targets
+    budgets = [StatementBudget(None if target.timeout is None else target.timeout.current()) for target in targets]
+    reference_budget = main.statement_budgets()[1]
+    futures = [group.executor.submit(main.metrics.timed, "questdb", target_round_trip, target, query[0], budget)
+               for target, budget in zip(targets, budgets)]
+    # the reference runs once (or comes from the reference cache), meanwhile the targets run
+    reference_result = main.postgres_execute_query(postgres_api, query[1], reference_budget)
+    results = [future.result() for future in futures]
+    comparisons = [None]*len(targets)
+    fetched = [True]*len(targets)
+    reference_fetched = True
+    compared = []
+    if is_select and reference_result!=None and reference_result!=-1:
+        compared = [i for i, result in enumerate(results) if result!=None and result!=-1]
+        # the targets read the reference rows while they are fetched, at the same time
+        shared = SharedStream(reference_result, len(compared))
+        futures = {i: group.executor.submit(main.metrics.timed, "compare", target_comparison,
+                                            targets[i], query[0], results[i], shared.reader(reader))
+                   for reader, i in enumerate(compared)}
+        for i, future in futures.items():
+            fetched[i], comparisons[i] = future.result()
+        if shared.error is not None:
+            reference_fetched = False
+            if isinstance(shared.error, StatementTimeout):
+                main.timeout_log("postgres", query[1], shared.error)
+            else:
+                main.postgres_exception_log(f"\nquery:{query[1]}\n"+str(shared.error))
+    else:
+        main.close_result(reference_result)
+    for i, result in enumerate(results):
+        if i not in compared:
+            main.close_result(result)
+    agreeing = [target.name for target, comparison in zip(targets, comparisons)
+                if comparison is not None and not comparison.differs()]
+    # a statement failing while its rows are fetched failed
+    successes = [result!=-1 and each for result, each in zip(results, fetched)]
+    reference_success = reference_result!=-1 and reference_fetched
+    mismatch = False
+    for target, budget, success, comparison in zip(targets, budgets, successes, comparisons):
+        differs = comparison is not None and comparison.differs()
+        if differs:
+            target_analysis(target, query, comparison, agreeing)
+        mismatch = mismatch or differs
+        target.record(success, differs)
+        target_latency(target, query, budget, reference_budget, (success, reference_success))
+    # one record for every target, a replay checks the pair against any of them
+    main.pair_record(query)
+    timeout = main.statement_timeouts[1]
+    if timeout is not None and reference_success and not reference_budget.timed_out and not reference_budget.cached:
+        timeout.observe(reference_budget.elapsed)
+    return all(successes), reference_success, mismatch
+
+def print_fanout_stats(group, postgres_api, testing_round, executed, questdb_success_query_count, postgres_success_query_count):
+    # target counters are cumulative over the rounds, the reference one is per round
+    for target in group.targets:
+        stats = target.stats()
+        print(f"{target.name} query success rate:{1-stats['errors']/max(stats['statements'], 1)} mismatches:{stats['mismatches']}")
+    print(f"postgres query success rate:{float(postgres_success_query_count/executed)}")
+    main.metrics.set_targets(group.stats())
+
+def connect_targets(pool_size):
+    targets = []
+    for name, backend, options in main.EVAL_CONFIG_TARGETS:
+        targets.append(Target(name, main.connect_backend(backend, pool_size, **options),
+                              main.adaptive_timeout(main.EVAL_CONFIG_STATEMENT_TIMEOUTS[0])))
+    return TargetGroup(targets)
+
+def run_fanout(max_rounds=None):
+    main.rotate_logs()
+    group = connect_targets(main.EVAL_CONFIG_POOL_SIZE)
+    for target in group.targets:
+        main.log_writer.rotate(target.bug_path)
+        main.log_writer.rotate(target.exception_path)
+        # bug reports must not be lost, they bypass the buffer
+        main.log_writer.sync_paths.add(target.bug_path)
+    postgres_api = main.connect_backend(main.EVAL_CONFIG_BACKENDS[1], main.EVAL_CONFIG_POOL_SIZE)
+    main.set_statement_timeouts([None, main.adaptive_timeout(main.EVAL_CONFIG_STATEMENT_TIMEOUTS[1])])
+    main.set_pair_testing(fanout_testing)
+    print(f"fan-out to {[target.name for target in group.targets]}")
+    shared_clauses = clauses_identifying(group, postgres_api)
+    scheduler = Scheduler(main.EVAL_CONFIG_SCHEDULER_WEIGHTS) if main.EVAL_CONFIG_SCHEDULER else None
+    query_generator = QueryGenerator(shared_clauses, main.EVAL_CONFIG_CLAUSE_MAPPING, table_prefix=main.EVAL_CONFIG_TABLE_PREFIX, seed=main.EVAL_CONFIG_SEED,
+                                     dialects=(group.dialect, postgres_api.dialect), scheduler=scheduler)
+    print(f"generator seed {query_generator.seed}")
+    try:
+        # fanout_testing runs the targets on the group threads, no pair executor
+        main.run_testing(group, postgres_api, query_generator, None, print_fanout_stats, max_rounds)
+    finally:
+        group.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare one reference execution against several targets")
+    parser.add_argument("--rounds", type=int, default=None, help="testing rounds (default: unlimited)")
+    args = parser.parse_args()
+    run_fanout(args.rounds)
@@ -0,0 +1,191 @@
+"""
+server-side result fingerprints
+instead of transferring full results, both engines compute a small
+order-independent summary of the mapped query result:
+    row count + per-column (non-null count, checksum, min, max)
+a summary only replaces the full comparison when it determines the whole
+result: an empty result, a single row (min and max are its values), or a
+single column whose values are all NULL or have a checksum; any other
+agreeing summary falls back to the full rows
+"""
+
+from result_compare import canonical_value, normalize_row
+
+# pg-wire type oids (QuestDB reports the same oids as Postgres)
+INTEGER_TYPES = {20, 21, 23}
+FLOAT_TYPES = {700, 701, 1700}
+BOOLEAN_TYPES = {16}
+STRING_TYPES = {18, 19, 25, 1042, 1043}
+TIMESTAMP_TYPES = {1114, 1184}
+
+# per-dialect checksum of one column, with the non-null count it must
+# determine the multiset of the column values; only booleans have one:
+# sums of numbers, string lengths or timestamps cancel out (e.g. {0,4,5}
+# and {1,2,6} have the same sum and the same sum of squares)
+CHECKSUM_TEMPLATES = {
+    "questdb": {
+        "boolean": "sum(CASE WHEN {col} THEN 1 ELSE 0 END)",
+    },
+    "postgres": {
+        "boolean": "sum(CASE WHEN {col} THEN 1 ELSE 0 END)",
+    },
+}
+
+# per-dialect (min, max) of one column; over a single row both are the
+# value of the row, which makes single-row results (most generated
+# aggregates) decidable; sqlite orders any value and reports no types
+VALUE_TEMPLATES = {
+    "questdb": {
+        kind: ("min({col})", "max({col})") for kind in ("integer", "float", "timestamp")
+    },
+    "postgres": {
+        kind: ("min({col})", "max({col})") for kind in ("integer", "float", "string", "timestamp")
+    },
+    "sqlite": {
+        kind: ("min({col})", "max({col})") for kind in (None, "integer", "float", "boolean", "string", "timestamp")
+    },
+}
+
+def type_class(type_code):
+    if type_code in INTEGER_TYPES:
+        return "integer"
+    if type_code in FLOAT_TYPES:
+        return "float"
+    if type_code in BOOLEAN_TYPES:
+        return "boolean"
+    if type_code in STRING_TYPES:
+        return "string"
+    if type_code in TIMESTAMP_TYPES:
+        return "timestamp"
+    return None
+
+def checksum_template(dialect, type_code):
+    # None for unknown types (e.g. sqlite reports none) and weak checksums
+    return CHECKSUM_TEMPLATES.get(dialect, {}).get(type_class(type_code))
+
+def value_templates(dialect, type_code):
+    # None where the engine has no min/max for the type (booleans are
+    # already determined by their checksum)
+    return VALUE_TEMPLATES.get(dialect, {}).get(type_class(type_code))
+
+def summary_layout(dialect, columns):
+    # per column: (has a checksum, has min/max), in summary order
+    return [(checksum_template(dialect, type_code) is not None, value_templates(dialect, type_code) is not None)
+            for _, type_code in columns]
+
+def probe_query(query):
+    # only the column names and types of the result are needed
+    return f"SELECT * FROM ({query}) AS fp LIMIT 0"
+
+def fingerprint_query(dialect, query, columns):
+    """
+    columns: [(name, type_code)] as reported by the probe
+    returns None when the result cannot be summarized by name
+    """
+    names = [name for name, _ in columns]
+    if len(set(names))!=len(names):
+        return None
+    summary = ["count(*)"]
+    for name, type_code in columns:
+        col = '"{}"'.format(name.replace('"', '""'))
+        summary.append(f"count({col})")
+        template = checksum_template(dialect, type_code)
+        if template is not None:
+            summary.append(template.format(col=col))
+        templates = value_templates(dialect, type_code)
+        if templates is not None:
+            summary.extend(each.format(col=col) for each in templates)
+    return f"SELECT {','.join(summary)} FROM ({query}) AS fp"
+
+def column_counts(summary, layout):
+    # the non-null count of each column, skipping checksums and min/max
+    counts, position = [], 1
+    for checksummed, valued in layout:
+        counts.append(summary[position])
+        position += 1+checksummed+2*valued
+    return counts
+
+def project_summary(summary, layout, common):
+    # keeps the parts of the summary that the common layout has
+    projected, position = [summary[0]], 1
+    for (checksummed, valued), (keep_checksum, keep_values) in zip(layout, common):
+        projected.append(summary[position])
+        position += 1
+        if checksummed:
+            if keep_checksum:
+                projected.append(summary[position])
+            position += 1
+        if valued:
+            if keep_values:
+                projected.extend(summary[position:position+2])
+            position += 2
+    return tuple(projected)
+
+def summary_decides(summary, layout):
+    """
+    whether an agreeing summary determines the whole result: no rows, one
+    row whose values are all NULL or known from their checksum or min/max,
+    or one column without non-null values or with a checksum; the values of
+    several columns (or the extremes of several rows) can agree one by one
+    and still combine into other rows
+    """
+    if summary[0]==0:
+        return True
+    counts = column_counts(summary, layout)
+    if summary[0]==1:
+        return all(count==0 or checksummed or valued for count, (checksummed, valued) in zip(counts, layout))
+    return len(layout)==1 and (counts[0]==0 or layout[0][0])
+
+def result_fingerprint(api, query, budget=None):
+    """
+    returns (summary row, summary layout), or None when
+    the engine could not compute it (the caller then falls back to the full
+    comparison, which also logs the error); the probe and the summary both
+    spend the statement budget
+    """
+    try:
+        columns = api.describe(probe_query(query), budget)
+        summary_query = fingerprint_query(api.dialect, query, columns)
+        if summary_query is None:
+            return None
+        stream = api.query_stream(summary_query, budget)
+        try:
+            rows = stream.fetchmany(2)
+        finally:
+            stream.close()
+    except Exception:
+        return None
+    if len(rows)!=1:
+        return None
+    return tuple(rows[0]), summary_layout(api.dialect, columns)
+
+def fingerprint_analysis(executor, questdb_api, postgres_api, query, budgets=(None, None)):
+    """
+    True: summaries agree and determine both results, False: summaries
+    disagree, None: not comparable or not conclusive
+    """
+    if executor is None:
+        questdb_fingerprint = result_fingerprint(questdb_api, query[0], budgets[0])
+    else:
+        questdb_future = executor.submit(result_fingerprint, questdb_api, query[0], budgets[0])
+    postgres_fingerprint = result_fingerprint(postgres_api, query[1], budgets[1])
+    if executor is not None:
+        questdb_fingerprint = questdb_future.result()
+    if questdb_fingerprint is None or postgres_fingerprint is None:
+        return None
+    (questdb_summary, questdb_layout), (postgres_summary, postgres_layout) = questdb_fingerprint, postgres_fingerprint
+    if len(questdb_layout)!=len(postgres_layout):
+        return None
+    # only what both engines summarized is compared, e.g. postgres has
+    # min/max of strings and questdb does not
+    layout = [(a[0] and b[0], a[1] and b[1]) for a, b in zip(questdb_layout, postgres_layout)]
+    questdb_summary = project_summary(questdb_summary, questdb_layout, layout)
+    postgres_summary = project_summary(postgres_summary, postgres_layout, layout)
+    # values are matched like the rows of the full comparison (empty
+    # results sum to NULL on both sides)
+    canonical = lambda summary: tuple(canonical_value(each) for each in normalize_row(summary))
+    if canonical(questdb_summary)!=canonical(postgres_summary):
+        return False
+    if not summary_decides(questdb_summary, layout):
+        return None
+    return True
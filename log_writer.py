@@ -0,0 +1,109 @@
+import os
+import atexit
+import threading
+
+# flush a file once this many bytes are buffered for it
+DEFAULT_FLUSH_SIZE = 64*1024
+# seconds between two background flushes
+DEFAULT_FLUSH_INTERVAL = 1.0
+# rotate a log once it grows beyond this size, 0 disables it
+DEFAULT_MAX_BYTES = 512*1024*1024
+DEFAULT_BACKUP_COUNT = 3
+
+class BufferedLogWriter:
+    """
+    keeps every log file open and batches records in memory
+    buffers are written on a size or time threshold and on shutdown,
+    records of sync paths (e.g., bug.log) are written and fsync-ed at once
+    """
+
+    def __init__(self, sync_paths=(), flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        self.sync_paths = set(sync_paths)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        self.files = {}
+        self.buffers = {}
+        self.buffered = {}
+        self.flusher = None
+        self.stopped = threading.Event()
+        atexit.register(self.close)
+
+    def _start_flusher(self):
+        # started lazily so that forked processes which never log stay thread-free
+        self.flusher = threading.Thread(target=self._flush_loop, name="log-flusher", daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def _file(self, path):
+        f = self.files.get(path)
+        if f is None:
+            f = open(path, "a")
+            self.files[path] = f
+        return f
+
+    def _write_out(self, path, sync=False):
+        # caller holds the lock
+        chunks = self.buffers.get(path)
+        if not chunks:
+            return
+        f = self._file(path)
+        f.write(''.join(chunks))
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+        self.buffers[path] = []
+        self.buffered[path] = 0
+        if self.max_bytes>0 and f.tell()>=self.max_bytes:
+            self._rotate(path)
+
+    def _rotate(self, path):
+        # caller holds the lock: path -> path.1 -> path.2 ...
+        f = self.files.pop(path, None)
+        if f is not None:
+            f.close()
+        if not os.path.exists(path) or os.path.getsize(path)==0:
+            return
+        if self.backup_count<=0:
+            os.remove(path)
+            return
+        for i in range(self.backup_count-1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i+1}")
+        os.replace(path, f"{path}.1")
+
+    def write(self, path, logstr):
+        with self.lock:
+            if self.flusher is None:
+                self._start_flusher()
+            self.buffers.setdefault(path, []).append(logstr)
+            self.buffered[path] = self.buffered.get(path, 0)+len(logstr)
+            if path in self.sync_paths:
+                self._write_out(path, sync=True)
+            elif self.buffered[path]>=self.flush_size:
+                self._write_out(path)
+
+    def flush(self, path=None):
+        with self.lock:
+            for each_path in ([path] if path is not None else list(self.buffers)):
+                self._write_out(each_path)
+
+    def rotate(self, path):
+        with self.lock:
+            self._write_out(path)
+            self._rotate(path)
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            for path in list(self.buffers):
+                self._write_out(path)
+            for f in self.files.values():
+                f.close()
+            self.files = {}
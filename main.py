@@ -1,152 +1,586 @@
 import os
-import decimal
+import time
+import random
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from driver import *
+from log_writer import BufferedLogWriter
+from result_compare import FetchError, compare_streams
+from fingerprint import fingerprint_analysis
+from bug_index import BugIndex, bug_fingerprint, query_clauses
+from metrics import ENGINES, Metrics, ProfileHook
+from timeouts import AdaptiveTimeout, slowdown
+from seeding import SeedSpec
+from table_manager import TableManager
+from dedup import SeenQueries
+from pipeline import PairProducer, TableOrderedExecutor
+from result_cache import ResultCache
+from record_store import RecordStore, pair_outcome
+from scheduler import DelayedFeedback, Scheduler
 from clause_identification import clauses_identifying
 from query_generation import QueryGenerator
 
 EVAL_CONFIG_CLAUSE_MAPPING = True
+# the tested and the reference backend (driver.CONNECTORS), the questdb and
+# postgres names of the testing loop stand for these two; "sqlite" runs
+# in-process, e.g. ("sqlite", "sqlite") stresses everything but the round-trips
+EVAL_CONFIG_BACKENDS = ("questdb", "postgres")
+# number of long-lived connections kept per database
+EVAL_CONFIG_POOL_SIZE = 2
+# send each differential pair to both databases at the same time
+EVAL_CONFIG_CONCURRENT_EXECUTION = True
+# generated queries per testing round
+EVAL_CONFIG_ROUND_QUERIES = 2000
+# rows fetched per round-trip when comparing SELECT results
+EVAL_CONFIG_FETCH_CHUNK = 1000
+# compare engine-side result summaries first, fetch rows unless they determine
+# both results (empty, a single row, or a single all-NULL or boolean column)
+EVAL_CONFIG_FINGERPRINT = False
+# rows bulk-loaded into every table after it is created (0: no seeding);
+# generated joins (mostly ON True ..., up to 3 tables) grow with the product
+# of the table sizes, keep the statement timeouts on when seeding
+EVAL_CONFIG_SEED_ROWS = 0
+# value distributions of the seeded rows, see seeding.SeedSpec
+EVAL_CONFIG_SEED_DISTRIBUTION = {"null_rate": 0.05, "distinct_strings": 1000, "timestamp_days": 30}
+# "ilp" or "insert" for questdb, "copy", "prepared" or "insert" for postgres
+EVAL_CONFIG_SEED_METHODS = ("ilp", "copy")
+# fuzz tables are named <TABLE_PREFIX><8 letters>, the leftovers of earlier
+# runs are found by the prefix and dropped at startup and shutdown (SWEEP)
+EVAL_CONFIG_TABLE_PREFIX = "fuzz_"
+EVAL_CONFIG_TABLE_SWEEP = True
+# tables of a finished round: "drop", "truncate" (reused by the next round) or "keep"
+EVAL_CONFIG_ROUND_TABLES = "drop"
+# seeded datasets kept as template tables, later rounds copy their tables
+# from them on the server (0: every table is seeded anew)
+EVAL_CONFIG_SEED_TEMPLATES = 3
+# generator seed, None picks a fresh one (it is printed and logged)
+EVAL_CONFIG_SEED = None
+# mismatches with the same fingerprint are reported this many times, then only counted
+EVAL_CONFIG_BUG_EXAMPLES = 5
+EVAL_CONFIG_BUG_INDEX = "./bug_index.json"
+# postgres writes committed per transaction, each write behind a savepoint so
+# that a failing statement is rolled back alone; pending writes are committed
+# before the next read (1: commit every write); the write transaction has a
+# connection of its own, on top of the EVAL_CONFIG_POOL_SIZE pooled ones
+EVAL_CONFIG_GROUP_COMMIT = 100
+# run generated INSERT/UPDATE statements as prepared templates with parameters
+# (postgres: PREPARE/EXECUTE, sqlite: bound parameters); logs keep the text
+EVAL_CONFIG_PREPARED = True
+# SELECT pairs already run against the same table contents are skipped
+EVAL_CONFIG_DEDUP = True
+# probability that a repeated pair still runs (1: dedup only counts repeats)
+EVAL_CONFIG_DEDUP_KEEP = 0.0
+# pairs generated ahead of execution by a producer thread (0: generate inline)
+EVAL_CONFIG_PIPELINE_DEPTH = 256
+# threads executing pairs, pairs on the same tables keep their order when
+# one of them writes (1: one pair at a time); keep EVAL_CONFIG_POOL_SIZE as large
+EVAL_CONFIG_PIPELINE_EXECUTORS = 1
+# reference (postgres side) SELECT answers are cached by query text and the
+# versions of the tables they read, within a budget of cached rows (0: off)
+EVAL_CONFIG_RESULT_CACHE_ROWS = 1000000
+# larger reference results are not cached
+EVAL_CONFIG_RESULT_CACHE_MAX_RESULT = 10000
+# seen-set sizing, see dedup.SeenQueries
+EVAL_CONFIG_DEDUP_CAPACITY = 100000
+EVAL_CONFIG_DEDUP_ERROR_RATE = 0.001
+# bias generation toward rare clause combinations and recent errors/mismatches;
+# the learned weights are persisted, a seeded run also depends on the weights it starts from;
+# pipelined statements are drawn with the weights of the feedback a queue depth back
+EVAL_CONFIG_SCHEDULER = True
+EVAL_CONFIG_SCHEDULER_WEIGHTS = "./scheduler.json"
+# statement timeouts (seconds) of the tested and the reference backend as
+# (initial, minimum, maximum), None: no timeout; statements past their timeout
+# are cancelled by the driver watchdog and logged to ./timeout.log
+EVAL_CONFIG_STATEMENT_TIMEOUTS = ((30, 1, 120), (30, 1, 120))
+# once warmed up, a timeout is FACTOR times the PERCENTILE of recent statement latencies
+EVAL_CONFIG_TIMEOUT_PERCENTILE = 0.99
+EVAL_CONFIG_TIMEOUT_FACTOR = 10
+# pairs where the tested engine is RATIO times slower than the reference
+# (and takes MIN_SECONDS at least) are logged to ./perf.log
+EVAL_CONFIG_PERF_RATIO = 100
+EVAL_CONFIG_PERF_MIN_SECONDS = 0.5
+# fan-out (fanout.py): tested servers as (name, backend, connector options),
+# every pair runs once on the reference backend of EVAL_CONFIG_BACKENDS and
+# on every target; targets share a dialect, e.g. questdb builds on other ports:
+# ("nightly", "questdb", {"conn_str": "user=admin password=quest host=127.0.0.1 port=8813 dbname=qdb",
+#                         "ilp_address": ("127.0.0.1", 9010)})
+EVAL_CONFIG_TARGETS = (
+    ("stable", "questdb", {}),
+)
+# statement pairs are recorded to an indexed, compressed store (record_store.py)
+# instead of diff_input.log and the testing logs, which record_store.py exports
+# on demand (None: write the text logs)
+EVAL_CONFIG_RECORD_STORE = "./records"
+# stage latencies and throughput are exported to <prefix>.json and <prefix>.prom
+EVAL_CONFIG_METRICS = "./metrics"
+EVAL_CONFIG_METRICS_INTERVAL = 10
+# profile the first N generated queries (0: off), "sampling" writes
+# folded stacks for flamegraphs, "cprofile" writes a pstats file
+EVAL_CONFIG_PROFILE_ITERATIONS = 0
+EVAL_CONFIG_PROFILE_MODE = "sampling"
+
+LOG_FILES = [
+    "./postgres_testing.log", "./postgres_exception.log",
+    "./questdb_testing.log", "./questdb_exception.log",
+    "./bug.log", "./diff_input.log",
+    "./timeout.log", "./perf.log",
+]
+
+# bug reports must not be lost, they bypass the buffer
+log_writer = BufferedLogWriter(sync_paths=["./bug.log"])
+
+# every log record goes through the sink, campaign workers replace it
+# to forward records to the coordinator process
+log_sink = log_writer.write
+
+def set_log_sink(sink):
+    global log_sink
+    log_sink = sink
+
+# fingerprints of the reported mismatches, campaign workers replace it
+# to forward mismatches to the coordinator process
+bug_index = BugIndex(EVAL_CONFIG_BUG_INDEX, EVAL_CONFIG_BUG_EXAMPLES)
+
+def set_bug_index(index):
+    global bug_index
+    bug_index = index
+
+# stage latencies of the loop, campaign workers replace it to export
+# one file per worker
+metrics = Metrics(EVAL_CONFIG_METRICS, export_interval=EVAL_CONFIG_METRICS_INTERVAL)
+
+def set_metrics(collector):
+    global metrics
+    metrics = collector
+
+# recorded statement pairs (None: text logs), campaign workers replace it
+# to forward records to the coordinator process
+record_store = RecordStore(EVAL_CONFIG_RECORD_STORE) if EVAL_CONFIG_RECORD_STORE is not None else None
+
+def set_record_store(store):
+    global record_store
+    record_store = store
+
+# answers of the reference engine, campaign workers keep one per process
+result_cache = ResultCache(EVAL_CONFIG_RESULT_CACHE_ROWS, EVAL_CONFIG_RESULT_CACHE_MAX_RESULT) if EVAL_CONFIG_RESULT_CACHE_ROWS>0 else None
+
+def set_result_cache(cache):
+    global result_cache
+    result_cache = cache
+
+# adaptive timeouts of the tested and the reference engine (None: no timeout),
+# set up by connect_backends
+statement_timeouts = [None, None]
+
+def set_statement_timeouts(timeouts):
+    global statement_timeouts
+    statement_timeouts = timeouts
+
+def log_record(path, logstr):
+    metrics.timed("log", log_sink, path, logstr)
 
 def postgres_exception_log(logstr):
-    f = open("./postgres_exception.log", "a")
-    f.write(f"\n===EXCEPTION===\n{logstr}\n")
-    f.close()
+    log_record("./postgres_exception.log", f"\n===EXCEPTION===\n{logstr}\n")
 
 def postgres_testing_log(logstr):
-    f = open("./postgres_testing.log", "a")
-    f.write(f"\n===Query Records===\n{logstr}\n")
-    f.close()
+    log_record("./postgres_testing.log", f"\n===Query Records===\n{logstr}\n")
 
 def questdb_exception_log(logstr):
-    f = open("./questdb_exception.log", "a")
-    f.write(f"\n===EXCEPTION===\n{logstr}\n")
-    f.close()
+    log_record("./questdb_exception.log", f"\n===EXCEPTION===\n{logstr}\n")
 
 def questdb_testing_log(logstr):
-    f = open("./questdb_testing.log", "a")
-    f.write(f"\n===Query Records===\n{logstr}\n")
-    f.close()
+    log_record("./questdb_testing.log", f"\n===Query Records===\n{logstr}\n")
 
 def bug_log(logstr):
-    f = open("./bug.log", "a")
-    f.write(f"\n===Bug-inducing Cases===\n{logstr}\n")
-    f.close()
+    log_record("./bug.log", f"\n===Bug-inducing Cases===\n{logstr}\n")
 
 def differential_inputs_log(logstr):
-    f = open("./diff_input.log", "a")
-    f.write(logstr)
-    f.close()
+    log_record("./diff_input.log", logstr)
+
+def input_record(query, testing_round=None):
+    # statements run outside of the pair testing: table setup, comments
+    if record_store is None:
+        differential_inputs_log(str(query)+'\n')
+    else:
+        record_store.append(query, testing_round)
+
+def pair_record(query):
+    # with a record store, run_testing records the pair with its outcome
+    if record_store is None:
+        differential_inputs_log(str([query[0], query[1]])+'\n')
+
+def timeout_log(engine, query, error):
+    metrics.timeout(engine)
+    log_record("./timeout.log", f"\n===Timeout===\nengine:{engine}\nquery:{query}\n{error}\n")
+
+def perf_log(logstr):
+    log_record("./perf.log", f"\n===Possible Performance Bug===\n{logstr}\n")
 
-def questdb_execute_query(questdb_qpi, query):
+def questdb_execute_query(questdb_qpi, query, budget=None):
+    return metrics.timed("questdb", questdb_round_trip, questdb_qpi, query, budget)
+
+def postgres_execute_query(postgre_api, query, budget=None):
+    if result_cache is not None:
+        return metrics.timed("postgres", result_cache.execute, postgres_round_trip, postgre_api, query, budget)
+    return metrics.timed("postgres", postgres_round_trip, postgre_api, query, budget)
+
+def questdb_round_trip(questdb_qpi, query, budget=None):
     if "SELECT " in query:
         try:
-            result = questdb_qpi.query(query)
+            result = questdb_qpi.query_stream(query, budget)
             return result
+        except StatementTimeout as e:
+            timeout_log("questdb", query, e)
+            return -1
         except Exception as e:
             questdb_exception_log(f"\nquery:{query}\n"+str(e))
             return -1
     else:
         try:
-            questdb_qpi.write_query(query)
+            questdb_qpi.write_query(query, budget)
+        except StatementTimeout as e:
+            timeout_log("questdb", query, e)
+            return -1
         except Exception as e:
             questdb_exception_log(f"\nquery:{query}\n"+str(e))
             return -1
         return None
 
-def postgres_execute_query(postgre_api, query):
+def postgres_round_trip(postgre_api, query, budget=None):
     if "SELECT " in query:
         try:
-            result = postgre_api.query(query)
+            result = postgre_api.query_stream(query, budget)
             return result
+        except StatementTimeout as e:
+            timeout_log("postgres", query, e)
+            return -1
         except Exception as e:
-            postgre_api.reconnect()
+            if isinstance(e, CONNECTION_ERRORS):
+                postgre_api.prune()
             postgres_exception_log(f"\nquery:{query}\n"+str(e))
             return -1
     else:
         try:
-            postgre_api.write_query(query)
+            postgre_api.write_query(query, budget)
+        except StatementTimeout as e:
+            timeout_log("postgres", query, e)
+            return -1
         except Exception as e:
-            postgre_api.reconnect()
+            if isinstance(e, CONNECTION_ERRORS):
+                postgre_api.prune()
             postgres_exception_log(f"\nquery:{query}\n"+str(e))
             return -1
         return None
 
+def statement_budgets():
+    return [StatementBudget(None if timeout is None else timeout.current()) for timeout in statement_timeouts]
+
+def differential_execute_query(executor, questdb_api, postgres_api, query, budgets=(None, None)):
+    # both results are joined before returning, so every statement
+    # (DDL/DML included) still finishes on both sides before the next pair
+    if executor is None:
+        questdb_result = questdb_execute_query(questdb_api, query[0], budgets[0])
+        postgres_result = postgres_execute_query(postgres_api, query[1], budgets[1])
+        return questdb_result, postgres_result
+    questdb_future = executor.submit(questdb_execute_query, questdb_api, query[0], budgets[0])
+    postgres_result = postgres_execute_query(postgres_api, query[1], budgets[1])
+    return questdb_future.result(), postgres_result
+
+def close_result(result):
+    # SELECT results are streams holding a pooled connection (or cached rows)
+    if hasattr(result, "close"):
+        result.close()
+
 def result_analysis(query, questdb_result, postgres_result):
+    """
+    returns whether the rows of questdb and postgres could be fetched, and
+    whether the results differ; a statement failing while its rows are
+    streamed (e.g., a failed cast) fails as if its execution had
+    """
     if questdb_result==None or postgres_result==None or questdb_result==-1 or postgres_result==-1:
         bugstr = f"\nQuery:{query}\nnone result\n"
-        return
-    if len(postgres_result)>0:
-        for i in range(len(postgres_result)):
-            postgres_result[i] = list(postgres_result[i])
-            for j in range(len(postgres_result[i])):
-                if type(postgres_result[i][j])==type(decimal.Decimal(0.1)):
-                    postgres_result[i][j] = float(postgres_result[i][j])
-            postgres_result[i] = tuple(postgres_result[i])
-    if set(questdb_result)!=set(postgres_result):
+        close_result(questdb_result)
+        close_result(postgres_result)
+        return (True, True), False
+    try:
+        comparison = compare_streams([questdb_result, postgres_result], EVAL_CONFIG_FETCH_CHUNK)
+    except FetchError as e:
+        if isinstance(e.error, StatementTimeout):
+            timeout_log(ENGINES[e.side], query[e.side], e.error)
+        elif e.side==0:
+            questdb_exception_log(f"\nquery:{query[0]}\n"+str(e))
+        else:
+            postgres_exception_log(f"\nquery:{query[1]}\n"+str(e))
+        fetched = [True, True]
+        fetched[e.side] = False
+        return tuple(fetched), False
+    finally:
+        close_result(questdb_result)
+        close_result(postgres_result)
+    if comparison.differs():
+        fingerprint, details = bug_fingerprint(query, comparison)
         bugstr = f"\nQuestDB Query:{query[0]}\n"
         bugstr += f"\nPostgresDB Query:{query[1]}\n"
-        bugstr += f"\n\tquestdb:{str(set(questdb_result))}"
-        bugstr += f"\n\tpostgres:{str(set(postgres_result))}"
-        bug_log(bugstr)
+        bugstr += f"\n\tquestdb:{comparison.describe(0)}"
+        bugstr += f"\n\tpostgres:{comparison.describe(1)}"
+        bugstr += f"\n\tfingerprint:{fingerprint}"
+        if bug_index.record(fingerprint, details, query, bugstr):
+            bug_log(bugstr)
+    # mismatching pairs are recorded as well: a replay checks them again and
+    # the minimizer finds the statements that ran before them
+    pair_record(query)
+    return (True, True), comparison.differs()
+
+def latency_analysis(query, budgets, successes):
+    # statement latencies feed the adaptive timeouts, a far slower tested
+    # engine is a possible performance bug
+    for timeout, budget, success in zip(statement_timeouts, budgets, successes):
+        if timeout is not None and success and not budget.timed_out and not budget.cached:
+            timeout.observe(budget.elapsed)
+    ratio = slowdown(budgets, successes)
+    if ratio is None or ratio<EVAL_CONFIG_PERF_RATIO or budgets[0].elapsed<EVAL_CONFIG_PERF_MIN_SECONDS:
+        return
+    metrics.slow_pair()
+    perfstr = f"\nQuestDB Query:{query[0]}\n"
+    perfstr += f"\nPostgresDB Query:{query[1]}\n"
+    perfstr += f"\n\tquestdb:{budgets[0].elapsed:.3f}s{' (timed out)' if budgets[0].timed_out else ''}"
+    perfstr += f"\n\tpostgres:{budgets[1].elapsed:.3f}s"
+    perfstr += f"\n\tslowdown:{ratio:.0f}x"
+    perf_log(perfstr)
+
+def differential_testing(executor, questdb_api, postgres_api, query):
+    # returns whether the statement succeeded on questdb and postgres,
+    # and whether their results differ
+    is_select = "SELECT " in query[0] and "SELECT " in query[1]
+    if is_select and EVAL_CONFIG_FINGERPRINT:
+        # summaries that determine both results need no row transfer at all
+        if fingerprint_analysis(executor, questdb_api, postgres_api, query, statement_budgets()):
+            pair_record(query)
+            return True, True, False
+    budgets = statement_budgets()
+    questdb_result, postgres_result = differential_execute_query(executor, questdb_api, postgres_api, query, budgets)
+    fetched, mismatch = (True, True), False
+    if is_select:
+        # rows are streamed, so the comparison includes fetching them
+        fetched, mismatch = metrics.timed("compare", result_analysis, query, questdb_result, postgres_result)
     else:
-        differential_inputs_log(str([query[0], query[1]])+'\n')
+        close_result(questdb_result)
+        close_result(postgres_result)
+        pair_record(query)
+    successes = (questdb_result!=-1 and fetched[0], postgres_result!=-1 and fetched[1])
+    latency_analysis(query, budgets, successes)
+    return successes[0], successes[1], mismatch
+
+# tests one pair, fan-out replaces it to compare a single reference
+# execution against every target
+pair_testing = differential_testing
+
+def set_pair_testing(function):
+    global pair_testing
+    pair_testing = function
+
+def measured_differential_testing(executor, questdb_api, postgres_api, query):
+    started = time.perf_counter()
+    questdb_success, postgres_success, mismatch = pair_testing(executor, questdb_api, postgres_api, query)
+    metrics.pair(query_clauses(query[0]), questdb_success, postgres_success, time.perf_counter()-started)
+    return questdb_success, postgres_success, mismatch
+
+def dispatch_window():
+    # pairs a dispatcher keeps in flight at most before yielding the oldest
+    return 4*EVAL_CONFIG_PIPELINE_EXECUTORS
+
+def executed_pairs(pairs, executor, questdb_api, postgres_api, dispatcher=None):
+    """
+    runs the (query, statement number) pairs, yields them with their
+    (questdb success, postgres success, mismatch), in order even when a
+    dispatcher (pipeline.TableOrderedExecutor) overlaps independent pairs
+    """
+    if dispatcher is None:
+        for query, number in pairs:
+            yield query, number, measured_differential_testing(executor, questdb_api, postgres_api, query)
+        return
+    in_flight = collections.deque()
+    window = dispatch_window()
+    for query, number in pairs:
+        # pairs run one engine after the other, the dispatcher overlaps pairs
+        future = dispatcher.submit(query, measured_differential_testing, None, questdb_api, postgres_api, query)
+        in_flight.append((query, number, future))
+        while len(in_flight)>window or (in_flight and in_flight[0][2].done()):
+            query, number, future = in_flight.popleft()
+            yield query, number, future.result()
+    while in_flight:
+        query, number, future = in_flight.popleft()
+        yield query, number, future.result()
+
+def connect_backend(backend, pool_size, **options):
+    connector = CONNECTORS[backend](pool_size, **options)
+    connector.prepare = EVAL_CONFIG_PREPARED
+    if hasattr(connector, "group_commit"):
+        connector.group_commit = EVAL_CONFIG_GROUP_COMMIT
+    return connector
+
+def adaptive_timeout(limits):
+    return None if limits is None else AdaptiveTimeout(*limits, EVAL_CONFIG_TIMEOUT_PERCENTILE, EVAL_CONFIG_TIMEOUT_FACTOR)
+
+def connect_backends(pool_size):
+    connectors = [connect_backend(backend, pool_size) for backend in EVAL_CONFIG_BACKENDS]
+    set_statement_timeouts([adaptive_timeout(limits) for limits in EVAL_CONFIG_STATEMENT_TIMEOUTS])
+    return connectors
+
+def connection_stats(api):
+    # pool reuse counters, and commits of the connectors with transactions
+    stats = api.pool.stats()
+    if hasattr(api, "transaction_stats"):
+        stats.update(api.transaction_stats())
+    return stats
 
+def rotate_logs():
+    # keep the logs of previous runs as *.log.1, *.log.2, ...
+    for path in LOG_FILES:
+        log_writer.rotate(path)
+    if record_store is not None:
+        record_store.rotate()
+
+def print_testing_stats(questdb_api, postgres_api, testing_round, executed, questdb_success_query_count, postgres_success_query_count):
+    print(f"questdb query success rate:{float(questdb_success_query_count/executed)}")
+    print(f"postgres query success rate:{float(postgres_success_query_count/executed)}")
+    print(f"questdb connections:{connection_stats(questdb_api)}")
+    print(f"postgres connections:{connection_stats(postgres_api)}")
+
+def run_testing(questdb_api, postgres_api, query_generator, executor, report_stats=print_testing_stats, max_rounds=None, show_progress=True):
+    testing_round = 0
+    profile = ProfileHook(EVAL_CONFIG_PROFILE_ITERATIONS, EVAL_CONFIG_PROFILE_MODE)
+    # comment records are skipped by the replayer
+    generator_record = f"-- generator seed={query_generator.seed}"
+    input_record([generator_record, generator_record])
+    seen_queries = SeenQueries(EVAL_CONFIG_DEDUP_CAPACITY, EVAL_CONFIG_DEDUP_ERROR_RATE) if EVAL_CONFIG_DEDUP else None
+    # a separate stream, dedup decisions must not change the generated queries
+    dedup_rng = random.Random(query_generator.seed)
+    scheduler = query_generator.scheduler
+    table_manager = TableManager(questdb_api, postgres_api, query_generator.table_prefix,
+                                 EVAL_CONFIG_ROUND_TABLES, EVAL_CONFIG_SEED_TEMPLATES)
+    dispatcher = TableOrderedExecutor(EVAL_CONFIG_PIPELINE_EXECUTORS) if EVAL_CONFIG_PIPELINE_EXECUTORS>1 else None
+    # statements generated but not yet reported at most: the queue, the pairs
+    # in flight and the one being generated
+    feedback_lag = max(EVAL_CONFIG_PIPELINE_DEPTH, 0)+(0 if dispatcher is None else dispatch_window())+1
+    feedback = None
+
+    def produce_pair():
+        # runs on the producer thread: generation, mapping and dedup; the
+        # scheduler weights only change here, in statement order
+        if feedback is not None:
+            feedback.before()
+        statement = metrics.timed("generate", query_generator.random_statement)
+        query = metrics.timed("mapping", query_generator.render, statement)
+        number = None if feedback is None else feedback.detach()
+        # print(query)
+        if seen_queries is not None and seen_queries.check(query) and dedup_rng.random()>=EVAL_CONFIG_DEDUP_KEEP:
+            metrics.duplicate()
+            if feedback is not None:
+                feedback.skipped(number)
+            return None
+        return query, number
+
+    if EVAL_CONFIG_TABLE_SWEEP:
+        table_manager.sweep()
+    try:
+        while max_rounds is None or testing_round<max_rounds:
+            tables, table1_query, table2_query, table3_query = table_manager.new_round(query_generator)
+            # the setup statements belong to the round they start
+            input_record([f"DROP TABLE IF EXISTS {tables[0]}",f"DROP TABLE IF EXISTS {tables[0]}"], testing_round+1)
+            input_record([f"DROP TABLE IF EXISTS {tables[1]}",f"DROP TABLE IF EXISTS {tables[1]}"], testing_round+1)
+            input_record([f"DROP TABLE IF EXISTS {tables[2]}",f"DROP TABLE IF EXISTS {tables[2]}"], testing_round+1)
+            input_record(table1_query, testing_round+1)
+            input_record(table2_query, testing_round+1)
+            input_record(table3_query, testing_round+1)
+            if EVAL_CONFIG_SEED_ROWS>0:
+                seed_spec = SeedSpec(EVAL_CONFIG_SEED_ROWS, **EVAL_CONFIG_SEED_DISTRIBUTION)
+                seeds = table_manager.seed(tables, seed_spec, query_generator.rng, *EVAL_CONFIG_SEED_METHODS)
+                for table in tables:
+                    # the rows are not logged, they are regenerated from the seed
+                    seed_record = f"-- seed {table} rows={EVAL_CONFIG_SEED_ROWS} seed={seeds[table]}"
+                    input_record([seed_record, seed_record], testing_round+1)
+            testing_round += 1
+            if show_progress:
+                print(f"testing round {testing_round}")
+            if seen_queries is not None:
+                # the tables of the previous round are gone
+                seen_queries.reset()
+            if result_cache is not None:
+                result_cache.reset()
+            executed = 0
+            questdb_success_query_count = 0
+            postgres_success_query_count = 0
+            producer = PairProducer(produce_pair, EVAL_CONFIG_ROUND_QUERIES, EVAL_CONFIG_PIPELINE_DEPTH)
+            if scheduler is not None:
+                feedback = DelayedFeedback(scheduler, feedback_lag, producer.stopped)
+            pairs = tqdm(producer, total=EVAL_CONFIG_ROUND_QUERIES) if show_progress else producer
+            for query, number, outcome in executed_pairs(pairs, executor, questdb_api, postgres_api, dispatcher):
+                profile.step()
+                questdb_success, postgres_success, mismatch = outcome
+                if feedback is not None:
+                    feedback.feedback(number, query, questdb_success, postgres_success, mismatch)
+                executed += 1
+                questdb_success_query_count += questdb_success
+                postgres_success_query_count += postgres_success
+                if executed%100==1:
+                    report_stats(questdb_api, postgres_api, testing_round, executed, questdb_success_query_count, postgres_success_query_count)
+                    metrics.set_pipeline(producer.stats())
+                    metrics.set_connections([connection_stats(questdb_api), connection_stats(postgres_api)])
+                if record_store is None:
+                    questdb_testing_log(query[0])
+                    postgres_testing_log(query[1])
+                else:
+                    record_store.append(query, testing_round, pair_outcome(questdb_success, postgres_success, mismatch))
+                metrics.set_statement_timeouts([None if timeout is None else timeout.current() for timeout in statement_timeouts])
+                metrics.maybe_export()
+            report_stats(questdb_api, postgres_api, testing_round, executed, questdb_success_query_count, postgres_success_query_count)
+            if feedback is not None:
+                # the producer is done, the last statements of the round are rewarded
+                feedback.finish()
+            if seen_queries is not None and show_progress:
+                print(f"duplicate rate:{seen_queries.duplicate_rate()}")
+            if result_cache is not None:
+                if show_progress:
+                    print(f"reference cache hit rate:{result_cache.stats()['hit_rate']}")
+                metrics.set_result_cache(result_cache.stats())
+            pipeline_stats = producer.stats()
+            if show_progress:
+                print(f"pipeline: {pipeline_stats['bottleneck']} bound, mean queue depth {pipeline_stats['mean_depth']:.1f}/{pipeline_stats['capacity']}")
+            metrics.set_pipeline(pipeline_stats)
+            metrics.set_connections([connection_stats(questdb_api), connection_stats(postgres_api)])
+            metrics.export()
+            if record_store is not None:
+                record_store.flush()
+            table_manager.end_round()
+    finally:
+        if dispatcher is not None:
+            dispatcher.shutdown()
+        # also on errors and interrupts, no orphan tables are left behind
+        table_manager.close(EVAL_CONFIG_TABLE_SWEEP)
+    # fewer queries than EVAL_CONFIG_PROFILE_ITERATIONS were run
+    profile.finish()
 
 def main():
-    if os.path.exists("./postgres_testing.log"):
-        os.system("mv ./postgres_testing.log /tmp")
-    if os.path.exists("./postgres_exception.log"):
-        os.system("mv ./postgres_exception.log /tmp")
-    if os.path.exists("./questdb_testing.log"):
-        os.system("mv ./questdb_testing.log /tmp")
-    if os.path.exists("./questdb_exception.log"):
-        os.system("mv ./questdb_exception.log /tmp")
-    if os.path.exists("./bug.log"):
-        os.system("mv ./bug.log /tmp")
-    if os.path.exists("./diff_input.log"):
-        os.system("mv ./diff_input.log /tmp")
+    rotate_logs()
     """
     this is a demo code for testing one emerging database system QuestDB
     with the reference to mature relational database system Postgres
     """
-    questdb_api = QuestDBConnector()
-    postgres_api = PostgresConnector()
+    questdb_api, postgres_api = connect_backends(EVAL_CONFIG_POOL_SIZE)
     # step 1: get shared clauses
     shared_clauses = clauses_identifying(questdb_api, postgres_api)
     # step 2: extend the set of shated clauses via clause mappings
     # step 3: generate differential inputs for testing
-    query_generator = QueryGenerator(shared_clauses, EVAL_CONFIG_CLAUSE_MAPPING)
+    scheduler = Scheduler(EVAL_CONFIG_SCHEDULER_WEIGHTS) if EVAL_CONFIG_SCHEDULER else None
+    query_generator = QueryGenerator(shared_clauses, EVAL_CONFIG_CLAUSE_MAPPING, table_prefix=EVAL_CONFIG_TABLE_PREFIX, seed=EVAL_CONFIG_SEED,
+                                     dialects=EVAL_CONFIG_BACKENDS, scheduler=scheduler)
+    print(f"generator seed {query_generator.seed}")
     # step 4: testing and analyzing
-    testing_round = 0
-    while True:
-        tables, table1_query, table2_query, table3_query = query_generator.init_table(questdb_api, postgres_api)
-        differential_inputs_log(str([f"DROP TABLE IF EXISTS {tables[0]}",f"DROP TABLE IF EXISTS {tables[0]}"])+'\n')
-        differential_inputs_log(str([f"DROP TABLE IF EXISTS {tables[1]}",f"DROP TABLE IF EXISTS {tables[1]}"])+'\n')
-        differential_inputs_log(str([f"DROP TABLE IF EXISTS {tables[2]}",f"DROP TABLE IF EXISTS {tables[2]}"])+'\n')
-        differential_inputs_log(str(table1_query)+'\n')
-        differential_inputs_log(str(table2_query)+'\n')
-        differential_inputs_log(str(table3_query)+'\n')
-        testing_round += 1
-        print(f"testing round {testing_round}")
-        questdb_success_query_count = 0
-        postgres_success_query_count = 0
-        for i in tqdm(range(2000)):
-            query = query_generator.random_query()
-            # print(query)
-            questdb_result = questdb_execute_query(questdb_api, query[0])
-            if questdb_result!=-1:
-                questdb_success_query_count+=1
-            postgres_result = postgres_execute_query(postgres_api, query[1])
-            if postgres_result!=-1:
-                postgres_success_query_count+=1
-            if "SELECT " in query[0] and "SELECT " in query[1]:
-                result_analysis(query, questdb_result, postgres_result)
-            else:
-                differential_inputs_log(str(query)+'\n')
-            if i%100==0:
-                print(f"questdb query success rate:{float(questdb_success_query_count/(i+1))}")
-                print(f"postgres query success rate:{float(postgres_success_query_count/(i+1))}")
-            questdb_testing_log(query[0])
-            postgres_testing_log(query[1])
-
-main()
+    # named for the profiler, see metrics.PROFILED_THREADS
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="questdb") if EVAL_CONFIG_CONCURRENT_EXECUTION else None
+    run_testing(questdb_api, postgres_api, query_generator, executor)
+
+if __name__ == "__main__":
+    main()
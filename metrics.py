@@ -0,0 +1,340 @@
+"""
+hot-path metrics of the fuzzing loop
+per-stage latency histograms, throughput and per-engine error counters,
+broken down by the clauses a pair uses; snapshots are exported as JSON
+and as a Prometheus text file (node_exporter textfile format)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import bisect
+import cProfile
+import threading
+import collections
+
+# histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DEFAULT_EXPORT_INTERVAL = 10
+# generation, mapping (per-dialect rendering), engine round-trips,
+# result comparison (row fetches included) and logging
+STAGES = ("generate", "mapping", "questdb", "postgres", "compare", "log")
+ENGINES = ("questdb", "postgres")
+# threads of the testing loop sampled besides the one running it (name
+# prefixes): the pair producer and executors, the questdb executor and the
+# fan-out targets
+PROFILED_THREADS = ("pair", "questdb", "target")
+# "pair_3" -> "pair"
+WORKER_NUMBER = re.compile(r"_\d+$")
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0]*(len(LATENCY_BUCKETS)+1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def snapshot(self):
+        buckets = {str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {"count": self.count, "sum": self.total, "buckets": buckets}
+
+class Metrics:
+    """
+    path: files are written to <path>.json and <path>.prom
+    labels: constant labels of every exported series (e.g., the campaign worker)
+    """
+
+    def __init__(self, path="./metrics", labels=None, export_interval=DEFAULT_EXPORT_INTERVAL):
+        self.path = path
+        self.labels = labels or {}
+        self.export_interval = export_interval
+        self.lock = threading.Lock()
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.pairs = 0
+        # repeated SELECT pairs that were not executed
+        self.duplicates = 0
+        self.statements = {engine: 0 for engine in ENGINES}
+        self.errors = {engine: 0 for engine in ENGINES}
+        # statements cancelled past their timeout, and the current timeouts
+        self.timeouts = {engine: 0 for engine in ENGINES}
+        self.statement_timeouts = {}
+        # pairs flagged as possible performance bugs
+        self.slow_pairs = 0
+        # queue depth and backpressure of the pair pipeline (pipeline.PairProducer.stats)
+        self.pipeline = {}
+        # engine -> connection reuse and transaction counters of its connector
+        self.connections = {}
+        # reference result cache counters (result_cache.ResultCache.stats)
+        self.result_cache = {}
+        # fan-out target -> statements, errors, mismatches and slow pairs (fanout.Target.stats)
+        self.targets = {}
+        # clause -> [pairs, questdb errors, postgres errors, pair seconds]
+        self.clauses = collections.defaultdict(lambda: [0, 0, 0, 0.0])
+        self.started = time.monotonic()
+        self.exported_at = self.started
+        self.exported_pairs = 0
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].observe(seconds)
+
+    def timed(self, stage, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.observe(stage, time.perf_counter()-started)
+
+    def duplicate(self):
+        with self.lock:
+            self.duplicates += 1
+
+    def timeout(self, engine):
+        # engine: also the name of a fan-out target
+        with self.lock:
+            self.timeouts[engine] = self.timeouts.get(engine, 0)+1
+
+    def slow_pair(self):
+        with self.lock:
+            self.slow_pairs += 1
+
+    def set_statement_timeouts(self, timeouts):
+        with self.lock:
+            self.statement_timeouts = {engine: seconds for engine, seconds in zip(ENGINES, timeouts) if seconds is not None}
+
+    def set_connections(self, stats):
+        with self.lock:
+            self.connections = dict(zip(ENGINES, stats))
+
+    def set_result_cache(self, stats):
+        with self.lock:
+            self.result_cache = stats
+
+    def set_targets(self, stats):
+        with self.lock:
+            self.targets = stats
+
+    def set_pipeline(self, stats):
+        with self.lock:
+            self.pipeline = stats
+
+    def pair(self, clauses, questdb_success, postgres_success, seconds):
+        with self.lock:
+            self.pairs += 1
+            for engine, success in zip(ENGINES, (questdb_success, postgres_success)):
+                self.statements[engine] += 1
+                self.errors[engine] += not success
+            for clause in clauses:
+                counters = self.clauses[clause]
+                counters[0] += 1
+                counters[1] += not questdb_success
+                counters[2] += not postgres_success
+                counters[3] += seconds
+
+    def snapshot(self):
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(now-self.started, 1e-9)
+            interval = max(now-self.exported_at, 1e-9)
+            return {
+                "labels": self.labels,
+                "uptime": elapsed,
+                "pairs": self.pairs,
+                "duplicates_skipped": self.duplicates,
+                "pairs_per_second": self.pairs/elapsed,
+                "recent_pairs_per_second": (self.pairs-self.exported_pairs)/interval,
+                "statements_per_second": sum(self.statements.values())/elapsed,
+                "statements": dict(self.statements),
+                "errors": dict(self.errors),
+                "error_rate": {engine: self.errors[engine]/max(self.statements[engine], 1) for engine in ENGINES},
+                "timeouts": dict(self.timeouts),
+                "statement_timeout": dict(self.statement_timeouts),
+                "slow_pairs": self.slow_pairs,
+                "pipeline": dict(self.pipeline),
+                "result_cache": dict(self.result_cache),
+                "targets": {target: dict(counters) for target, counters in self.targets.items()},
+                "connections": {engine: dict(counters) for engine, counters in self.connections.items()},
+                "stages": {stage: histogram.snapshot() for stage, histogram in self.stages.items()},
+                "clauses": {
+                    clause: {
+                        "pairs": pairs,
+                        "questdb_errors": questdb_errors,
+                        "postgres_errors": postgres_errors,
+                        "seconds": seconds,
+                    }
+                    for clause, (pairs, questdb_errors, postgres_errors, seconds) in self.clauses.items()
+                },
+            }
+
+    def prometheus(self, snapshot):
+        def series(name, value, **labels):
+            labels = dict(self.labels, **labels)
+            label_text = ",".join(f'{key}="{text}"' for key, text in labels.items())
+            return f"fuzz_{name}{{{label_text}}} {value}" if label_text else f"fuzz_{name} {value}"
+        lines = [
+            "# TYPE fuzz_pairs_total counter", series("pairs_total", snapshot["pairs"]),
+            "# TYPE fuzz_duplicates_skipped_total counter", series("duplicates_skipped_total", snapshot["duplicates_skipped"]),
+            "# TYPE fuzz_statements_total counter",
+        ]
+        lines += [series("statements_total", count, engine=engine) for engine, count in snapshot["statements"].items()]
+        lines.append("# TYPE fuzz_errors_total counter")
+        lines += [series("errors_total", count, engine=engine) for engine, count in snapshot["errors"].items()]
+        lines.append("# TYPE fuzz_timeouts_total counter")
+        lines += [series("timeouts_total", count, engine=engine) for engine, count in snapshot["timeouts"].items()]
+        lines.append("# TYPE fuzz_statement_timeout_seconds gauge")
+        lines += [series("statement_timeout_seconds", seconds, engine=engine)
+                  for engine, seconds in snapshot["statement_timeout"].items()]
+        lines += ["# TYPE fuzz_slow_pairs_total counter", series("slow_pairs_total", snapshot["slow_pairs"])]
+        lines.append("# TYPE fuzz_connection_events_total counter")
+        lines += [series("connection_events_total", count, engine=engine, event=event)
+                  for engine, counters in snapshot["connections"].items() for event, count in counters.items()]
+        result_cache = snapshot["result_cache"]
+        if result_cache:
+            lines.append("# TYPE fuzz_result_cache_lookups_total counter")
+            lines += [series("result_cache_lookups_total", result_cache[outcome], outcome=outcome[:-1])
+                      for outcome in ("hits", "misses")]
+            lines += [
+                "# TYPE fuzz_result_cache_evictions_total counter", series("result_cache_evictions_total", result_cache["evictions"]),
+                "# TYPE fuzz_result_cache_rows gauge", series("result_cache_rows", result_cache["rows"]),
+            ]
+        if snapshot["targets"]:
+            for name in ("statements", "errors", "mismatches", "slow_pairs"):
+                lines.append(f"# TYPE fuzz_target_{name}_total counter")
+                lines += [series(f"target_{name}_total", counters[name], target=target)
+                          for target, counters in snapshot["targets"].items()]
+        pipeline = snapshot["pipeline"]
+        if pipeline:
+            lines += [
+                "# TYPE fuzz_pipeline_depth gauge", series("pipeline_depth", pipeline["depth"]),
+                "# TYPE fuzz_pipeline_mean_depth gauge", series("pipeline_mean_depth", pipeline["mean_depth"]),
+                "# TYPE fuzz_pipeline_blocked_seconds counter",
+                series("pipeline_blocked_seconds", pipeline["producer_blocked_seconds"], side="producer"),
+                series("pipeline_blocked_seconds", pipeline["consumer_starved_seconds"], side="consumer"),
+            ]
+        lines.append("# TYPE fuzz_stage_seconds histogram")
+        for stage, histogram in snapshot["stages"].items():
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(series("stage_seconds_bucket", cumulative, stage=stage, le=bound))
+            lines.append(series("stage_seconds_sum", histogram["sum"], stage=stage))
+            lines.append(series("stage_seconds_count", histogram["count"], stage=stage))
+        for name in ("pairs", "questdb_errors", "postgres_errors", "seconds"):
+            lines.append(f"# TYPE fuzz_clause_{name}_total counter")
+            lines += [series(f"clause_{name}_total", counters[name], clause=clause)
+                      for clause, counters in snapshot["clauses"].items()]
+        return '\n'.join(lines)+'\n'
+
+    def export(self):
+        snapshot = self.snapshot()
+        for suffix, text in ((".json", json.dumps(snapshot, indent=1)), (".prom", self.prometheus(snapshot))):
+            # scrapers must never read half a file
+            with open(self.path+suffix+".tmp", "w") as f:
+                f.write(text)
+            os.replace(self.path+suffix+".tmp", self.path+suffix)
+        with self.lock:
+            self.exported_at = time.monotonic()
+            self.exported_pairs = self.pairs
+        return snapshot
+
+    def maybe_export(self):
+        if time.monotonic()-self.exported_at>=self.export_interval:
+            self.export()
+
+class SamplingProfiler:
+    """
+    samples the stacks of one thread, and of the threads whose names start
+    with one of thread_prefixes, at a fixed interval and writes them as
+    folded stacks ("thread;frame;frame;frame count"), the input of
+    flamegraph.pl and speedscope; numbered workers of a pool share a root
+    """
+
+    def __init__(self, thread_id, interval=0.005, thread_prefixes=()):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+
+    def _sampled_threads(self):
+        # thread id -> root of its stacks; threads (e.g., the pair producer) start and end while sampling
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        threads = {ident: WORKER_NUMBER.sub("", name) for ident, name in names.items()
+                   if self.thread_prefixes and name.startswith(self.thread_prefixes)}
+        threads[self.thread_id] = names.get(self.thread_id, "main")
+        return threads
+
+    def _sample_loop(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, root in self._sampled_threads().items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(root)
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self, path):
+        self.stopped.set()
+        self.sampler.join()
+        with open(path, "w") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+
+class ProfileHook:
+    """
+    opt-in profiling of the first iterations of the loop
+    mode "cprofile" writes <path>.pstats, of the thread calling step only;
+    mode "sampling" writes <path>.folded, of that thread and of the threads
+    named by thread_prefixes (generation and execution threads)
+    """
+
+    def __init__(self, iterations, mode="sampling", path="./profile", thread_prefixes=PROFILED_THREADS):
+        self.iterations = iterations
+        self.mode = mode
+        self.path = path
+        self.thread_prefixes = thread_prefixes
+        self.seen = 0
+        self.profiler = None
+
+    def step(self):
+        # called once before every iteration
+        if self.seen==0 and self.iterations>0:
+            if self.mode=="cprofile":
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            else:
+                self.profiler = SamplingProfiler(threading.get_ident(), thread_prefixes=self.thread_prefixes)
+                self.profiler.start()
+        elif self.seen==self.iterations and self.profiler is not None:
+            self.finish()
+        self.seen += 1
+
+    def finish(self):
+        if self.profiler is None:
+            return
+        if self.mode=="cprofile":
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path+".pstats")
+            print(f"profile written to {self.path}.pstats")
+        else:
+            self.profiler.stop(self.path+".folded")
+            print(f"profile written to {self.path}.folded")
+        self.profiler = None
@@ -0,0 +1,364 @@
+"""
+automatic reduction of bug-inducing query pairs
+
+    python minimizer.py [--bug-log ./bug.log] [--diff-input ./records] [--record N]
+
+for every bug.log record, the statements that ran before it (recorded in
+the record store or diff_input.log) are replayed to rebuild its tables, then set operations,
+joins, predicates and casts are removed from both queries in lockstep as
+long as the engines still disagree. the candidates of one step are run in
+parallel on pooled connections and every outcome is memoized by the
+normalized query text
+"""
+
+import re
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import main
+from driver import *
+from result_compare import compare_streams
+from seeding import SeedSpec, seed_table
+from replay import parse_seed_record
+from record_store import read_pairs
+
+MINIMIZER_WORKERS = 8
+
+BUG_RECORD = re.compile(r"QuestDB Query:(.*)\n\nPostgresDB Query:(.*)\n")
+# the table a recorded write statement (or seed record) targets
+WRITE_TARGET = re.compile(r"(?:TABLE(?: IF EXISTS)?|INTO|UPDATE|-- seed) (\w+)")
+# casts of columns added by the generator, e.g. CAST(T1.c1 AS VARCHAR(64))
+COLUMN_CAST = re.compile(r"CAST\(((?:T\d+\.)?c\d) AS [A-Z]+(?:\(\d+\))?\)")
+SET_OPERATORS = (" UNION ", " EXCEPT ", " INTERSECT ")
+JOIN_KINDS = (" CROSS JOIN ", " INNER JOIN ", " JOIN ")
+# the postgres mapping of SAMPLE BY wraps the sampled SELECT
+SAMPLE_BY_WRAP = ("SELECT sample_by_result FROM (", ") AS sample_by")
+
+def read_bug_records(path):
+    with open(path) as f:
+        text = f.read()
+    return [list(match) for match in BUG_RECORD.findall(text)]
+
+def normalize(query):
+    return ' '.join(query.split())
+
+"""
+0. query structure
+generated queries are split on their top-level separators only,
+everything inside parentheses, quotes and CASE ... END is masked
+"""
+
+def mask(query):
+    masked = []
+    depth = 0
+    quoted = False
+    i = 0
+    while i<len(query):
+        c = query[i]
+        if quoted:
+            quoted = c!="'"
+            masked.append('#')
+        elif c=="'":
+            quoted = True
+            masked.append('#')
+        elif c=='(':
+            depth += 1
+            masked.append('#')
+        elif c==')':
+            depth -= 1
+            masked.append('#')
+        elif query.startswith("CASE ", i) and (i==0 or not query[i-1].isalnum()):
+            depth += 1
+            masked.append('#'*4)
+            i += 4
+            continue
+        elif query.startswith("END", i) and depth>0 and query[i-1]==' ' and not query[i+3:i+4].isalnum():
+            depth -= 1
+            masked.append('#'*3)
+            i += 3
+            continue
+        else:
+            masked.append(c if depth==0 else '#')
+        i += 1
+    return ''.join(masked)
+
+def find_top(masked, needles, start=0):
+    # the first top-level needle: (position, needle), or (-1, None)
+    found = (-1, None)
+    for needle in needles:
+        pos = masked.find(needle, start)
+        if pos!=-1 and (found[0]==-1 or pos<found[0]):
+            found = (pos, needle)
+    return found
+
+def split_conjuncts(text):
+    masked = mask(text)
+    parts = []
+    last = 0
+    pos = masked.find(" AND ")
+    between_ands = 0
+    while pos!=-1:
+        # the first AND after a top-level BETWEEN belongs to the BETWEEN
+        if masked[last:pos].count(" BETWEEN ")>between_ands:
+            between_ands += 1
+        else:
+            parts.append(text[last:pos])
+            last = pos+5
+            between_ands = 0
+        pos = masked.find(" AND ", pos+5)
+    parts.append(text[last:])
+    return parts
+
+class SelectParts:
+    """
+    SELECT <data> FROM <table> [joins] [WHERE <conjuncts>] <rest>
+    joins: [join head, ON conjuncts or None]
+    """
+
+    def __init__(self, query):
+        self.wrap = None
+        if query.startswith(SAMPLE_BY_WRAP[0]) and query.endswith(SAMPLE_BY_WRAP[1]):
+            self.wrap = SAMPLE_BY_WRAP
+            query = query[len(SAMPLE_BY_WRAP[0]):-len(SAMPLE_BY_WRAP[1])]
+        masked = mask(query)
+        from_pos = masked.find(" FROM ")
+        where_pos = masked.find(" WHERE ")
+        rest_pos, _ = find_top(masked, (" SAMPLE BY ", " GROUP BY "), max(where_pos, 0))
+        end = len(query) if rest_pos==-1 else rest_pos
+        self.rest = query[end:]
+        body_end = end if where_pos==-1 else where_pos
+        self.where = None if where_pos==-1 else split_conjuncts(query[where_pos+7:end])
+        join_pos, kind = find_top(masked, JOIN_KINDS, from_pos)
+        if join_pos==-1 or join_pos>body_end:
+            self.head = query[:body_end]
+            self.joins = []
+            return
+        self.head = query[:join_pos]
+        self.joins = []
+        while join_pos!=-1 and join_pos<body_end:
+            next_pos, next_kind = find_top(masked, JOIN_KINDS, join_pos+len(kind))
+            join_end = body_end if next_pos==-1 or next_pos>body_end else next_pos
+            join = query[join_pos:join_end]
+            on_pos = mask(join).find(" ON ")
+            if on_pos==-1:
+                self.joins.append([join, None])
+            else:
+                self.joins.append([join[:on_pos], split_conjuncts(join[on_pos+4:])])
+            join_pos, kind = next_pos, next_kind
+
+    def shape(self):
+        # the SAMPLE BY wrap only exists on the postgres side
+        return (len(self.where or []),
+                [None if on is None else len(on) for _, on in self.joins])
+
+    def render(self):
+        query = self.head
+        for join, on in self.joins:
+            query += join if on is None else f"{join} ON {' AND '.join(on)}"
+        if self.where is not None:
+            query += f" WHERE {' AND '.join(self.where)}"
+        query += self.rest
+        if self.wrap is not None:
+            query = f"{self.wrap[0]}{query}{self.wrap[1]}"
+        return query
+
+def parse(query):
+    # (left) OP (right) -> [left, op, right], a SELECT -> SelectParts
+    if query.startswith("("):
+        masked = mask(query)
+        pos, operator = find_top(masked, SET_OPERATORS)
+        if pos!=-1:
+            return [parse(query[1:pos-1]), operator, parse(query[pos+len(operator)+1:-1])]
+    return SelectParts(query)
+
+def render(node):
+    if isinstance(node, list):
+        return f"({render(node[0])}){node[1]}({render(node[2])})"
+    return node.render()
+
+def shape(node):
+    if isinstance(node, list):
+        return [shape(node[0]), node[1], shape(node[2])]
+    return node.shape()
+
+"""
+1. reduction candidates
+one reduction is applied to both queries of the pair at the same place
+"""
+
+def reductions(node, path=()):
+    if isinstance(node, list):
+        # keep either side of a set operation
+        yield ("keep", path, 0)
+        yield ("keep", path, 2)
+        yield from reductions(node[0], path+(0,))
+        yield from reductions(node[2], path+(2,))
+        return
+    for j, (_, on) in enumerate(node.joins):
+        yield ("join", path, j)
+    if node.where is not None:
+        yield ("where", path, None)
+        if len(node.where)>1:
+            for k in range(len(node.where)):
+                yield ("where", path, k)
+    for j, (_, on) in enumerate(node.joins):
+        if on is not None and len(on)>1:
+            for k in range(len(on)):
+                yield ("on", path, (j, k))
+
+def apply_reduction(node, reduction):
+    kind, path, index = reduction
+    if len(path)>0:
+        node = list(node)
+        node[path[0]] = apply_reduction(node[path[0]], (kind, path[1:], index))
+        return node
+    if kind=="keep":
+        return node[index]
+    select = SelectParts.__new__(SelectParts)
+    select.wrap, select.head, select.rest = node.wrap, node.head, node.rest
+    select.joins = [[join, None if on is None else list(on)] for join, on in node.joins]
+    select.where = None if node.where is None else list(node.where)
+    if kind=="join":
+        del select.joins[index]
+    elif kind=="where" and index is None:
+        select.where = None
+    elif kind=="where":
+        del select.where[index]
+    else:
+        del select.joins[index[0]][1][index[1]]
+    return select
+
+def cast_reductions(pair):
+    counts = [len(COLUMN_CAST.findall(query)) for query in pair]
+    if counts[0]!=counts[1]:
+        return []
+    return [("cast", (), i) for i in range(counts[0])]
+
+def remove_cast(query, index):
+    matches = list(COLUMN_CAST.finditer(query))
+    match = matches[index]
+    return query[:match.start()]+match.group(1)+query[match.end():]
+
+def candidates(pair):
+    trees = [parse(query) for query in pair]
+    result = []
+    # structural reductions need both queries to have the same structure
+    if shape(trees[0])==shape(trees[1]):
+        for reduction in reductions(trees[0]):
+            result.append([render(apply_reduction(tree, reduction)) for tree in trees])
+    for _, _, index in cast_reductions(pair):
+        result.append([remove_cast(query, index) for query in pair])
+    return result
+
+"""
+2. evaluation
+"""
+
+class Minimizer:
+    def __init__(self, questdb_api, postgres_api, workers=MINIMIZER_WORKERS):
+        self.questdb_api = questdb_api
+        self.postgres_api = postgres_api
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # normalized pair -> still mismatching (None: failed to execute)
+        self.memo = {}
+        self.executed = 0
+
+    def mismatches(self, pair):
+        streams = []
+        try:
+            streams.append(self.questdb_api.query_stream(pair[0]))
+            streams.append(self.postgres_api.query_stream(pair[1]))
+            return compare_streams(streams, main.EVAL_CONFIG_FETCH_CHUNK).differs()
+        except Exception:
+            return None
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def evaluate(self, pairs):
+        keys = [(normalize(pair[0]), normalize(pair[1])) for pair in pairs]
+        todo = {}
+        for key, pair in zip(keys, pairs):
+            if key not in self.memo and key not in todo:
+                todo[key] = self.executor.submit(self.mismatches, pair)
+        for key, future in todo.items():
+            self.memo[key] = future.result()
+            self.executed += 1
+        return [self.memo[key] for key in keys]
+
+    def minimize(self, pair):
+        if not self.evaluate([pair])[0]:
+            return None
+        while True:
+            options = [candidate for candidate in candidates(pair) if candidate!=pair]
+            outcomes = self.evaluate(options)
+            reduced = [candidate for candidate, outcome in zip(options, outcomes) if outcome]
+            if len(reduced)==0:
+                return pair
+            # the smallest mismatching candidate of this step
+            pair = min(reduced, key=lambda candidate: len(candidate[0])+len(candidate[1]))
+
+    def close(self):
+        self.executor.shutdown()
+
+"""
+3. setup: the recorded statements the bug depends on
+"""
+
+def setup_records(diff_input_path, pair):
+    """
+    the write statements and table seeds recorded before the pair,
+    restricted to the tables the pair reads
+    """
+    records = []
+    found = False
+    for record in read_pairs(diff_input_path):
+        if record==pair:
+            found = True
+            break
+        if "SELECT " in record[0] and "SELECT " in record[1]:
+            continue
+        records.append(record)
+    if not found:
+        print("bug pair not found in the recorded inputs, using all recorded writes")
+    tables = set()
+    for query in pair:
+        tables.update(re.findall(r"\w+", query))
+    return [record for record in records if WRITE_TARGET.search(record[0]) and WRITE_TARGET.search(record[0]).group(1) in tables]
+
+def run_setup(questdb_api, postgres_api, records):
+    for record in records:
+        if record[0].startswith("-- seed "):
+            table, rows, seed = parse_seed_record(record[0])
+            seed_spec = SeedSpec(rows, **main.EVAL_CONFIG_SEED_DISTRIBUTION)
+            seed_table(questdb_api, postgres_api, table, seed_spec, seed, *main.EVAL_CONFIG_SEED_METHODS)
+        elif not record[0].startswith("--"):
+            main.questdb_execute_query(questdb_api, record[0])
+            main.postgres_execute_query(postgres_api, record[1])
+
+def minimize_records(bug_log_path, diff_input_path, record=None, workers=MINIMIZER_WORKERS):
+    pairs = read_bug_records(bug_log_path)
+    if record is not None:
+        pairs = [pairs[record]]
+    questdb_api, postgres_api = main.connect_backends(workers+1)
+    minimizer = Minimizer(questdb_api, postgres_api, workers)
+    try:
+        for pair in pairs:
+            run_setup(questdb_api, postgres_api, setup_records(diff_input_path, pair))
+            reduced = minimizer.minimize(pair)
+            if reduced is None:
+                print(f"\nnot reproduced:\n{pair[0]}\n")
+                continue
+            print(f"\nQuestDB Query:{reduced[0]}\nPostgresDB Query:{reduced[1]}")
+            print(f"({len(pair[0])} -> {len(reduced[0])} chars, {minimizer.executed} pairs executed)")
+    finally:
+        minimizer.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="reduce bug-inducing query pairs")
+    parser.add_argument("--bug-log", default="./bug.log")
+    parser.add_argument("--diff-input", default=main.EVAL_CONFIG_RECORD_STORE or "./diff_input.log",
+                        help="a record store directory or a diff_input.log")
+    parser.add_argument("--record", type=int, default=None, help="only the N-th bug.log record")
+    parser.add_argument("--workers", type=int, default=MINIMIZER_WORKERS)
+    args = parser.parse_args()
+    minimize_records(args.bug_log, args.diff_input, args.record, args.workers)
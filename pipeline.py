@@ -0,0 +1,193 @@
+"""
+pipelined generation and execution of the differential pairs
+a producer thread generates, maps and deduplicates the pairs of a round
+ahead of execution into a bounded queue, so that the databases do not
+wait for the generator and the generator does not wait for the databases
+pairs can also run on several threads at once: a pair only starts once
+every earlier pair touching the same table has finished, when one of
+them writes it (an INSERT finishes on both engines before any later
+SELECT reading its table starts, and the other way round)
+the time the producer is blocked on a full queue (execution is the
+bottleneck) and the consumer waits on an empty one (generation is the
+bottleneck) are reported with the queue depth
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dedup import statement_tables
+
+DEFAULT_DEPTH = 256
+# finished readers of a table are pruned once it has this many
+READERS_PRUNE = 64
+# seconds between checks of a blocked producer for a stopped consumer
+PRODUCER_POLL = 0.1
+
+class ProducerError(Exception):
+    # the producer thread failed, the original error is the cause
+    pass
+
+_END = object()
+
+class PairProducer:
+    """
+    produce: called count times, returns an item or None (e.g., a skipped
+    duplicate); iterating yields the items in production order
+    depth 0 produces inline, without a thread or a queue
+    """
+
+    def __init__(self, produce, count, depth=DEFAULT_DEPTH):
+        self.produce = produce
+        self.count = count
+        self.depth = depth
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.produced = 0
+        self.consumed = 0
+        # producer seconds blocked on a full queue, consumer seconds on an empty one
+        self.producer_blocked = 0.0
+        self.consumer_starved = 0.0
+        # sum of the queue depth seen by each get, for the mean depth
+        self.depth_sum = 0
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        started = time.perf_counter()
+        try:
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(item, timeout=PRODUCER_POLL)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            with self.lock:
+                self.producer_blocked += time.perf_counter()-started
+
+    def _run(self):
+        try:
+            for _ in range(self.count):
+                item = self.produce()
+                if item is None:
+                    continue
+                if not self._put(item):
+                    return
+                with self.lock:
+                    self.produced += 1
+        except BaseException as e:
+            error = ProducerError(f"pair producer failed: {e!r}")
+            error.__cause__ = e
+            self._put(error)
+            return
+        self._put(_END)
+
+    def _get(self):
+        try:
+            item = self.queue.get_nowait()
+        except queue.Empty:
+            started = time.perf_counter()
+            item = self.queue.get()
+            with self.lock:
+                self.consumer_starved += time.perf_counter()-started
+        with self.lock:
+            self.depth_sum += self.queue.qsize()
+        return item
+
+    def __iter__(self):
+        if self.depth<=0:
+            for _ in range(self.count):
+                item = self.produce()
+                if item is not None:
+                    self.produced += 1
+                    self.consumed += 1
+                    yield item
+            return
+        self.thread = threading.Thread(target=self._run, name="pair-producer", daemon=True)
+        self.thread.start()
+        try:
+            while True:
+                item = self._get()
+                if item is _END:
+                    return
+                if isinstance(item, ProducerError):
+                    raise item
+                self.consumed += 1
+                yield item
+        finally:
+            # the consumer stopped early (error, interrupt): release the producer
+            self.stopped.set()
+            self.thread.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": self.queue.qsize() if self.depth>0 else 0,
+                "capacity": self.depth,
+                "mean_depth": self.depth_sum/max(self.consumed, 1),
+                "produced": self.produced,
+                "consumed": self.consumed,
+                "producer_blocked_seconds": self.producer_blocked,
+                "consumer_starved_seconds": self.consumer_starved,
+                "bottleneck": "generation" if self.consumer_starved>self.producer_blocked else "execution",
+            }
+
+class TableOrderedExecutor:
+    """
+    runs pairs on worker threads in submission order, except that pairs
+    touching different tables (or only reading the same ones) overlap
+    a pair waits for the last earlier writer of every table it touches,
+    a writer also waits for the readers of its table since that writer
+    """
+
+    def __init__(self, workers):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pair")
+        # table -> future of its last writer, and of the readers since
+        self.writers = {}
+        self.readers = {}
+        # the last pair touching unknown tables, every later pair waits for it
+        self.barrier = None
+
+    def submit(self, query, function, *args):
+        reads, write = statement_tables(query[0])
+        if write is None and not reads:
+            # e.g., a statement the table patterns do not know: it waits for
+            # every pair in flight, and every later pair waits for it
+            depends = list(self.writers.values())+[future for each in self.readers.values() for future in each]
+        else:
+            depends = [self.writers[table] for table in reads|{write} if table in self.writers]
+            if write is not None:
+                depends += self.readers.get(write, [])
+        if self.barrier is not None:
+            depends.append(self.barrier)
+        future = self.pool.submit(self._run, depends, function, args)
+        if write is None and not reads:
+            self.barrier = future
+            self.writers = {}
+            self.readers = {}
+            return future
+        for table in reads:
+            if table!=write:
+                readers = self.readers.setdefault(table, [])
+                if len(readers)>=READERS_PRUNE:
+                    readers[:] = [reader for reader in readers if not reader.done()]
+                readers.append(future)
+        if write is not None:
+            self.writers[write] = future
+            self.readers[write] = []
+        return future
+
+    def _run(self, depends, function, args):
+        # every dependency was submitted earlier, the pool started it already
+        wait(depends)
+        return function(*args)
+
+    def shutdown(self):
+        self.pool.shutdown()
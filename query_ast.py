@@ -0,0 +1,265 @@
+"""
+lightweight, slot-based AST of the generated statements
+the generator builds one tree per statement and renders it once per dialect:
+clause mappings of the dialect profile (clause_map.MAPPING_PROFILES) are
+applied while rendering, profile None renders the unmapped query
+"""
+
+class Prepared(str):
+    """
+    the literal text of a generated DML statement, also carrying its
+    template (placeholders instead of the literal values) and the literals
+    drivers that prepare statements execute the template, everything else
+    (logs, replay, comparison) only sees the text
+    """
+
+    def __new__(cls, text, template, params):
+        prepared = super().__new__(cls, text)
+        prepared.template = template
+        prepared.params = params
+        return prepared
+
+    def __reduce__(self):
+        return (Prepared, (str(self), self.template, self.params))
+
+def placeholders(count, profile):
+    param = "${}".format if profile is None else profile["param"]
+    return [param(i+1) for i in range(count)]
+
+def map_type(type_name, profile):
+    if profile is None:
+        return type_name
+    return profile["types"].get(type_name, type_name)
+
+class Raw:
+    # literals and expressions that need no mapping
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def render(self, profile):
+        return self.text
+
+class Now:
+    __slots__ = ()
+
+    def render(self, profile):
+        return "NOW()" if profile is None else profile["now"]
+
+class Column:
+    __slots__ = ("name", "table", "cast")
+
+    def __init__(self, name, table=None):
+        self.name = name
+        self.table = table
+        self.cast = None
+
+    def render(self, profile):
+        column = self.name if self.table is None else f"{self.table}.{self.name}"
+        if self.cast is not None:
+            column = f"CAST({column} AS {map_type(self.cast, profile)})"
+        return column
+
+class Call:
+    # COUNT(c0), AVG(c0), ...
+    __slots__ = ("name", "args")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def render(self, profile):
+        return f"{self.name}({','.join(arg.render(profile) for arg in self.args)})"
+
+class Case:
+    __slots__ = ("when", "then", "otherwise")
+
+    def __init__(self, when, then, otherwise):
+        self.when = when
+        self.then = then
+        self.otherwise = otherwise
+
+    def render(self, profile):
+        return f"(CASE WHEN {self.when.render(profile)} THEN {self.then.render(profile)} ELSE {self.otherwise.render(profile)} END)"
+
+class Over:
+    # window aggregation: AVG(c0) OVER(PARTITION BY c1 ORDER BY c2)
+    __slots__ = ("call", "partition", "order")
+
+    def __init__(self, call, partition, order=None):
+        self.call = call
+        self.partition = partition
+        self.order = order
+
+    def render(self, profile):
+        order = "" if self.order is None else f" ORDER BY {self.order.render(profile)}"
+        return f"{self.call.render(profile)} OVER(PARTITION BY {self.partition.render(profile)}{order})"
+
+class In:
+    # target [NOT] IN (values), values are rendered literals
+    __slots__ = ("target", "values", "negated")
+
+    def __init__(self, target, values, negated=False):
+        self.target = target
+        self.values = values
+        self.negated = negated
+
+    def render(self, profile):
+        target = self.target.render(profile)
+        not_ = "NOT " if self.negated else ""
+        values = f"({','.join(self.values)})"
+        clause = f"{target} {not_}IN {values}"
+        if profile is None:
+            return clause
+        return profile["in"](target, not_, values, clause)
+
+class Between:
+    # target [NOT] BETWEEN low AND high
+    __slots__ = ("target", "low", "high", "negated")
+
+    def __init__(self, target, low, high, negated=False):
+        self.target = target
+        self.low = low
+        self.high = high
+        self.negated = negated
+
+    def render(self, profile):
+        target = self.target.render(profile)
+        low = self.low.render(profile)
+        high = self.high.render(profile)
+        not_ = "NOT " if self.negated else ""
+        clause = f"{target} {not_}BETWEEN {low} AND {high}"
+        if profile is None:
+            return clause
+        return profile["between"](target, not_, low, high, clause)
+
+class And:
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+    def render(self, profile):
+        return ' AND '.join(item.render(profile) for item in self.items)
+
+class Join:
+    __slots__ = ("kind", "table", "alias", "on")
+
+    def __init__(self, kind, table, alias, on=None):
+        self.kind = kind
+        self.table = table
+        self.alias = alias
+        self.on = on
+
+    def render(self, profile):
+        join = f"{self.kind} {self.table} AS {self.alias}"
+        if self.on is not None:
+            join += f" ON {self.on.render(profile)}"
+        return join
+
+class Select:
+    """
+    one slot per clause, empty clauses are None
+    columns: the unqualified column references of this SELECT, in
+    rendering order, as (column, castable) for the generator transforms
+    """
+    __slots__ = ("with_", "data", "table", "alias", "joins", "where", "partition",
+                 "sample", "window", "group", "order", "limit", "columns")
+
+    def __init__(self):
+        self.with_ = None
+        self.data = None
+        self.table = None
+        self.alias = None
+        self.joins = []
+        self.where = None
+        self.partition = None
+        self.sample = None
+        self.window = None
+        self.group = None
+        self.order = None
+        self.limit = None
+        self.columns = []
+
+    def render(self, profile):
+        sample_by = self.sample is not None and profile is not None and profile["sample_by"]
+        data = self.data.render(profile)
+        if sample_by:
+            # SAMPLE BY 1d -> GROUP BY the day, only the aggregate is fetched
+            data = f"{data} AS sample_by_result, {profile['day'](f'{self.alias}.c2')} AS d"
+        parts = []
+        if self.with_ is not None:
+            parts.append(self.with_)
+        parts.append(f"SELECT {data} FROM {self.table} AS {self.alias}")
+        for join in self.joins:
+            parts.append(join.render(profile))
+        if self.where is not None:
+            parts.append(f"WHERE {self.where.render(profile)}")
+        for clause in (self.partition, self.sample, self.window, self.group, self.order, self.limit):
+            if clause is not None:
+                parts.append("GROUP BY d" if sample_by and clause is self.sample else clause)
+        query = ' '.join(parts)
+        if sample_by:
+            query = f"SELECT sample_by_result FROM ({query}) AS sample_by"
+        return query
+
+class Compound:
+    # (left) UNION|EXCEPT|INTERSECT (right)
+    __slots__ = ("left", "operator", "right")
+
+    def __init__(self, left, operator, right):
+        self.left = left
+        self.operator = operator
+        self.right = right
+
+    def render(self, profile):
+        if profile is None:
+            return f"({self.left.render(profile)}) {self.operator} ({self.right.render(profile)})"
+        return profile["compound"](self.left.render(profile), self.operator, self.right.render(profile))
+
+class Insert:
+    __slots__ = ("table", "values")
+
+    def __init__(self, table, values):
+        self.table = table
+        self.values = values
+
+    def render(self, profile):
+        text = f"INSERT INTO {self.table} VALUES ({','.join(self.values)});"
+        template = f"INSERT INTO {self.table} VALUES ({','.join(placeholders(len(self.values), profile))});"
+        return Prepared(text, template, self.values)
+
+class Update:
+    __slots__ = ("table", "assignments", "where")
+
+    def __init__(self, table, assignments, where):
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+
+    def render(self, profile):
+        where = self.where.render(profile)
+        columns = [column for column, _ in self.assignments]
+        values = [value for _, value in self.assignments]
+        assignments = ','.join(f"{column}={value}" for column, value in self.assignments)
+        # the predicates stay literal, only the assigned values are parameters
+        template = ','.join(f"{column}={param}" for column, param in zip(columns, placeholders(len(values), profile)))
+        return Prepared(f"UPDATE {self.table} SET {assignments} WHERE {where}",
+                        f"UPDATE {self.table} SET {template} WHERE {where}", values)
+
+class Create:
+    # columns: [(name, type)], timestamp: the designated timestamp column
+    __slots__ = ("table", "columns", "timestamp")
+
+    def __init__(self, table, columns, timestamp=None):
+        self.table = table
+        self.columns = columns
+        self.timestamp = timestamp
+
+    def render(self, profile):
+        columns = ','.join(f"{name} {map_type(type_name, profile)}" for name, type_name in self.columns)
+        suffix = ""
+        if self.timestamp is not None and profile is not None and profile.get("designated_timestamp"):
+            suffix = f" timestamp({self.timestamp})"
+        return f"CREATE TABLE {self.table} ({columns}){suffix};"
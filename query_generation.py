@@ -1,27 +1,39 @@
 import string
+import random
 import datetime
-from clause_map import ClauseMapping
-from random import choice, randint, random
+from clause_map import MAPPING_PROFILES
+from query_ast import *
 
 
 # generating random strings for insert statements
-def random_string():
-    return "{}".format(''.join(choice(string.ascii_lowercase) for _ in range(randint(1,5))))
+def random_string(rng):
+    return "{}".format(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(1,5))))
 
-# generating random timestamps for insert statements
+# generating timestamps for insert statements
+# instead of the wall clock, so that a seeded generator reproduces them
+class VirtualClock:
+    def __init__(self, rng, start=datetime.datetime(2024, 1, 1), max_step=datetime.timedelta(seconds=10)):
+        self.rng = rng
+        self.current = start
+        self.max_step_us = max_step//datetime.timedelta(microseconds=1)
 
-def random_timestamp():
-    return datetime.datetime.now()
+    def now(self):
+        self.current += datetime.timedelta(microseconds=self.rng.randint(0, self.max_step_us))
+        return self.current
 
 # generating random table name with 8 lowercase letters
-def random_8_letters():
-    return "{}".format(''.join(choice(string.ascii_lowercase) for _ in range(8)))
+def random_8_letters(rng):
+    return "{}".format(''.join(rng.choice(string.ascii_lowercase) for _ in range(8)))
 
-def valid_expression():
+def data_kind(_data):
+    # the arm of a random_data choice, its arguments are drawn anyway
+    return _data[0]
+
+def valid_expression(rng):
     valid_expressions = [
         "CAST(1 AS FLOAT)", "CAST(NULL AS FLOAT)", "CAST(0.0 AS FLOAT)", "CAST('0' AS FLOAT)", "CAST(0-0 AS FLOAT)", "CAST(CAST(NULL AS INT) AS FLOAT)", "CAST(CAST('0' AS INT) AS FLOAT)", "CAST(CAST('0' AS FLOAT) AS INT)", "~CAST(NULL AS INT)", "~CAST(0.0 AS INT)", "~NULL::INT", "CAST(NULL AS INT)&CAST(NULL AS INT)", "CAST(NULL AS INT)&(~NULL::INT)", "CAST(NULL AS INT)^CAST(NULL AS INT)", "CAST(NULL AS INT)^(~NULL::INT)", "CAST(NULL AS INT)|CAST(NULL AS INT)", "CAST(NULL AS INT)|(~NULL::INT)", "'5'<>'5'", "'123'<'456'", "CAST(CAST('123'<'456' AS INT)|(~NULL::INT) AS INT)^CAST(NULL AS INT)"
     ]
-    return choice(valid_expressions)
+    return rng.choice(valid_expressions)
 
 class QueryGenerator:
     """
@@ -32,9 +44,19 @@ class QueryGenerator:
 
     columns = ["c0", "c1", "c2"]
 
-    def __init__(self, shared_clauses, EVAL_CONFIG_CLAUSE_MAPPING):
+    def __init__(self, shared_clauses, EVAL_CONFIG_CLAUSE_MAPPING, table_prefix="", seed=None, dialects=("questdb", "postgres"), scheduler=None):
         self.EVAL_CONFIG_CLAUSE_MAPPING = EVAL_CONFIG_CLAUSE_MAPPING
-        self.clause_mapping = ClauseMapping()
+        # all randomness of a generator comes from its own seeded RNG,
+        # the same seed (and shared clauses) generates the same statements
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.clock = VirtualClock(self.rng)
+        # keeps table names of concurrent generators apart
+        self.table_prefix = table_prefix
+        # statements are rendered once per dialect, in this order
+        self.profiles = [MAPPING_PROFILES[dialect] for dialect in dialects]
+        # weights of the decisions learned from feedback, see scheduler.py
+        self.scheduler = scheduler
         self.shared_clauses = shared_clauses
         self.shared_predicate_clauses = None
         self.concats = []
@@ -45,117 +67,127 @@ class QueryGenerator:
         if "INTERSECT" in self.shared_clauses:
             self.concats.append("INTERSECT")
 
+    def choose(self, decision, options, key=str):
+        # decisions the scheduler learns, uniform without a scheduler
+        if self.scheduler is None:
+            return self.rng.choice(options)
+        return self.scheduler.choose(self.rng, decision, options, key)
+
     def fuzzy_exp(self):
-        return choice(["NULL"])
+        return self.rng.choice(["NULL"])
 
     """
     0. predicates part
     TODO: still many interesting or complex predicates not implemented ;(
     """
 
-    def random_int_predicates(self, column_name):
-        predicates = ["True"]
+    def column(self, name, table=None, castable=True):
+        column = Column(name, table)
+        if table is None:
+            # unqualified columns are resolved by the SELECT transforms
+            self.ee.append((column, castable))
+        return column
+
+    def get_shared_predicate_clauses(self):
         if not self.shared_predicate_clauses:
             self.shared_predicate_clauses = []
             predicate_clauses = ["IN","BETWEEN"]
             for each_clause in predicate_clauses:
                 if each_clause in self.shared_clauses:
                     self.shared_predicate_clauses.append(each_clause)
-        for each_shared_clause in self.shared_predicate_clauses:
-            if choice([True,False]):
+        return self.shared_predicate_clauses
+
+    def random_int_predicates(self, column):
+        predicates = [Raw("True")]
+        for each_shared_clause in self.get_shared_predicate_clauses():
+            if self.choose(f"int:{each_shared_clause}", [True,False]):
                 if each_shared_clause=="IN":
+                    # (negated, values)
                     in_predicates = [
-                        f"{column_name} IN (0,NULL)",
-                        f"{column_name} NOT IN (0,1,2,NULL)",
-                        f"{column_name} NOT IN (0,NULL)",
-                        f"{column_name} NOT IN (0)",
+                        (False, ["0","NULL"]),
+                        (True, ["0","1","2","NULL"]),
+                        (True, ["0","NULL"]),
+                        (True, ["0"]),
                     ]
-                    predicates.append(choice(in_predicates))
+                    negated, values = self.rng.choice(in_predicates)
+                    predicates.append(In(column, values, negated))
                 elif each_shared_clause=="IN_SUBQUERY":
                     # TODO
                     pass
-        return ' AND '.join(predicates)
+        return And(predicates)
 
-    def random_string_predicates(self, column_name):
-        predicates = ["True"]
-        if not self.shared_predicate_clauses:
-            self.shared_predicate_clauses = []
-            predicate_clauses = ["IN","BETWEEN"]
-            for each_clause in predicate_clauses:
-                if each_clause in self.shared_clauses:
-                    self.shared_predicate_clauses.append(each_clause)
-        for each_shared_clause in self.shared_predicate_clauses:
-            if choice([True,False]):
+    def random_string_predicates(self, column):
+        predicates = [Raw("True")]
+        for each_shared_clause in self.get_shared_predicate_clauses():
+            if self.choose(f"string:{each_shared_clause}", [True,False]):
                 if each_shared_clause=="IN":
                     in_predicates = [
-                        f"{column_name} IN ('0',NULL)",
-                        f"{column_name} NOT IN ('0','1','2',NULL)",
-                        f"{column_name} NOT IN ('0','1','2')",
-                        f"{column_name} NOT IN ('0')",
+                        (False, ["'0'","NULL"]),
+                        (True, ["'0'","'1'","'2'","NULL"]),
+                        (True, ["'0'","'1'","'2'"]),
+                        (True, ["'0'"]),
                     ]
-                    predicates.append(choice(in_predicates))
+                    negated, values = self.rng.choice(in_predicates)
+                    predicates.append(In(column, values, negated))
                 elif each_shared_clause=="IN_SUBQUERY":
                     # TODO
                     pass
-        return ' AND '.join(predicates)
+        return And(predicates)
 
-    def random_timestamp_predicates(self, column_name):
-        predicates = ["True"]
-        if not self.shared_predicate_clauses:
-            self.shared_predicate_clauses = []
-            predicate_clauses = ["IN","BETWEEN"]
-            for each_clause in predicate_clauses:
-                if each_clause in self.shared_clauses:
-                    self.shared_predicate_clauses.append(each_clause)
-        for each_shared_clause in self.shared_predicate_clauses:
-            if choice([True,False]):
+    def random_timestamp_predicates(self, column):
+        predicates = [Raw("True")]
+        for each_shared_clause in self.get_shared_predicate_clauses():
+            if self.choose(f"timestamp:{each_shared_clause}", [True,False]):
                 if each_shared_clause=="IN":
                     in_predicates = [
-                        f"{column_name} IN ('2000-01-01T00:00:00', NULL)",
-                        f"{column_name} NOT IN ('2000-01-01T00:00:00', NULL)",
-                        f"{column_name} NOT IN ('2000-01-01T00:00:00', '2000-01-01T00:00:00')",
+                        (False, ["'2000-01-01T00:00:00'","NULL"]),
+                        (True, ["'2000-01-01T00:00:00'","NULL"]),
+                        (True, ["'2000-01-01T00:00:00'","'2000-01-01T00:00:00'"]),
                     ]
-                    predicates.append(choice(in_predicates))
+                    negated, values = self.rng.choice(in_predicates)
+                    predicates.append(In(column, values, negated))
                 elif each_shared_clause=="IN_SUBQUERY":
                     # TODO
                     pass
                 elif each_shared_clause=="BETWEEN":
+                    # (negated, low, high)
                     between_predicates = [
-                        f"{column_name} BETWEEN {column_name} AND NOW()",
-                        f"{column_name} NOT BETWEEN {column_name} AND NULL",
-                        f"{column_name} NOT BETWEEN NULL AND {column_name}",
-                        f"{column_name} NOT BETWEEN NULL AND NOW()",
+                        (False, column, Now()),
+                        (True, column, Raw("NULL")),
+                        (True, Raw("NULL"), column),
+                        (True, Raw("NULL"), Now()),
                     ]
-                    predicates.append(choice(between_predicates))
-        return ' AND '.join(predicates)
+                    negated, low, high = self.rng.choice(between_predicates)
+                    predicates.append(Between(column, low, high, negated))
+        return And(predicates)
 
     def random_predicates_no_join(self):
         predicates = []
-        predicates.append(self.random_int_predicates("c0"))
-        predicates.append(self.random_string_predicates("c1"))
-        predicates.append(self.random_timestamp_predicates("c2"))
-        return ' AND '.join(predicates)
+        predicates.append(self.random_int_predicates(self.column("c0")))
+        predicates.append(self.random_string_predicates(self.column("c1")))
+        predicates.append(self.random_timestamp_predicates(self.column("c2")))
+        return And(predicates)
 
     def random_predicates_for_joins(self, talias=None):
         predicates = []
-        predicates.append(self.random_int_predicates("c0" if talias==None else f"{choice(talias)}.c0"))
-        predicates.append(self.random_string_predicates("c1" if talias==None else f"{choice(talias)}.c1"))
-        predicates.append(self.random_timestamp_predicates("c2" if talias==None else f"{choice(talias)}.c2"))
-        return ' AND '.join(predicates)
+        predicates.append(self.random_int_predicates(self.column("c0", None if talias==None else self.rng.choice(talias))))
+        predicates.append(self.random_string_predicates(self.column("c1", None if talias==None else self.rng.choice(talias))))
+        predicates.append(self.random_timestamp_predicates(self.column("c2", None if talias==None else self.rng.choice(talias))))
+        return And(predicates)
 
     """
     1. simple CREATE statement implementations
     """
 
     def random_create_query(self):
-        random_table_name = random_8_letters()
-        create_query = f"CREATE TABLE {random_table_name} (c0 INT, c1 STRING, c2 TIMESTAMP);"
+        random_table_name = self.table_prefix+random_8_letters(self.rng)
+        create_query = Create(random_table_name, [("c0", "INT"), ("c1", "STRING"), ("c2", "TIMESTAMP")], "c2")
         if self.EVAL_CONFIG_CLAUSE_MAPPING:
-            queries = self.clause_mapping.main(create_query)
-            queries[0] = queries[0].replace(';',' timestamp(c2);')
+            queries = self.render(create_query)
         else:
             # having an ad-hoc patch for string type
             # otherwise no comparison result
+            create_query = create_query.render(None)
             query0 = create_query.replace('STRING','SYMBOL')
             query1 = create_query.replace('STRING','VARCHAR(32)')
             queries = [query0, query1]
@@ -191,11 +223,11 @@ class QueryGenerator:
 
     def random_insert_query(self, table_name):
         self.init_query()
-        random_INT = randint(-1000, 1000)
-        random_STRING = random_string()
-        random_TIMESTAMP = random_timestamp()
-        values = f"{random_INT}, '{random_STRING}', '{random_TIMESTAMP}+00'"
-        insert_query = f"INSERT INTO {table_name} VALUES ({values});"
+        random_INT = self.rng.randint(-1000, 1000)
+        random_STRING = random_string(self.rng)
+        random_TIMESTAMP = self.clock.now()
+        values = [f"{random_INT}", f"'{random_STRING}'", f"'{random_TIMESTAMP}+00'"]
+        insert_query = Insert(table_name, values)
         return insert_query
 
     """
@@ -205,13 +237,12 @@ class QueryGenerator:
     def random_update_query(self, table_name):
         self.init_query()
         # TODO: update can be complex with JOINs, etc.
-        random_INT = randint(-1000, 1000)
-        random_STRING = random_string()
-        random_TIMESTAMP = random_timestamp()
-        updates = f"c0={random_INT},c1='{random_STRING}',c2='{random_TIMESTAMP}'"
+        random_INT = self.rng.randint(-1000, 1000)
+        random_STRING = random_string(self.rng)
+        random_TIMESTAMP = self.clock.now()
+        updates = [("c0", f"{random_INT}"), ("c1", f"'{random_STRING}'"), ("c2", f"'{random_TIMESTAMP}'")]
         random_predicate = self.random_predicates_no_join()
-        predicates = f"WHERE {random_predicate}"
-        update_query = f"UPDATE {table_name} SET {updates} {predicates}"
+        update_query = Update(table_name, updates, random_predicate)
         return update_query
 
     """
@@ -220,10 +251,10 @@ class QueryGenerator:
 
     def random_clause_with(self):
         _with = []
-        _with.append("max_int AS (SELECT max(c0) from {})".format(choice(self.tables)))
-        _with.append("min_int AS (SELECT min(c0) from {})".format(choice(self.tables)))
-        _with.append("max_timestamp AS (SELECT max(c2) from {})".format(choice(self.tables)))
-        _with.append("min_timestamp AS (SELECT min(c2) from {})".format(choice(self.tables)))
+        _with.append("max_int AS (SELECT max(c0) from {})".format(self.rng.choice(self.tables)))
+        _with.append("min_int AS (SELECT min(c0) from {})".format(self.rng.choice(self.tables)))
+        _with.append("max_timestamp AS (SELECT max(c2) from {})".format(self.rng.choice(self.tables)))
+        _with.append("min_timestamp AS (SELECT min(c2) from {})".format(self.rng.choice(self.tables)))
         _with = "WITH {}".format(','.join(_with))
         return _with
 
@@ -243,31 +274,41 @@ class QueryGenerator:
             print("Alert: no available aggregate function!")
             return "1"
         else:
-            return f"{choice(aggregation_foos)}({choice(self.columns)})"
+            return f"{self.rng.choice(aggregation_foos)}({self.rng.choice(self.columns)})"
 
     def random_over_partition_aggregation(self):
         aggregation_foos = []
         if "AVG" in self.shared_clauses:
             aggregation_foos.append("AVG")
-        return f"{choice(aggregation_foos)}({choice(self.columns)})"
+        return f"{self.rng.choice(aggregation_foos)}({self.rng.choice(self.columns)})"
 
     def random_data(self):
-        _data = ["COUNT(*)", f"COUNT({valid_expression()})"]
+        # the data slot is returned as (kind, arguments), so that a compound
+        # query can build the same data for every SELECT with its own columns
+        _data = [("COUNT(*)",), ("COUNT", valid_expression(self.rng))]
         if "CASE" in self.shared_clauses:
-            column = choice(self.columns)
-            _data.append(
-                f"(CASE WHEN True THEN {column} ELSE {column} END)"
-                )
+            _data.append(("CASE", self.rng.choice(self.columns)))
         if "COUNT" in self.shared_clauses:
-            _data.append(f"COUNT({choice(self.columns)})")
+            _data.append(("COUNT_COLUMN", self.rng.choice(self.columns)))
         if "OVER_PARTITION" in self.shared_clauses:
-            _over_partition_order = ""
-            if "OVER_PARTITION_ORDER" in self.shared_clauses and choice([True,False]):
-                _over_partition_order = f"ORDER BY {choice(self.columns)}"
-            _data.append(
-                f"AVG(c0) OVER(PARTITION BY {choice(self.columns)} {_over_partition_order})"
-                )
-        return choice(_data)
+            _over_partition_order = None
+            if "OVER_PARTITION_ORDER" in self.shared_clauses and self.rng.choice([True,False]):
+                _over_partition_order = self.rng.choice(self.columns)
+            _data.append(("OVER_PARTITION", self.rng.choice(self.columns), _over_partition_order))
+        return self.choose("data", _data, key=data_kind)
+
+    def data_node(self, _data):
+        kind = _data[0]
+        if kind=="COUNT(*)":
+            return Raw("COUNT(*)")
+        if kind=="COUNT":
+            return Call("COUNT", [Raw(_data[1])])
+        if kind=="CASE":
+            return Case(Raw("True"), self.column(_data[1]), self.column(_data[1]))
+        if kind=="COUNT_COLUMN":
+            return Call("COUNT", [self.column(_data[1], castable=False)])
+        order = None if _data[2] is None else self.column(_data[2])
+        return Over(Call("AVG", [self.column("c0", castable=False)]), self.column(_data[1]), order)
 
     def random_table(self):
         if "TABLE_SUBQUERY" not in self.shared_clauses:
@@ -276,11 +317,11 @@ class QueryGenerator:
             return table
         else:
             # TODO: add predicates
-            _table_subquery = f"(SELECT * FROM {choice(self.tables)})"
+            _table_subquery = f"(SELECT * FROM {self.rng.choice(self.tables)})"
             return _table_subquery
 
     def random_clause_join(self):
-        _join_tables = randint(0,2)
+        _join_tables = self.choose("joins", [0,1,2])
         _joins = ["JOIN"]
         if "CROSS_JOIN" in self.shared_clauses:
             _joins.append("CROSS JOIN")
@@ -289,116 +330,103 @@ class QueryGenerator:
         # TODO: LEFT/RIGHT OUTER JOIN
         joins = []
         for i in range(_join_tables):
-            join_clause = choice(_joins)
-            join_table = choice(self.tables)
-            next_join = f"{join_clause} {join_table} AS T{i+2}"
+            join_clause = self.choose("join", _joins)
+            join_table = self.rng.choice(self.tables)
+            next_join = Join(join_clause, join_table, f"T{i+2}")
             self.tt.append(join_table)
             self.tt.append(f"T{i+2}")
             self.talias.append(f"T{i+2}")
             if join_clause!="CROSS JOIN":
-                next_join += " ON "+self.random_predicates_for_joins(self.talias)
+                next_join.on = self.random_predicates_for_joins(self.talias)
             joins.append(next_join)
-        return ' '.join(joins)
+        return joins
 
     def random_predicate(self):
-        return " WHERE "+self.random_predicates_for_joins()
+        return self.random_predicates_for_joins()
 
     def random_clause_partition(self):
-        _partition = ""
+        _partition = None
         return _partition
 
     def random_clause_window(self):
-        return ""
+        return None
 
     def random_clause_group(self):
-        return ""
+        return None
 
     def random_clause_order(self):
-        return ""
+        return None
 
     def random_clause_limit(self):
-        return ""
+        return None
 
     def random_clause_sample(self):
-        if "SAMPLE" in self.shared_clauses and choice([True,False]):
+        if "SAMPLE" in self.shared_clauses and self.choose("sample", [True,False]):
             _sample = "SAMPLE BY 1d"
         else:
-            _sample = ""
+            _sample = None
         return _sample
 
     """
     5. overall mutation
     """
-    def query_mutation_add_cast(self, query):
-        query = query.replace(" c0", " CAST(c0 AS STRING)", randint(0,2))
-        query = query.replace(" c1", " CAST(c1 AS STRING)", randint(0,2))
-        query = query.replace(" c2", " CAST(c2 AS STRING)", randint(0,2))
-        return query
+    def query_mutation_add_cast(self, select):
+        # casts the first 0-2 (unqualified) references of every column
+        casts = {"c0": self.rng.randint(0,2), "c1": self.rng.randint(0,2), "c2": self.rng.randint(0,2)}
+        for column, castable in select.columns:
+            if castable and casts[column.name]>0 and column.cast is None:
+                column.cast = "STRING"
+                casts[column.name] -= 1
+        return select
 
     """
     6. sanitize check
     to pre-check grammar issues
     """
-    def select_query_sanitize_check(self, query):
+    def select_query_sanitize_check(self, select):
+        # qualifies unqualified columns, one table alias per column name
         if "T1" in self.tt:
-            query = query.replace(" c0 ", f" {choice(self.talias)}.c0 ")
-            query = query.replace(" c1 ", f" {choice(self.talias)}.c1 ")
-            query = query.replace(" c2 ", f" {choice(self.talias)}.c2 ")
-            query = query.replace("(c0)", f"({choice(self.talias)}.c0)")
-            query = query.replace("(c1)", f"({choice(self.talias)}.c1)")
-            query = query.replace("(c2)", f"({choice(self.talias)}.c2)")
-            query = query.replace(" c0)", f" {choice(self.talias)}.c0)")
-            query = query.replace(" c1)", f" {choice(self.talias)}.c1)")
-            query = query.replace(" c2)", f" {choice(self.talias)}.c2)")
-            query = query.replace("(c0,", f"({choice(self.talias)}.c0,")
-            query = query.replace("(c1,", f"({choice(self.talias)}.c1,")
-            query = query.replace("(c2,", f"({choice(self.talias)}.c2,")
-        return query
-
-    def adhoc_final_query_sanitize_check(self, query):
-        biased_talias = ["T1","T1","T1","T1","T1","T1","T2","T2","T3"]
-        if "T1" in self.tt:
-            query = query.replace(" c0 ", f" {choice(biased_talias)}.c0 ")
-            query = query.replace(" c1 ", f" {choice(biased_talias)}.c1 ")
-            query = query.replace(" c2 ", f" {choice(biased_talias)}.c2 ")
-            query = query.replace("(c0)", f"({choice(biased_talias)}.c0)")
-            query = query.replace("(c1)", f"({choice(biased_talias)}.c1)")
-            query = query.replace("(c2)", f"({choice(biased_talias)}.c2)")
-            query = query.replace(" c0)", f" {choice(biased_talias)}.c0)")
-            query = query.replace(" c1)", f" {choice(biased_talias)}.c1)")
-            query = query.replace(" c2)", f" {choice(biased_talias)}.c2)")
-            query = query.replace("(c0,", f"({choice(biased_talias)}.c0,")
-            query = query.replace("(c1,", f"({choice(biased_talias)}.c1,")
-            query = query.replace("(c2,", f"({choice(biased_talias)}.c2,")
-        return query
+            aliases = {}
+            for column, _ in select.columns:
+                if column.table is None:
+                    if column.name not in aliases:
+                        aliases[column.name] = self.rng.choice(self.talias)
+                    column.table = aliases[column.name]
+        return select
 
     def random_select_query(self, _data=None):
         self.init_query()
-        _with = self.random_clause_with() if "WITH" in self.shared_clauses else ""
+        select = Select()
+        select.with_ = self.random_clause_with() if "WITH" in self.shared_clauses else None
         _data = self.random_data() if _data==None else _data
-        _table = self.random_table()
-        _alias = "AS T1"
+        select.table = self.random_table()
+        select.alias = "T1"
         self.tt.append("T1")
         self.talias.append("T1")
-        _join = self.random_clause_join() if "JOIN" in self.shared_clauses else ""
-        _predicate = self.random_predicate()
-        _partition = self.random_clause_partition()
-        _window = self.random_clause_window()
-        _group = self.random_clause_group()
-        _order = self.random_clause_order()
-        _limit = self.random_clause_limit()
-        _sample = self.random_clause_sample() if _join=="" else ""
+        select.joins = self.random_clause_join() if "JOIN" in self.shared_clauses else []
+        select.where = self.random_predicate()
+        select.partition = self.random_clause_partition()
+        select.window = self.random_clause_window()
+        select.group = self.random_clause_group()
+        select.order = self.random_clause_order()
+        select.limit = self.random_clause_limit()
+        select.sample = self.random_clause_sample() if len(select.joins)==0 else None
 
         # it might need some constrains
-        if _sample!="":
-            _data = "COUNT(*)"
+        if select.sample is not None:
+            _data = ("COUNT(*)",)
 
-        select_query = f"{_with} SELECT {_data} FROM {_table} {_alias} {_join} {_predicate} {_partition} {_sample} {_window} {_group} {_order} {_limit}"
+        # the data columns come first in the rendered query
+        where_columns = self.ee
+        self.ee = []
+        select.data = self.data_node(_data)
+        select.columns = self.ee+where_columns
 
         if "CAST" in self.shared_clauses:
-            select_query = self.query_mutation_add_cast(select_query)
+            select = self.query_mutation_add_cast(select)
 
-        return select_query, _data
+        select = self.select_query_sanitize_check(select)
+        return select, _data
 
     def init_query(self):
         # available/usable tables/alias
@@ -408,40 +436,41 @@ class QueryGenerator:
         # available/usable columns/expressions/alias
         self.ee = []
 
-    def random_query(self):
+    def render(self, statement):
+        if not self.EVAL_CONFIG_CLAUSE_MAPPING:
+            query = statement.render(None)
+            return [query, query]
+        return [statement.render(profile) for profile in self.profiles]
+
+    def random_statement(self):
         select_query = 0.8
         insert_query = 0.2
         update_query = 0
-        return_query = ""
-        if random()<select_query:
-            select_query, _data = self.random_select_query()
-            select_query = self.select_query_sanitize_check(select_query)
+        if self.scheduler is None:
+            if self.rng.random()<select_query:
+                kind = "select"
+            elif self.rng.random()>=1-update_query:
+                kind = "update"
+            else:
+                kind = "insert"
+        else:
+            self.scheduler.begin()
+            # the fixed mix is the prior of the learned weights
+            kind = self.scheduler.choose(self.rng, "statement", ["select", "insert", "update"],
+                                         priors=[select_query, insert_query, update_query])
+        if kind=="select":
+            statement, _data = self.random_select_query()
             if len(self.concats)>0:
-                query_complexity = randint(0,2)
+                query_complexity = self.choose("compounds", [0,1,2])
                 for i in range(query_complexity):
                     next_query, _data = self.random_select_query(_data)
-                    next_query = self.select_query_sanitize_check(next_query)
-                    concat = choice(self.concats)
-                    select_query = f"({select_query}) {concat} ({next_query})"
-            if self.EVAL_CONFIG_CLAUSE_MAPPING:
-                select_query = self.clause_mapping.main(select_query)
-            else:
-                select_query = [select_query, select_query]
-            return_query = select_query
-        elif random()>=1-update_query:
-            update_query = self.random_update_query(choice(self.tables))
-            if self.EVAL_CONFIG_CLAUSE_MAPPING:
-                update_query = self.clause_mapping.main(update_query)
-            else:
-                update_query = [update_query, update_query]
-            return_query = update_query
+                    concat = self.choose("compound", self.concats)
+                    statement = Compound(statement, concat, next_query)
+        elif kind=="update":
+            statement = self.random_update_query(self.rng.choice(self.tables))
         else:
-            insert_query = self.random_insert_query(choice(self.tables))
-            if self.EVAL_CONFIG_CLAUSE_MAPPING:
-                insert_query = self.clause_mapping.main(insert_query)
-            else:
-                insert_query = [insert_query, insert_query]
-            return_query = insert_query
-        return_query[0] = self.adhoc_final_query_sanitize_check(return_query[0])
-        return_query[1] = self.adhoc_final_query_sanitize_check(return_query[1])
-        return return_query
+            statement = self.random_insert_query(self.rng.choice(self.tables))
+        return statement
+
+    def random_query(self):
+        return self.render(self.random_statement())
@@ -0,0 +1,347 @@
+"""
+indexed on-disk store of the recorded statement pairs
+replaces the free-text diff_input.log and questdb/postgres_testing.log:
+a store is a directory of append-only segments and an index
+
+    segment-<n>.rec: frames of <payload bytes, records, codec> headers, each
+                     followed by a compressed block of JSON lines, one record
+                     per line ({"seq", "round", "kind", "outcome", "queries", ...})
+    index.sqlite:    seq -> (segment, frame offset, position in the block),
+                     and the round, kind, outcome and tables of every record
+
+a record is found with one index lookup and one frame read, ranges are
+streamed frame by frame; the text logs are exported on demand:
+
+    python record_store.py export ./records --output-dir .
+    python record_store.py show ./records --outcome mismatch --table fuzz_abcdefgh
+"""
+
+import os
+import re
+import ast
+import json
+import time
+import zlib
+import atexit
+import shutil
+import sqlite3
+import struct
+import argparse
+import threading
+from dedup import statement_tables
+
+try:
+    import zstandard
+except ImportError:
+    # optional, blocks are compressed with zlib without it
+    zstandard = None
+
+DEFAULT_STORE_PATH = "./records"
+# records compressed together, a lookup decompresses one block
+DEFAULT_BLOCK_RECORDS = 256
+# a new segment is started past this size
+DEFAULT_SEGMENT_BYTES = 256*1024*1024
+# seconds a record waits in memory at most, as the buffered logs
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_BACKUP_COUNT = 3
+
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+# payload bytes, records, codec
+FRAME_HEADER = struct.Struct("<IIB")
+SEGMENT_NAME = re.compile(r"segment-(\d+)\.rec")
+INDEX_NAME = "index.sqlite"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (seq INTEGER PRIMARY KEY, round INTEGER, kind TEXT, outcome TEXT,
+                                    segment INTEGER, offset INTEGER, position INTEGER);
+CREATE INDEX IF NOT EXISTS records_round ON records (round);
+CREATE INDEX IF NOT EXISTS records_outcome ON records (outcome);
+CREATE TABLE IF NOT EXISTS record_tables (name TEXT, seq INTEGER);
+CREATE INDEX IF NOT EXISTS record_tables_name ON record_tables (name);
+"""
+
+def pair_outcome(questdb_success, postgres_success, mismatch):
+    # the outcome of an executed pair, as indexed
+    if mismatch:
+        return "mismatch"
+    if questdb_success and postgres_success:
+        return "ok"
+    if not questdb_success and not postgres_success:
+        return "both_error"
+    return "questdb_error" if not questdb_success else "postgres_error"
+
+def record_kind(query):
+    # "comment" (generator and table seeds), "select" or "write"
+    if query[0].startswith("--"):
+        return "comment"
+    if "SELECT " in query[0] and "SELECT " in query[1]:
+        return "select"
+    return "write"
+
+def segment_path(path, segment):
+    return os.path.join(path, f"segment-{segment:06d}.rec")
+
+def compress(payload, codec):
+    if codec==CODEC_ZSTD:
+        return zstandard.ZstdCompressor().compress(payload)
+    return zlib.compress(payload, 6)
+
+def decompress(data, codec):
+    if codec==CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("the record store has zstd blocks, install zstandard to read them")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+def open_index(path):
+    index = sqlite3.connect(os.path.join(path, INDEX_NAME), check_same_thread=False)
+    # readers (replay, export) see the committed records of a running writer
+    index.execute("PRAGMA journal_mode = WAL")
+    index.executescript(INDEX_SCHEMA)
+    return index
+
+class RecordStore:
+    """
+    append-only writer of a store, appended records are written once a
+    block is full, flush_interval seconds old or on close; nothing is
+    created on disk before the first record
+    every session writes new segments, the sequence numbers continue
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, block_records=DEFAULT_BLOCK_RECORDS, segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.block_records = block_records
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.codec = CODEC_ZLIB if zstandard is None else CODEC_ZSTD
+        self.lock = threading.Lock()
+        self.index = None
+        self.segment = None
+        self.file = None
+        self.next_seq = None
+        # records waiting for the next block
+        self.block = []
+        self.flushed_at = time.monotonic()
+        atexit.register(self.close)
+
+    def _open(self):
+        # caller holds the lock
+        os.makedirs(self.path, exist_ok=True)
+        self.index = open_index(self.path)
+        self.next_seq = (self.index.execute("SELECT max(seq) FROM records").fetchone()[0] or 0)+1
+        segments = [int(match.group(1)) for match in map(SEGMENT_NAME.fullmatch, os.listdir(self.path)) if match]
+        self._next_segment(max(segments, default=0)+1)
+
+    def _next_segment(self, segment):
+        if self.file is not None:
+            self.file.close()
+        self.segment = segment
+        self.file = open(segment_path(self.path, segment), "ab")
+
+    def append(self, query, testing_round=None, outcome=None, **fields):
+        """
+        records a pair of statements, outcome is None for the statements
+        not run by the testing loop (table setup, comments); fields are kept
+        in the record only, e.g. the campaign worker; returns the sequence number
+        """
+        with self.lock:
+            if self.index is None:
+                self._open()
+            seq = self.next_seq
+            self.next_seq += 1
+            reads, write = statement_tables(query[0])
+            tables = sorted(reads if write is None else reads|{write})
+            record = dict(fields, seq=seq, round=testing_round, kind=record_kind(query), outcome=outcome,
+                          queries=[query[0], query[1]], tables=tables)
+            self.block.append(record)
+            if len(self.block)>=self.block_records or time.monotonic()-self.flushed_at>=self.flush_interval:
+                self._write_block()
+            return seq
+
+    def _write_block(self):
+        # caller holds the lock; the index only points at written frames
+        self.flushed_at = time.monotonic()
+        if not self.block:
+            return
+        if self.file.tell()>=self.segment_bytes:
+            self._next_segment(self.segment+1)
+        payload = compress('\n'.join(json.dumps(record) for record in self.block).encode(), self.codec)
+        offset = self.file.tell()
+        self.file.write(FRAME_HEADER.pack(len(payload), len(self.block), self.codec))
+        self.file.write(payload)
+        self.file.flush()
+        self.index.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", [
+            (record["seq"], record["round"], record["kind"], record["outcome"], self.segment, offset, position)
+            for position, record in enumerate(self.block)
+        ])
+        self.index.executemany("INSERT INTO record_tables VALUES (?, ?)",
+                               [(table, record["seq"]) for record in self.block for table in record["tables"]])
+        self.index.commit()
+        self.block = []
+
+    def flush(self):
+        with self.lock:
+            if self.index is not None:
+                self._write_block()
+
+    def rotate(self, backup_count=DEFAULT_BACKUP_COUNT):
+        # the store of previous runs is kept as <path>.1, <path>.2, ... as the logs
+        self.close()
+        with self.lock:
+            if not os.path.isdir(self.path):
+                return
+            if backup_count<=0:
+                shutil.rmtree(self.path)
+                return
+            if os.path.isdir(f"{self.path}.{backup_count}"):
+                shutil.rmtree(f"{self.path}.{backup_count}")
+            for i in range(backup_count-1, 0, -1):
+                if os.path.isdir(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i+1}")
+            os.replace(self.path, f"{self.path}.1")
+
+    def close(self):
+        with self.lock:
+            if self.index is None:
+                return
+            self._write_block()
+            self.file.close()
+            self.index.close()
+            self.index = None
+            self.file = None
+
+class RecordReader:
+    """
+    random access and range reads of a store, also while it is written;
+    the last decompressed block is kept for sequential reads
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        if not os.path.exists(os.path.join(path, INDEX_NAME)):
+            raise FileNotFoundError(f"no record store at {path}")
+        self.path = path
+        self.index = open_index(path)
+        self.files = {}
+        # (segment, offset) -> records of the last block read
+        self.cached = (None, None)
+
+    def _block(self, segment, offset):
+        if self.cached[0]==(segment, offset):
+            return self.cached[1]
+        f = self.files.get(segment)
+        if f is None:
+            f = open(segment_path(self.path, segment), "rb")
+            self.files[segment] = f
+        f.seek(offset)
+        size, count, codec = FRAME_HEADER.unpack(f.read(FRAME_HEADER.size))
+        records = [json.loads(line) for line in decompress(f.read(size), codec).split(b'\n')]
+        self.cached = ((segment, offset), records)
+        return records
+
+    def __len__(self):
+        return self.index.execute("SELECT count(*) FROM records").fetchone()[0]
+
+    def get(self, seq):
+        location = self.index.execute("SELECT segment, offset, position FROM records WHERE seq = ?", (seq,)).fetchone()
+        if location is None:
+            raise KeyError(seq)
+        segment, offset, position = location
+        return self._block(segment, offset)[position]
+
+    def _records(self, sql, params):
+        for segment, offset, position in self.index.execute(sql, params).fetchall():
+            yield self._block(segment, offset)[position]
+
+    def range(self, start=1, stop=None):
+        # records with start <= seq < stop, in order
+        if stop is None:
+            return self._records("SELECT segment, offset, position FROM records WHERE seq >= ? ORDER BY seq", (start,))
+        return self._records("SELECT segment, offset, position FROM records WHERE seq >= ? AND seq < ? ORDER BY seq",
+                             (start, stop))
+
+    def find(self, testing_round=None, kind=None, outcome=None, table=None):
+        # records matching every given key, in order
+        conditions, params = [], []
+        for column, value in (("round", testing_round), ("kind", kind), ("outcome", outcome)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if table is not None:
+            conditions.append("seq IN (SELECT seq FROM record_tables WHERE name = ?)")
+            params.append(table)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._records(f"SELECT segment, offset, position FROM records{where} ORDER BY seq", params)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.index.close()
+
+def read_pairs(path):
+    # the recorded pairs of a store or of a diff_input.log, as replayed
+    if os.path.isdir(path):
+        reader = RecordReader(path)
+        try:
+            for record in reader.range():
+                yield record["queries"]
+        finally:
+            reader.close()
+        return
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield ast.literal_eval(line)
+
+def export(path, output_dir=".", testing_round=None):
+    """
+    writes diff_input.log, questdb_testing.log and postgres_testing.log of
+    the store (or of one round) in the format of the text logs
+    """
+    reader = RecordReader(path)
+    records = reader.range() if testing_round is None else reader.find(testing_round)
+    exported = 0
+    try:
+        with open(os.path.join(output_dir, "diff_input.log"), "w") as diff_input, \
+             open(os.path.join(output_dir, "questdb_testing.log"), "w") as questdb_log, \
+             open(os.path.join(output_dir, "postgres_testing.log"), "w") as postgres_log:
+            for record in records:
+                query = record["queries"]
+                # failing SELECTs were not part of diff_input.log, replays skip them
+                if record["kind"]!="select" or record["outcome"] in (None, "ok", "mismatch"):
+                    diff_input.write(str(query)+'\n')
+                # the testing logs only had the statements run by the testing loop
+                if record["outcome"] is not None:
+                    questdb_log.write(f"\n===Query Records===\n{query[0]}\n")
+                    postgres_log.write(f"\n===Query Records===\n{query[1]}\n")
+                exported += 1
+    finally:
+        reader.close()
+    return exported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export or search a record store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write the text logs of the store")
+    export_parser.add_argument("store", nargs="?", default=DEFAULT_STORE_PATH)
+    export_parser.add_argument("--output-dir", default=".")
+    export_parser.add_argument("--round", type=int, default=None)
+    show_parser = commands.add_parser("show", help="print the matching records as JSON lines")
+    show_parser.add_argument("store", nargs="?", default=DEFAULT_STORE_PATH)
+    show_parser.add_argument("--seq", type=int, default=None)
+    show_parser.add_argument("--round", type=int, default=None)
+    show_parser.add_argument("--kind", choices=("comment", "select", "write"), default=None)
+    show_parser.add_argument("--outcome", choices=("ok", "mismatch", "questdb_error", "postgres_error", "both_error"), default=None)
+    show_parser.add_argument("--table", default=None)
+    args = parser.parse_args()
+    if args.command=="export":
+        print(f"exported {export(args.store, args.output_dir, args.round)} records")
+    else:
+        reader = RecordReader(args.store)
+        records = [reader.get(args.seq)] if args.seq is not None else reader.find(args.round, args.kind, args.outcome, args.table)
+        for record in records:
+            print(json.dumps(record))
+        reader.close()
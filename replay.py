@@ -0,0 +1,103 @@
+"""
+replays a recorded run (a record store or a diff_input.log) against both engines
+
+    python replay.py [./records | diff_input.log] [--workers N]
+
+records are streamed from the store or the log: consecutive SELECT pairs do not change
+any table, so they are compared concurrently on pooled connections, while
+DDL/DML pairs are barriers executed in order once every earlier SELECT is
+done. mismatches are reported to bug.log as in a regular run
+"""
+
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import main
+from driver import *
+from seeding import SeedSpec, seed_table
+from record_store import read_pairs
+
+REPLAY_WORKERS = 8
+# SELECT pairs submitted ahead of the ones being compared, per worker
+REPLAY_WINDOW = 4
+REPLAY_REPORT_INTERVAL = 10
+
+def parse_seed_record(record):
+    # "-- seed <table> rows=<n> seed=<seed>"
+    _, _, table, rows, seed = record.split(' ')
+    return table, int(rows.split('=')[1]), int(seed.split('=')[1])
+
+class ReplayStats:
+    def __init__(self):
+        self.statements = 0
+        self.selects = 0
+        self.questdb_success = 0
+        self.postgres_success = 0
+        self.bugs = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def add(self, questdb_success, postgres_success, mismatch=False):
+        self.statements += 1
+        self.questdb_success += questdb_success
+        self.postgres_success += postgres_success
+
+    def print(self):
+        elapsed = time.monotonic()-self.started
+        print(f"replayed:{self.statements} ({self.statements/max(elapsed, 1e-9):.1f}/s) selects:{self.selects} bugs:{self.bugs}")
+        if self.statements>0:
+            print(f"questdb query success rate:{float(self.questdb_success/self.statements)}")
+            print(f"postgres query success rate:{float(self.postgres_success/self.statements)}")
+
+def replay(path, workers=REPLAY_WORKERS):
+    stats = ReplayStats()
+    def sink(log_path, logstr):
+        # the replayed log is not appended to itself
+        if log_path=="./diff_input.log":
+            return
+        if log_path=="./bug.log":
+            with stats.lock:
+                stats.bugs += 1
+        main.log_writer.write(log_path, logstr)
+    main.set_log_sink(sink)
+    questdb_api, postgres_api = main.connect_backends(workers+1)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = []
+    def drain(limit):
+        while len(pending)>limit:
+            stats.add(*pending.pop(0).result())
+    last_report = time.monotonic()
+    try:
+        for query in read_pairs(path):
+            if query[0].startswith("--"):
+                if query[0].startswith("-- seed "):
+                    drain(0)
+                    table, rows, seed = parse_seed_record(query[0])
+                    seed_spec = SeedSpec(rows, **main.EVAL_CONFIG_SEED_DISTRIBUTION)
+                    seed_table(questdb_api, postgres_api, table, seed_spec, seed, *main.EVAL_CONFIG_SEED_METHODS)
+                continue
+            if "SELECT " in query[0] and "SELECT " in query[1]:
+                stats.selects += 1
+                pending.append(executor.submit(main.differential_testing, None, questdb_api, postgres_api, query))
+                drain(workers*REPLAY_WINDOW)
+            else:
+                drain(0)
+                stats.add(*main.differential_testing(None, questdb_api, postgres_api, query))
+            if time.monotonic()-last_report>=REPLAY_REPORT_INTERVAL:
+                stats.print()
+                last_report = time.monotonic()
+        drain(0)
+    finally:
+        executor.shutdown()
+        main.log_writer.flush()
+    stats.print()
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replay a recorded run against both engines")
+    parser.add_argument("log", nargs="?", default=main.EVAL_CONFIG_RECORD_STORE or "./diff_input.log",
+                        help="a record store directory or a diff_input.log")
+    parser.add_argument("--workers", type=int, default=REPLAY_WORKERS)
+    args = parser.parse_args()
+    replay(args.log, args.workers)
@@ -0,0 +1,156 @@
+"""
+cache of the reference engine answers
+a reference SELECT is keyed by its text and the version of every table
+it reads; versions are bumped by every write to a table, so an entry
+only answers the same query over exactly the same table contents.
+results are recorded while the comparison fetches them and kept once
+they were read to the end; entries are evicted least recently used,
+within a budget of cached rows
+"""
+
+import threading
+import collections
+from dedup import statement_tables
+
+DEFAULT_MAX_ROWS = 1000000
+# larger results are not cached, they would evict everything else
+DEFAULT_MAX_RESULT_ROWS = 10000
+# queries whose answer changes between executions (NOW() as rendered by
+# the postgres and sqlite profiles) always run
+NONDETERMINISTIC = ("NOW()", "'now'")
+
+class CachedStream:
+    # a cached result, served like a result stream
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+
+    def fetchmany(self, size):
+        chunk = self.rows[self.position:self.position+size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        pass
+
+class RecordingStream:
+    """
+    a reference result stream whose rows are kept while they are fetched,
+    the result is cached when the stream is closed after its last row
+    """
+
+    def __init__(self, stream, cache, key):
+        self.stream = stream
+        self.cache = cache
+        self.key = key
+        self.rows = []
+        self.exhausted = False
+
+    def fetchmany(self, size):
+        chunk = self.stream.fetchmany(size)
+        if len(chunk)==0:
+            self.exhausted = True
+        elif self.rows is not None:
+            self.rows.extend(chunk)
+            if len(self.rows)>self.cache.max_result_rows:
+                self.rows = None
+        return chunk
+
+    def close(self):
+        self.stream.close()
+        if self.exhausted and self.rows is not None:
+            self.cache.store(self.key, self.rows)
+        else:
+            # too large, or not read to the end (an early mismatch, a fetch error)
+            with self.cache.lock:
+                self.cache.uncacheable += 1
+        self.rows = None
+
+class ResultCache:
+    """
+    execute runs a statement through round_trip(api, query, budget) unless
+    a cached result answers it; results without rows (writes, errors) are
+    never cached, writes bump the version of their table. the budget of a
+    hit is marked cached: no statement ran, so it has no latency to observe
+    """
+
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS, max_result_rows=DEFAULT_MAX_RESULT_ROWS):
+        self.max_rows = max_rows
+        self.max_result_rows = max_result_rows
+        self.lock = threading.Lock()
+        # key -> rows, least recently used first
+        self.entries = collections.OrderedDict()
+        self.rows = 0
+        # table -> number of writes to it
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+
+    def reset(self):
+        # e.g., a new round: the tables were dropped or truncated
+        with self.lock:
+            self.entries.clear()
+            self.rows = 0
+            self.versions = {}
+
+    def key(self, query, tables):
+        # rendering is deterministic, the same statement is the same text
+        versions = ','.join(f"{table}:{self.versions.get(table, 0)}" for table in sorted(tables))
+        return f"{versions}\0{query}"
+
+    def execute(self, round_trip, api, query, budget=None):
+        reads, write = statement_tables(query)
+        if "SELECT " not in query or write is not None:
+            try:
+                return round_trip(api, query, budget)
+            finally:
+                if write is not None:
+                    # a failed write changed nothing, but a bump is always safe
+                    with self.lock:
+                        self.versions[write] = self.versions.get(write, 0)+1
+        if any(marker in query for marker in NONDETERMINISTIC):
+            with self.lock:
+                self.uncacheable += 1
+            return round_trip(api, query, budget)
+        with self.lock:
+            key = self.key(query, reads)
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            if budget is not None:
+                budget.cached = True
+            return CachedStream(entry)
+        result = round_trip(api, query, budget)
+        if not hasattr(result, "fetchmany"):
+            return result
+        return RecordingStream(result, self, key)
+
+    def store(self, key, rows):
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = rows
+            self.rows += len(rows)
+            while self.rows>self.max_rows and len(self.entries)>1:
+                _, evicted = self.entries.popitem(last=False)
+                self.rows -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits+self.misses
+            return {
+                "entries": len(self.entries),
+                "rows": self.rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits/lookups if lookups>0 else 0.0,
+                "evictions": self.evictions,
+                "uncacheable": self.uncacheable,
+            }
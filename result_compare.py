@@ -0,0 +1,128 @@
+import decimal
+import hashlib
+
+DEFAULT_CHUNK_SIZE = 1000
+# rows without a counterpart kept in memory before falling back to digests only
+DEFAULT_MAX_PENDING = 100000
+# differing rows kept for the bug report
+DEFAULT_SAMPLE_SIZE = 10
+
+# rows are digested with a 128 bit blake2b, digests are summed modulo 2**128
+DIGEST_BYTES = 16
+DIGEST_MASK = (1<<(8*DIGEST_BYTES))-1
+
+class FetchError(Exception):
+    """
+    a result stream failed while its rows were fetched
+    side: 0 for the tested engine, 1 for the reference engine
+    """
+
+    def __init__(self, side, error):
+        super().__init__(str(error))
+        self.side = side
+        self.error = error
+
+def normalize_row(row):
+    # postgres returns NUMERIC as Decimal, questdb returns floats
+    return tuple(float(each) if type(each)==decimal.Decimal else each for each in row)
+
+def canonical_value(value):
+    # values equal in python (1, 1.0, True) are encoded the same,
+    # as they are matched as the same row
+    if isinstance(value, (bool, int)):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def row_digest(row):
+    # strong hash of a canonical encoding of a normalized row, python's
+    # hash() collides on plain integers (hash(-1)==hash(-2))
+    encoded = repr(tuple(canonical_value(each) for each in row)).encode("utf-8", "backslashreplace")
+    return int.from_bytes(hashlib.blake2b(encoded, digest_size=DIGEST_BYTES).digest(), "little")
+
+class ResultComparison:
+    """
+    order-insensitive multiset comparison of two result streams
+    each side keeps a row count and an additive digest of its rows;
+    rows are also matched against each other by value, so that rows
+    without a counterpart are known (and can be sampled) at any time
+    """
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.max_pending = max_pending
+        self.sample_size = sample_size
+        self.rows = [0, 0]
+        self.digests = [0, 0]
+        # row -> [net count (side 0 positive, side 1 negative), row]
+        self.pending = {}
+        self.overflow = False
+        # a side that is not exhausted has at least self.rows[side] rows
+        self.exhausted = [False, False]
+
+    def add(self, side, rows):
+        sign = 1 if side==0 else -1
+        digest = self.digests[side]
+        for row in rows:
+            row = normalize_row(row)
+            digest += row_digest(row)
+            if self.overflow:
+                continue
+            entry = self.pending.get(row)
+            if entry is None:
+                self.pending[row] = [sign, row]
+                if len(self.pending)>self.max_pending:
+                    self.pending = {}
+                    self.overflow = True
+            else:
+                entry[0] += sign
+                if entry[0]==0:
+                    del self.pending[row]
+        self.digests[side] = digest & DIGEST_MASK
+        self.rows[side] += len(rows)
+
+    def differs(self):
+        if self.rows[0]!=self.rows[1] or self.digests[0]!=self.digests[1]:
+            return True
+        return not self.overflow and len(self.pending)>0
+
+    def samples(self, side):
+        # rows (with their surplus multiplicity) only seen on one side
+        sign = 1 if side==0 else -1
+        samples = []
+        for count, row in self.pending.values():
+            if count*sign>0:
+                samples.append((row, abs(count)))
+                if len(samples)>=self.sample_size:
+                    break
+        return samples
+
+    def describe(self, side):
+        rows = f"{self.rows[side]}{'' if self.exhausted[side] else '+'} rows"
+        if self.overflow:
+            return f"{rows}, digest {self.digests[side]:032x} (too many unmatched rows to sample)"
+        return f"{rows}, unmatched (row, count): {self.samples(side)}"
+
+def compare_streams(streams, chunk_size=DEFAULT_CHUNK_SIZE, max_pending=DEFAULT_MAX_PENDING, sample_size=DEFAULT_SAMPLE_SIZE):
+    """
+    reads both streams chunk by chunk, stops as soon as one side is
+    exhausted while the other one already returned more rows
+    """
+    comparison = ResultComparison(max_pending, sample_size)
+    done = comparison.exhausted
+    while not (done[0] and done[1]):
+        for side in (0, 1):
+            if done[side]:
+                continue
+            try:
+                chunk = streams[side].fetchmany(chunk_size)
+            except Exception as e:
+                raise FetchError(side, e)
+            if len(chunk)==0:
+                done[side] = True
+            else:
+                comparison.add(side, chunk)
+        for side in (0, 1):
+            if done[side] and comparison.rows[1-side]>comparison.rows[side]:
+                return comparison
+    return comparison
@@ -0,0 +1,213 @@
+"""
+coverage-feedback scheduling of the generator decisions
+every random decision of QueryGenerator that shapes a statement (statement
+kind, compounds, joins, predicates, data, SAMPLE BY) is an arm; the arms a
+statement was built from are rewarded once the pair has run:
+    rarity of its coverage (shared clauses and mapping rules it exercised)
+    + a bonus when only one engine failed, a larger one on a result mismatch
+rewards are averaged with exponential decay, so weights follow what paid
+off recently, and persisted so that a campaign resumes with them
+statements generated ahead of execution are rewarded through
+DelayedFeedback, which keeps a seeded run reproducible
+"""
+
+import os
+import json
+import math
+import time
+import atexit
+import threading
+from bug_index import query_clauses
+
+DEFAULT_WEIGHTS_PATH = "./scheduler.json"
+DEFAULT_SAVE_INTERVAL = 10
+# weight of the newest reward in an arm average
+DEFAULT_LEARNING_RATE = 0.05
+# floor of every arm weight, no option is ever starved
+DEFAULT_EXPLORATION = 0.1
+ERROR_REWARD = 0.5
+MISMATCH_REWARD = 2.0
+# untried arms look good until they are tried
+INITIAL_REWARD = 1.0
+
+# seconds between checks of a waiting generator for a stopped consumer
+FEEDBACK_POLL = 0.1
+
+# shared clause -> the mapping rule exercised by a pair containing it
+MAPPING_RULES = {"IN": "in", "BETWEEN": "between", "SAMPLE": "sample_by", "CAST": "types"}
+
+def coverage(query):
+    # the combination a pair covered: statement kind, clauses and mapping rules
+    kind = "SELECT" if "SELECT " in query[0] else query[0].split(' ', 1)[0]
+    clauses = query_clauses(query[0])
+    rules = [f"mapping:{MAPPING_RULES[clause]}" for clause in clauses if clause in MAPPING_RULES]
+    return '|'.join([kind]+clauses+rules)
+
+class Scheduler:
+    """
+    the generator asks choose() for every scheduled decision and the
+    testing loop reports the outcome of the statement with feedback()
+    """
+
+    def __init__(self, path=DEFAULT_WEIGHTS_PATH, learning_rate=DEFAULT_LEARNING_RATE,
+                 exploration=DEFAULT_EXPLORATION, save_interval=DEFAULT_SAVE_INTERVAL):
+        self.path = path
+        self.learning_rate = learning_rate
+        self.exploration = exploration
+        self.save_interval = save_interval
+        self.saved_at = time.monotonic()
+        self.lock = threading.Lock()
+        # decision -> {option: average reward}
+        self.arms = {}
+        # coverage combination -> executed pairs
+        self.combinations = {}
+        # (decision, option) of the statement being generated
+        self.trace = []
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.arms = state["arms"]
+            self.combinations = state["combinations"]
+        atexit.register(self.save)
+
+    def begin(self):
+        self.trace = []
+
+    def detach(self):
+        # the decisions of the statement just generated, for a later feedback
+        # (e.g., generated ahead of execution by a pipeline producer)
+        trace = self.trace
+        self.trace = []
+        return trace
+
+    def choose(self, rng, decision, options, key=str, priors=None):
+        """
+        options are weighted by their average reward (and prior weights),
+        key names an option in the persisted arms
+        """
+        weights = []
+        with self.lock:
+            rewards = self.arms.setdefault(decision, {})
+            for i, option in enumerate(options):
+                weight = self.exploration+rewards.get(key(option), INITIAL_REWARD)
+                weights.append(weight if priors is None else weight*priors[i])
+        option = rng.choices(options, weights)[0]
+        self.trace.append((decision, key(option)))
+        return option
+
+    def feedback(self, query, questdb_success, postgres_success, mismatch, trace=None):
+        combination = coverage(query)
+        with self.lock:
+            seen = self.combinations.get(combination, 0)
+            self.combinations[combination] = seen+1
+        reward = 1/math.sqrt(1+seen)
+        # a statement failing on both engines is just invalid
+        if questdb_success!=postgres_success:
+            reward += ERROR_REWARD
+        if mismatch:
+            reward += MISMATCH_REWARD
+        self.reward(reward, trace)
+        return reward
+
+    def skipped(self, trace=None):
+        # a repeated statement that was not run covered nothing new
+        self.reward(0.0, trace)
+
+    def reward(self, reward, trace=None):
+        # trace: a detached trace, None rewards the current one
+        with self.lock:
+            if trace is None:
+                trace = self.trace
+                self.trace = []
+            for decision, option in trace:
+                rewards = self.arms[decision]
+                average = rewards.get(option, INITIAL_REWARD)
+                rewards[option] = average+self.learning_rate*(reward-average)
+            save = time.monotonic()-self.saved_at>=self.save_interval
+        if save:
+            self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            # written next to the weights and renamed, a crash never leaves half a file
+            with open(self.path+".tmp", "w") as f:
+                json.dump({"arms": self.arms, "combinations": self.combinations}, f)
+            os.replace(self.path+".tmp", self.path)
+            self.saved_at = time.monotonic()
+
+    def summary(self):
+        # {decision: [(weight, option)]}, heaviest first
+        with self.lock:
+            return {decision: sorted(((reward, option) for option, reward in rewards.items()), reverse=True)
+                    for decision, rewards in self.arms.items()}
+
+class FeedbackStopped(Exception):
+    # the consumer of the statements stopped, no more feedback will come
+    pass
+
+class DelayedFeedback:
+    """
+    feedback of statements generated ahead of execution (e.g., by a
+    pipeline.PairProducer thread), applied by the generating thread in
+    statement order: statement n is generated once the feedback of every
+    statement up to n-lag was applied, and no later one, so the weights it
+    is drawn with do not depend on the timing of the threads and a seeded
+    run is reproduced; lag must exceed the statements generated but not yet
+    reported (queue depth and pairs in flight), lag 1 applies every
+    feedback before the next statement
+    stopped: an Event set when the consumer gave up, a waiting generator
+    then raises FeedbackStopped
+    """
+
+    def __init__(self, scheduler, lag=1, stopped=None):
+        self.scheduler = scheduler
+        self.lag = max(lag, 1)
+        self.stopped = stopped
+        self.condition = threading.Condition()
+        # statement number -> its trace, and its reported outcome (None: skipped)
+        self.traces = {}
+        self.outcomes = {}
+        self.generated = 0
+        self.applied = 0
+
+    def _apply(self, limit):
+        # the feedback of the statements numbered below limit, in order
+        while self.applied<limit:
+            with self.condition:
+                while self.applied not in self.outcomes:
+                    if self.stopped is not None and self.stopped.is_set():
+                        raise FeedbackStopped(f"no feedback for statement {self.applied}")
+                    self.condition.wait(FEEDBACK_POLL)
+                outcome = self.outcomes.pop(self.applied)
+            trace = self.traces.pop(self.applied)
+            if outcome is None:
+                self.scheduler.skipped(trace)
+            else:
+                self.scheduler.feedback(*outcome, trace=trace)
+            self.applied += 1
+
+    def before(self):
+        # generating thread, before every statement
+        self._apply(self.generated-self.lag+1)
+
+    def detach(self):
+        # generating thread, after every statement: returns its number
+        number = self.generated
+        self.traces[number] = self.scheduler.detach()
+        self.generated += 1
+        return number
+
+    def skipped(self, number):
+        with self.condition:
+            self.outcomes[number] = None
+
+    def feedback(self, number, query, questdb_success, postgres_success, mismatch):
+        with self.condition:
+            self.outcomes[number] = (query, questdb_success, postgres_success, mismatch)
+            self.condition.notify_all()
+
+    def finish(self):
+        # once the generator is done: the feedback still pending
+        self._apply(self.generated)
@@ -0,0 +1,189 @@
+"""
+bulk seeding of the fuzz tables
+the rows of a table are generated once from a seed and loaded into both
+engines in bulk, instead of one INSERT round-trip per row:
+    postgres: COPY FROM STDIN (or batched multi-row INSERT)
+    questdb: InfluxDB line protocol (or batched multi-row INSERT)
+    sqlite: one prepared INSERT executed with many parameter rows
+"""
+
+import io
+import time
+import random
+import datetime
+from clause_map import MAPPING_PROFILES
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DAY_MICROS = 24*60*60*1000000
+COPY_NULL = "\\N"
+
+# rows per COPY / line protocol chunk, and per multi-row INSERT statement
+SEED_STREAM_BATCH = 100000
+SEED_INSERT_BATCH = 1000
+# seconds to wait for line protocol rows to be committed by questdb
+SEED_VISIBLE_TIMEOUT = 60
+
+class SeedSpec:
+    """
+    value distributions of the seeded rows (c0 INT, c1 STRING, c2 TIMESTAMP)
+    the defaults follow QueryGenerator.random_insert_query
+    """
+
+    def __init__(self, rows, int_range=(-1000, 1000), string_length=(1, 5), distinct_strings=1000,
+                 timestamp_end=datetime.datetime(2024, 1, 1), timestamp_days=30, null_rate=0.05):
+        self.rows = rows
+        self.int_range = int_range
+        self.string_length = string_length
+        # c1 is a SYMBOL in questdb, a bounded vocabulary keeps it realistic
+        self.distinct_strings = distinct_strings
+        # timestamps are spread over the timestamp_days days before timestamp_end
+        self.timestamp_end = timestamp_end
+        self.timestamp_days = timestamp_days
+        # share of NULLs in c0 and c1 (c2 is the designated timestamp in questdb)
+        self.null_rate = null_rate
+
+def generate_rows(spec, seed):
+    """
+    returns the seeded rows as (c0, c1, epoch micros), ordered by time
+    the same spec and seed always give the same rows
+    """
+    rng = random.Random(seed)
+    low, high = spec.int_range
+    ints = rng.choices(range(low, high+1), k=spec.rows)
+    # lowercase letters only: no escaping in COPY or line protocol
+    vocabulary = [
+        ''.join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(*spec.string_length)))
+        for _ in range(spec.distinct_strings)
+    ]
+    strings = rng.choices(vocabulary, k=spec.rows)
+    end = (spec.timestamp_end-EPOCH)//datetime.timedelta(microseconds=1)
+    start = end-spec.timestamp_days*DAY_MICROS
+    # ordered timestamps are appended by questdb without out-of-order merges
+    span = end-start
+    uniform = rng.random
+    timestamps = sorted(start+int(uniform()*span) for _ in range(spec.rows))
+    null_rate = spec.null_rate
+    if null_rate<=0:
+        return list(zip(ints, strings, timestamps))
+    rows = []
+    for c0, c1, c2 in zip(ints, strings, timestamps):
+        if uniform()<null_rate:
+            c0 = None
+        if uniform()<null_rate:
+            c1 = None
+        rows.append((c0, c1, c2))
+    return rows
+
+def timestamp_text(micros):
+    return (EPOCH+datetime.timedelta(microseconds=micros)).isoformat()
+
+def batches(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i+size]
+
+def copy_text(rows):
+    # postgres COPY text format, \N is NULL, c2 stays in epoch micros
+    buffer = io.StringIO()
+    for c0, c1, c2 in rows:
+        c0 = COPY_NULL if c0 is None else c0
+        c1 = COPY_NULL if c1 is None else c1
+        buffer.write(f"{c0}\t{c1}\t{c2}\n")
+    buffer.seek(0)
+    return buffer
+
+def ilp_lines(table, rows):
+    # one line per row: table[,c1=<symbol>] c0=<int>i <designated timestamp in ns>
+    # a NULL symbol is an omitted tag, rows must have a c0 field
+    lines = []
+    for c0, c1, c2 in rows:
+        tag = "" if c1 is None else f",c1={c1}"
+        lines.append(f"{table}{tag} c0={c0}i {c2*1000}\n")
+    return ''.join(lines).encode()
+
+def sql_string(value):
+    # SQL string literal, quotes are doubled (not python's repr escaping)
+    return "'"+value.replace("'", "''")+"'"
+
+def row_literals(row):
+    c0, c1, c2 = row
+    return ['NULL' if c0 is None else str(c0), 'NULL' if c1 is None else sql_string(c1), sql_string(timestamp_text(c2))]
+
+def insert_statement(table, rows):
+    values = [f"({','.join(row_literals(row))})" for row in rows]
+    return f"INSERT INTO {table} VALUES {','.join(values)};"
+
+def insert_prepared(api, table, rows):
+    # the template is parsed once, every batch is one execution
+    param = MAPPING_PROFILES[api.dialect]["param"]
+    template = f"INSERT INTO {table} VALUES ({param(1)},{param(2)},{param(3)});"
+    for batch in batches(rows, SEED_INSERT_BATCH):
+        api.write_many(template, [row_literals(row) for row in batch])
+
+def seed_postgres(postgres_api, table, rows, method="copy"):
+    if method=="copy":
+        # formatting timestamps in python costs more than the whole load,
+        # they are copied as integers and converted by postgres
+        staging = f"{table}_seed"
+        postgres_api.write_query(f"CREATE UNLOGGED TABLE {staging} (c0 INT, c1 VARCHAR(64), c2 BIGINT);")
+        try:
+            postgres_api.copy_from(staging, (copy_text(batch) for batch in batches(rows, SEED_STREAM_BATCH)))
+            postgres_api.write_query(
+                f"INSERT INTO {table} SELECT c0, c1, TIMESTAMP 'epoch'+c2*INTERVAL '1 microsecond' FROM {staging};")
+        finally:
+            postgres_api.write_query(f"DROP TABLE IF EXISTS {staging};")
+    elif method=="prepared":
+        insert_prepared(postgres_api, table, rows)
+    else:
+        for batch in batches(rows, SEED_INSERT_BATCH):
+            postgres_api.write_query(insert_statement(table, batch))
+
+def seed_questdb(questdb_api, table, rows, method="ilp"):
+    if method=="ilp":
+        # a line needs at least one field, rows with a NULL c0 are inserted
+        lines = [row for row in rows if row[0] is not None]
+        others = [row for row in rows if row[0] is None]
+        questdb_api.send_lines(ilp_lines(table, batch) for batch in batches(lines, SEED_STREAM_BATCH))
+    elif method=="prepared":
+        # seed_questdb also seeds the tested backend when it is not questdb
+        insert_prepared(questdb_api, table, rows)
+        return
+    else:
+        others = rows
+    for batch in batches(others, SEED_INSERT_BATCH):
+        questdb_api.write_query(insert_statement(table, batch))
+    if method=="ilp":
+        # line protocol writes are committed asynchronously
+        wait_for_rows(questdb_api, table, len(rows))
+
+def wait_for_rows(api, table, expected, timeout=SEED_VISIBLE_TIMEOUT):
+    deadline = time.monotonic()+timeout
+    # a group of fan-out targets (fanout.TargetGroup) waits for each of them
+    for each in getattr(api, "apis", [api]):
+        while True:
+            count = each.query(f"SELECT count(*) FROM {table}")[0][0]
+            if count>=expected:
+                break
+            if time.monotonic()>deadline:
+                raise TimeoutError(f"{table}: {count} of {expected} seeded rows visible after {timeout}s")
+            time.sleep(0.1)
+
+def supported_method(api, method):
+    # backends without the configured bulk-load method (e.g., sqlite) use their preferred one
+    return method if method in api.seed_methods else api.seed_methods[0]
+
+def seed_table(questdb_api, postgres_api, table, spec, seed, questdb_method="ilp", postgres_method="copy"):
+    rows = generate_rows(spec, seed)
+    seed_questdb(questdb_api, table, rows, supported_method(questdb_api, questdb_method))
+    seed_postgres(postgres_api, table, rows, supported_method(postgres_api, postgres_method))
+
+def seed_tables(questdb_api, postgres_api, tables, spec, rng, questdb_method="ilp", postgres_method="copy"):
+    """
+    seeds every table with its own rows, returns {table: seed}
+    the per-table seeds are drawn from rng (the generator RNG), so a
+    seeded campaign also reproduces its data
+    """
+    seeds = {}
+    for table in tables:
+        seeds[table] = rng.randrange(2**32)
+        seed_table(questdb_api, postgres_api, table, spec, seeds[table], questdb_method, postgres_method)
+    return seeds
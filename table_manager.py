@@ -0,0 +1,128 @@
+"""
+lifecycle of the fuzz tables
+every round of the testing loop works on three new tables; the manager
+tracks the tables it created on both engines and, at round end, drops
+them or truncates them for the next round. tables are named
+<prefix><8 letters>, so that the leftovers of crashed runs are swept by
+their prefix at startup and shutdown; only names the manager itself would
+create are swept, a longer prefix (e.g. fuzz_w3_ of a campaign worker
+running next to a plain fuzz_ run) belongs to someone else.
+seeded contents can be kept as template tables (a CREATE TABLE ... AS
+snapshot of the first tables seeded with them): later rounds restore
+their tables with a server-side INSERT ... SELECT copy of a template,
+instead of generating and bulk-loading the rows again
+"""
+
+import re
+from seeding import seed_table, seed_tables
+
+# the designated timestamp of the fuzz tables (QueryGenerator.random_create_query)
+TIMESTAMP_COLUMN = "c2"
+ROUND_END_POLICIES = ("drop", "truncate", "keep")
+
+def owned_tables(prefix):
+    # fuzz tables (QueryGenerator.init_table), their seeding staging tables
+    # (seeding.seed_postgres) and the templates, all of this prefix only
+    return re.compile(re.escape(prefix)+r"(?:[a-z]{8}(?:_seed)?|template[0-9]+)")
+
+class TableManager:
+    """
+    round_end: "drop" the tables of a finished round, "truncate" them to be
+    reused by the next round, or "keep" them (e.g., to inspect a bug)
+    templates: seeded datasets kept as template tables, 0 seeds every table anew
+    """
+
+    def __init__(self, questdb_api, postgres_api, prefix, round_end="drop", templates=0):
+        if round_end not in ROUND_END_POLICIES:
+            raise ValueError(f"round_end must be one of {ROUND_END_POLICIES}, not {round_end!r}")
+        self.apis = [questdb_api, postgres_api]
+        self.prefix = prefix
+        self.round_end = round_end
+        self.template_count = templates
+        # tables of the current round, and their create query pairs
+        self.tables = []
+        self.create_queries = []
+        # truncated tables of the previous round, reused by the next one
+        self.spares = None
+        # seed -> template table
+        self.templates = {}
+        self.dropped = 0
+
+    def sweep(self):
+        """
+        drops the tables named by the manager of this prefix, on both engines
+        an empty prefix names every table, nothing is swept then
+        """
+        if self.prefix=="":
+            return 0
+        owned = owned_tables(self.prefix)
+        dropped = 0
+        for api in self.apis:
+            for table in api.list_tables():
+                if owned.fullmatch(table):
+                    api.write_query(f"DROP TABLE IF EXISTS {table};")
+                    dropped += 1
+        self.tables = []
+        self.spares = None
+        self.templates = {}
+        self.dropped += dropped
+        return dropped
+
+    def new_round(self, query_generator):
+        # same return value as QueryGenerator.init_table
+        if self.spares is not None:
+            self.tables, self.create_queries = self.spares
+            self.spares = None
+            query_generator.tables = list(self.tables)
+        else:
+            tables, *create_queries = query_generator.init_table(*self.apis)
+            self.tables, self.create_queries = list(tables), create_queries
+        return (list(self.tables), *self.create_queries)
+
+    def end_round(self):
+        if self.round_end=="keep":
+            self.tables = []
+            return
+        for table in self.tables:
+            for api in self.apis:
+                if self.round_end=="drop":
+                    api.write_query(f"DROP TABLE IF EXISTS {table};")
+                else:
+                    api.truncate_table(table)
+        if self.round_end=="drop":
+            self.dropped += len(self.tables)
+        else:
+            self.spares = (self.tables, self.create_queries)
+        self.tables = []
+
+    def seed(self, tables, spec, rng, questdb_method="ilp", postgres_method="copy"):
+        """
+        same as seeding.seed_tables, returns {table: seed}: the seeds stay
+        the seeds of the rows, replay regenerates the data from them
+        """
+        if self.template_count<=0:
+            return seed_tables(*self.apis, tables, spec, rng, questdb_method, postgres_method)
+        seeds = {}
+        for table in tables:
+            if len(self.templates)<self.template_count:
+                seed = rng.randrange(2**32)
+                seed_table(*self.apis, table, spec, seed, questdb_method, postgres_method)
+                template = f"{self.prefix}template{len(self.templates)}"
+                for api in self.apis:
+                    api.copy_table(table, template, TIMESTAMP_COLUMN)
+                self.templates[seed] = template
+            else:
+                seed = rng.choice(list(self.templates))
+                for api in self.apis:
+                    api.write_query(f"INSERT INTO {table} SELECT * FROM {self.templates[seed]};")
+            seeds[table] = seed
+        return seeds
+
+    def close(self, sweep=True):
+        # shutdown: the last round and the templates go as well
+        if self.round_end=="keep":
+            return
+        if sweep and self.prefix!="":
+            self.sweep()
+        else:
+            self.end_round()
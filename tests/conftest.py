@@ -0,0 +1,38 @@
+import os
+import sys
+import pytest
+
+# the modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class LogRecords:
+    # a main.log_sink keeping the records instead of writing the logs
+    def __init__(self):
+        self.records = []
+
+    def write(self, path, logstr):
+        self.records.append((path, logstr))
+
+    def of(self, path):
+        return [logstr for each, logstr in self.records if each==path]
+
+@pytest.fixture
+def main_logs(tmp_path, monkeypatch):
+    """
+    main with its outputs (logs, bug index, metrics, records) kept away
+    from the working tree; the log records are returned
+    """
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("tqdm")
+    import main
+    from bug_index import BugIndex
+    from metrics import Metrics
+    monkeypatch.chdir(tmp_path)
+    logs = LogRecords()
+    monkeypatch.setattr(main, "log_sink", logs.write)
+    monkeypatch.setattr(main, "bug_index", BugIndex(str(tmp_path/"bug_index.json")))
+    monkeypatch.setattr(main, "metrics", Metrics(str(tmp_path/"metrics"), export_interval=3600))
+    monkeypatch.setattr(main, "record_store", None)
+    monkeypatch.setattr(main, "result_cache", None)
+    monkeypatch.setattr(main, "statement_timeouts", [None, None])
+    return logs
@@ -0,0 +1,48 @@
+import argparse
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("tqdm")
+import main
+import benchmark
+
+def arguments(**values):
+    defaults = dict(queries=20, repeat=1, seed=0, baseline=None, backend="stub", latency=0.0, max_rows=100)
+    return argparse.Namespace(**dict(defaults, **values))
+
+@pytest.fixture
+def silent_main(main_logs, monkeypatch):
+    # the benchmarks reconfigure main, restored after the test
+    for name in ("EVAL_CONFIG_SEED_ROWS", "EVAL_CONFIG_ROUND_QUERIES", "EVAL_CONFIG_BACKENDS"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    return main_logs
+
+def test_flatten_keeps_numeric_leaves():
+    results = {"loop": {"pairs_per_second": 10, "backend": "stub", "stage_mean_us": {"log": 1.5}}, "ok": True}
+    assert benchmark.flatten(results)=={"loop.pairs_per_second": 10, "loop.stage_mean_us.log": 1.5}
+
+def test_latency_groups_by_query_length():
+    corpus = ["x"*100, "x"*150, "x"*3000]
+    groups = benchmark.latency_groups(corpus, [0.001, 0.003, 0.002])
+    assert list(groups)==["<=200", ">2000"]
+    assert groups["<=200"]["queries"]==2 and groups["<=200"]["mean_us"]==pytest.approx(2000)
+
+def test_stub_connectors_agree():
+    stream = benchmark.StubConnector(rows=5).query_stream("SELECT 1")
+    assert stream.fetchmany(3)==[(0, 4.0, "s0"), (1, 4.0, "s1"), (2, 4.0, "s2")]
+    assert len(stream.fetchmany(3))==2 and stream.fetchmany(3)==[]
+    stream.close()
+
+def test_compare_benchmark(silent_main):
+    results = benchmark.bench_compare(arguments())
+    assert list(results)==["10", "100"]
+    assert silent_main.records==[]
+
+def test_loop_benchmark_on_stub_connectors(silent_main):
+    results = benchmark.bench_loop(arguments())
+    assert results["pairs_per_second"]>0
+    assert main.metrics.snapshot()["errors"]=={"questdb": 0, "postgres": 0}
+
+def test_loop_benchmark_on_sqlite(silent_main):
+    results = benchmark.bench_loop(arguments(backend="sqlite"))
+    assert results["backend"]=="sqlite" and main.metrics.snapshot()["pairs"]>0
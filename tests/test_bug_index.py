@@ -0,0 +1,51 @@
+import json
+from types import SimpleNamespace
+from bug_index import BugIndex, abstract_query, bug_fingerprint, difference_shape, query_clauses
+
+def comparison(questdb_rows, postgres_rows):
+    return SimpleNamespace(rows=[questdb_rows, postgres_rows])
+
+def test_abstract_query_hides_tables_columns_and_literals():
+    query = "SELECT T1.c0 FROM fuzz_abcdefgh AS T1 WHERE T1.c1 IN (0,1,2,NULL) AND T1.c2='x'"
+    assert abstract_query(query)=="SELECT c FROM t AS T1 WHERE c IN (?,NULL) AND c=?"
+
+def test_query_clauses():
+    assert query_clauses("SELECT c0 FROM t AS T1 CROSS JOIN u AS T2 WHERE c0 BETWEEN 1 AND 2")==["CROSS_JOIN", "JOIN", "BETWEEN"]
+
+def test_difference_shape():
+    assert difference_shape(comparison(3, 3))=="rows="
+    assert difference_shape(comparison(0, 2))=="rows< empty:q"
+    assert difference_shape(comparison(2, 0))=="rows> empty:p"
+
+def test_fingerprint_ignores_tables_and_literals():
+    first = "SELECT T1.c0 FROM fuzz_aaaaaaaa AS T1 WHERE T1.c0 IN (0,1,2,NULL)"
+    second = "SELECT T1.c1 FROM fuzz_bbbbbbbb AS T1 WHERE T1.c1 IN (5,NULL)"
+    other = "SELECT T1.c1 FROM fuzz_bbbbbbbb AS T1 WHERE T1.c1 NOT IN (5)"
+    fingerprint, details = bug_fingerprint([first, first], comparison(1, 2))
+    assert bug_fingerprint([second, second], comparison(4, 7))[0]==fingerprint
+    assert bug_fingerprint([second, second], comparison(7, 4))[0]!=fingerprint
+    assert bug_fingerprint([other, other], comparison(1, 2))[0]!=fingerprint
+    assert details["clauses"]==["IN"]
+
+def test_record_keeps_the_first_examples(tmp_path):
+    index = BugIndex(str(tmp_path/"bug_index.json"), examples=2, save_interval=3600)
+    assert [index.record("f", {"clauses": []}, [f"q{i}", f"p{i}"]) for i in range(4)]==[True, True, False, False]
+    assert index.record("g", {"clauses": []}, ["q", "p"])
+    assert [(count, fingerprint) for count, fingerprint, _ in index.summary()]==[(4, "f"), (1, "g")]
+    assert index.entries["f"]["examples"]==[["q0", "p0"], ["q1", "p1"]]
+
+def test_index_is_saved_and_reloaded(tmp_path):
+    path = str(tmp_path/"bug_index.json")
+    index = BugIndex(path, save_interval=3600)
+    index.record("f", {"clauses": ["IN"]}, ["q", "p"])
+    index.save()
+    assert json.load(open(path))["f"]["count"]==1
+    reloaded = BugIndex(path)
+    assert reloaded.record("f", {"clauses": ["IN"]}, ["q", "p"])
+    assert reloaded.entries["f"]["count"]==2
+
+def test_record_saves_after_the_interval(tmp_path):
+    path = tmp_path/"bug_index.json"
+    index = BugIndex(str(path), save_interval=0)
+    index.record("f", {}, ["q", "p"])
+    assert path.exists() and not index.changed
@@ -0,0 +1,44 @@
+import queue
+import multiprocessing
+import pytest
+
+def test_forwarded_records_and_bugs():
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("tqdm")
+    import campaign
+    channel = queue.Queue()
+    index = campaign.ForwardingBugIndex(3, channel)
+    # the coordinator decides whether the mismatch is reported
+    assert index.record("fp", {}, ["q0", "q1"], "report") is False
+    campaign.ForwardingRecordStore(3, channel).append(("q0", "q1"), 2, "ok")
+    assert channel.get_nowait()==("bug", 3, ("fp", {}, ["q0", "q1"], "report"))
+    assert channel.get_nowait()==("record", 3, (["q0", "q1"], 2, "ok"))
+
+@pytest.mark.skipif(multiprocessing.get_start_method()!="fork", reason="workers inherit the test configuration by fork")
+def test_campaign_workers_record_through_the_coordinator(main_logs, tmp_path, monkeypatch):
+    import main
+    import campaign
+    from log_writer import BufferedLogWriter
+    from record_store import RecordReader, RecordStore
+    writer = BufferedLogWriter(sync_paths=["./bug.log"])
+    store = RecordStore(str(tmp_path/"records"))
+    monkeypatch.setattr(main, "log_writer", writer)
+    monkeypatch.setattr(main, "record_store", store)
+    monkeypatch.setattr(main, "EVAL_CONFIG_BACKENDS", ("sqlite", "sqlite"))
+    monkeypatch.setattr(main, "EVAL_CONFIG_ROUND_QUERIES", 30)
+    monkeypatch.setattr(main, "EVAL_CONFIG_SCHEDULER", False)
+    monkeypatch.setattr(main, "EVAL_CONFIG_STATEMENT_TIMEOUTS", (None, None))
+    campaign.run_campaign(2, base_seed=11, max_rounds=1)
+    writer.close()
+    store.close()
+    reader = RecordReader(str(tmp_path/"records"))
+    try:
+        records = list(reader.range())
+    finally:
+        reader.close()
+    assert {record["worker"] for record in records}=={0, 1}
+    for record in records:
+        # every worker works on tables of its own prefix
+        if record["outcome"] is not None and "fuzz_" in record["queries"][0]:
+            assert f"fuzz_w{record['worker']}_" in record["queries"][0]
+    assert sum(record["outcome"] is not None for record in records)==2*30
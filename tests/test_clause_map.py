@@ -0,0 +1,41 @@
+import sqlite3
+from clause_map import ClauseMapping
+
+def test_in_follows_postgres_null_semantics():
+    questdb, postgres = ClauseMapping().main("SELECT c0 IN (0,NULL) FROM test;")
+    assert questdb=="SELECT CASE WHEN c0 IS NULL THEN NULL::BOOLEAN ELSE c0 IN (0,NULL) END FROM test;"
+    # the NULL of the list is dropped, c0 IN (0) is NULL for a NULL c0 only
+    assert postgres=="SELECT CASE WHEN c0 IS NULL THEN NULL ELSE c0 IN (0) END FROM test;"
+
+def test_not_between_is_symmetric_in_postgres():
+    questdb, postgres = ClauseMapping().main("SELECT * FROM t WHERE c0 NOT BETWEEN 5 AND 1")
+    assert questdb.startswith("SELECT * FROM t WHERE CASE WHEN c0 IS NULL THEN NULL::BOOLEAN WHEN 5 IS NULL")
+    assert questdb.endswith("ELSE c0 NOT BETWEEN 5 AND 1 END")
+    assert postgres=="SELECT * FROM t WHERE c0 NOT BETWEEN SYMMETRIC 5 AND 1"
+
+def test_every_clause_is_mapped_once_in_order():
+    mapping = ClauseMapping()
+    query = "SELECT c0 NOT IN (1) FROM t WHERE c0 BETWEEN 1 AND 2 AND c1 IN ('a','b')"
+    assert [(rule, parts) for rule, _, _, parts in mapping.extract_operations(query)]==[
+        ("in", ["c0", "NOT ", "(1)"]), ("between", ["c0", "", "1", "2"]), ("in", ["c1", "", "('a','b')"])]
+    postgres = mapping.main(query)[1]
+    assert postgres.count("CASE WHEN")==2 and "BETWEEN SYMMETRIC 1 AND 2" in postgres
+
+def test_types_and_formatting():
+    questdb, postgres = ClauseMapping().main("CREATE TABLE t (c0 INT,  c1 STRING, c2 TIMESTAMP)")
+    assert questdb=="CREATE TABLE t (c0 INT,c1 SYMBOL,c2 TIMESTAMP)"
+    assert postgres=="CREATE TABLE t (c0 INT,c1 VARCHAR(64),c2 TIMESTAMP)"
+
+def test_sample_by_is_grouped_by_day_in_postgres():
+    questdb, postgres = ClauseMapping().main("SELECT COUNT(*) FROM t AS T1 SAMPLE BY 1d")
+    assert questdb=="SELECT COUNT(*) FROM t AS T1 SAMPLE BY 1d"
+    assert postgres=="SELECT sample_by_result from (SELECT COUNT(*) AS sample_by_result, EXTRACT(DAY FROM T1.c2) AS d FROM t AS T1 GROUP BY d)"
+
+def test_sqlite_mappings_run_on_sqlite():
+    query = "SELECT c0 FROM t WHERE c0 BETWEEN 3 AND 1 AND c0 NOT IN (2,NULL) AND c2<NOW()"
+    sqlite_query = ClauseMapping(("questdb", "sqlite")).main(query)[1]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (c0 INT, c2 TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, '2020-01-01 00:00:00')", [(0,), (1,), (2,), (3,), (None,)])
+    # BETWEEN SYMMETRIC: 3 AND 1 is the range [1, 3]
+    assert sorted(conn.execute(sqlite_query).fetchall())==[(1,), (3,)]
@@ -0,0 +1,55 @@
+import hashlib
+from dedup import BloomFilter, ScalableBloomFilter, SeenQueries, statement_tables
+
+def digest(i):
+    return hashlib.blake2b(str(i).encode(), digest_size=16).digest()
+
+def test_statement_tables():
+    assert statement_tables("SELECT T1.c0 FROM fuzz_a AS T1 CROSS JOIN fuzz_b AS T2")==({"fuzz_a", "fuzz_b"}, None)
+    assert statement_tables("INSERT INTO fuzz_a VALUES (1);")==(set(), "fuzz_a")
+    assert statement_tables("DROP TABLE IF EXISTS fuzz_a")[1]=="fuzz_a"
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(digest(i))
+    assert all(digest(i) in bloom for i in range(1000))
+    false_positives = sum(digest(i) in bloom for i in range(1000, 11000))
+    assert false_positives<300
+
+def test_scalable_filter_grows_and_keeps_earlier_keys():
+    bloom = ScalableBloomFilter(capacity=100, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(digest(i))
+    assert len(bloom.filters)>1 and bloom.filters[1].capacity==200
+    assert all(digest(i) in bloom for i in range(1000))
+    assert sum(digest(i) in bloom for i in range(1000, 11000))<200
+
+def test_scalable_filter_starts_over_past_max_keys():
+    bloom = ScalableBloomFilter(capacity=10, max_keys=20)
+    for i in range(21):
+        bloom.add(digest(i))
+    assert bloom.count==1 and digest(20) in bloom
+
+def test_repeated_select_is_skipped_until_its_table_is_written():
+    seen = SeenQueries()
+    select = ["SELECT c0 FROM fuzz_a AS T1", "SELECT c0 FROM fuzz_a AS T1"]
+    other = ["SELECT c0 FROM fuzz_b AS T1", "SELECT c0 FROM fuzz_b AS T1"]
+    insert = ["INSERT INTO fuzz_a VALUES (1);"]*2
+    assert [seen.check(select), seen.check(select), seen.check(other)]==[False, True, False]
+    # writes are never repeats, and make the readers of their table new
+    assert not seen.check(insert) and not seen.check(insert)
+    assert not seen.check(select) and seen.check(other)
+    assert seen.duplicate_rate()==2/5
+
+def test_pairs_differing_on_one_side_are_new():
+    seen = SeenQueries()
+    assert not seen.check(["SELECT c0 FROM fuzz_a", "SELECT c0 FROM fuzz_a"])
+    assert not seen.check(["SELECT c0 FROM fuzz_a", "SELECT CAST(c0 AS INT) FROM fuzz_a"])
+
+def test_reset_forgets_seen_pairs():
+    seen = SeenQueries()
+    select = ["SELECT c0 FROM fuzz_a", "SELECT c0 FROM fuzz_a"]
+    seen.check(select)
+    seen.reset()
+    assert not seen.check(select)
@@ -0,0 +1,316 @@
+import sqlite3
+import datetime
+import time
+import threading
+import collections
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+import driver
+from query_ast import Prepared
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = []
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(query)
+        if "fail" in query and not query.startswith("ROLLBACK"):
+            raise RuntimeError("statement failed")
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size):
+        return []
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    # records the statements and transactions of one connection
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.statements = collections.OrderedDict()
+        self.statement_ids = iter(range(1000))
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return self.status
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+    monkeypatch.setattr(driver.psycopg2, "connect", connect)
+    return opened
+
+def fake_pool(size=2, ping_interval=driver.DEFAULT_PING_INTERVAL):
+    opened = []
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+    return driver.ConnectionPool(connect, size, ping_interval), opened
+
+def test_pool_reuses_idle_connections():
+    pool, opened = fake_pool()
+    for _ in range(5):
+        with pool.connection() as conn:
+            conn.cursor().execute("SELECT 1")
+    assert len(opened)==1
+    assert pool.stats()=={"handshakes": 1, "handshakes_avoided": 4, "reconnects": 0}
+
+def test_pool_replaces_broken_connections():
+    pool, opened = fake_pool()
+    with pool.connection() as conn:
+        pass
+    conn.closed = 1
+    with pool.connection() as replacement:
+        assert replacement is not conn
+    assert len(opened)==2 and pool.stats()["reconnects"]==1
+
+def test_pool_pings_stale_connections():
+    pool, opened = fake_pool(ping_interval=0)
+    with pool.connection():
+        pass
+    with pool.connection() as conn:
+        assert conn.executed==["SELECT 1"]
+
+def test_pool_resets_aborted_transactions():
+    pool, opened = fake_pool()
+    with pool.connection() as conn:
+        conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    assert conn.rollbacks==1
+
+def test_exhausted_pool_waits_for_a_release():
+    pool, opened = fake_pool(size=1)
+    conn = pool.acquire()
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()), daemon=True)
+    thread.start()
+    thread.join(0.2)
+    assert acquired==[]
+    pool.release(conn)
+    thread.join(5)
+    assert acquired==[conn] and len(opened)==1
+
+def test_prune_drops_broken_idle_connections():
+    pool, opened = fake_pool()
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    first.closed = 1
+    pool.prune()
+    assert pool.opened==1 and pool.stats()["reconnects"]==1
+
+def grouped_connector(pool_size, group_commit=100):
+    connector = driver.PostgresConnector(pool_size)
+    connector.group_commit = group_commit
+    return connector
+
+def test_writer_is_reserved_outside_the_pool(connections):
+    connector = grouped_connector(2)
+    connector.write_query("INSERT INTO fuzz_t VALUES (1);")
+    opened = []
+    def open_streams():
+        # would wait forever if the writer held one of the two pooled connections
+        opened.extend(connector.query_stream(f"SELECT {i} FROM fuzz_t") for i in range(2))
+    thread = threading.Thread(target=open_streams, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert len(opened)==2
+    for stream in opened:
+        stream.close()
+    assert connector.pool.opened==2 and connector.writer_pool.opened==1
+
+def test_pending_writes_are_committed_before_reads(connections):
+    connector = grouped_connector(1)
+    connector.write_query("INSERT INTO fuzz_t VALUES (1);")
+    connector.write_query("INSERT INTO fuzz_t VALUES (2);")
+    writer = connector.writer
+    assert writer.commits==0 and connector.pending==2
+    connector.query("SELECT * FROM fuzz_t")
+    assert writer.commits==1 and connector.pending==0
+    assert connector.transaction_stats()["commits"]==1
+
+def test_group_is_committed_when_full(connections):
+    connector = grouped_connector(1, group_commit=3)
+    for i in range(7):
+        connector.write_query(f"INSERT INTO fuzz_t VALUES ({i});")
+    assert connector.writer.commits==2 and connector.pending==1
+
+def test_failing_write_is_rolled_back_to_its_savepoint(connections):
+    connector = grouped_connector(1)
+    connector.write_query("INSERT INTO fuzz_t VALUES (1);")
+    with pytest.raises(RuntimeError):
+        connector.write_query("INSERT INTO fuzz_t VALUES (fail);")
+    writer = connector.writer
+    assert writer.executed[-1]=="ROLLBACK TO SAVEPOINT fuzz_write"
+    assert connector.pending==1 and connector.transaction_stats()["savepoint_rollbacks"]==1
+    # the same connection keeps the earlier write of the transaction
+    connector.write_query("INSERT INTO fuzz_t VALUES (2);")
+    assert connector.writer is writer
+
+def test_single_writes_commit_on_a_pooled_connection(connections):
+    connector = grouped_connector(1, group_commit=1)
+    connector.write_query("INSERT INTO fuzz_t VALUES (1);")
+    assert connector.writer is None and connections[0].commits==1
+
+def sqlite_connector():
+    api = driver.SQLiteConnector(2)
+    api.write_query("CREATE TABLE fuzz_a (c0 INT, c1 TEXT, c2 TIMESTAMP);")
+    return api
+
+def test_sqlite_pooled_connections_share_the_database():
+    api = sqlite_connector()
+    api.write_query("INSERT INTO fuzz_a VALUES (1, 'a', '2000-01-01T00:00:00');")
+    first = api.query_stream("SELECT c0 FROM fuzz_a")
+    # the second connection of the pool sees the same table
+    assert api.query("SELECT c0, c2 FROM fuzz_a")==[(1, datetime.datetime(2000, 1, 1))]
+    assert first.fetchmany(10)==[(1,)]
+    first.close()
+    assert api.pool.idle.qsize()==2
+    assert api.list_tables()==["fuzz_a"]
+    assert driver.SQLiteConnector(1).list_tables()==[]
+
+def test_sqlite_failing_query_releases_its_connection():
+    api = sqlite_connector()
+    with pytest.raises(sqlite3.OperationalError):
+        api.query_stream("SELECT c9 FROM fuzz_a")
+    assert api.pool.idle.qsize()==1
+    assert api.describe("SELECT c0, c1 AS x FROM fuzz_a LIMIT 0")==[("c0", None), ("x", None)]
+
+def test_sqlite_copy_and_truncate_tables():
+    api = sqlite_connector()
+    api.write_query("INSERT INTO fuzz_a VALUES (1, 'a', NULL), (2, 'b', NULL);")
+    api.copy_table("fuzz_a", "fuzz_b")
+    api.truncate_table("fuzz_a")
+    assert api.query("SELECT count(*) FROM fuzz_a")==[(0,)]
+    assert api.query("SELECT c0 FROM fuzz_b ORDER BY c0")==[(1,), (2,)]
+
+def prepared_insert(value, table="fuzz_t"):
+    return Prepared(f"INSERT INTO {table} VALUES ({value});", f"INSERT INTO {table} VALUES ($1);", [value])
+
+def test_prepared_statements_are_prepared_once_per_connection(connections):
+    connector = grouped_connector(1, group_commit=1)
+    connector.prepare = True
+    connector.write_query(prepared_insert("1"))
+    connector.write_query(prepared_insert("'a'"))
+    assert connections[0].executed==["PREPARE fuzz_stmt_0 AS INSERT INTO fuzz_t VALUES ($1)",
+                                     "EXECUTE fuzz_stmt_0(1)", "EXECUTE fuzz_stmt_0('a')"]
+
+def test_least_recently_used_statement_is_deallocated(connections):
+    connector = grouped_connector(1, group_commit=1)
+    connector.prepare = True
+    connector.statement_cache = 2
+    for table in ("fuzz_a", "fuzz_b", "fuzz_a", "fuzz_c"):
+        connector.write_query(prepared_insert("1", table))
+    assert "DEALLOCATE fuzz_stmt_1" in connections[0].executed
+    assert list(connections[0].statements.values())==["fuzz_stmt_0", "fuzz_stmt_2"]
+
+def server_statements(conn):
+    # prepared statements the session holds: PREPARE and DEALLOCATE outlive rollbacks
+    executed = ';'.join(conn.executed)
+    return executed.count("PREPARE ")-executed.count("DEALLOCATE ")
+
+def test_failing_prepare_prepares_again(connections):
+    connector = grouped_connector(1, group_commit=1)
+    connector.prepare = True
+    with pytest.raises(RuntimeError):
+        connector.write_query(prepared_insert("1", "fuzz_fail"))
+    assert connections[0].statements=={}
+
+@pytest.mark.parametrize("group_commit", [1, 100])
+def test_failing_execute_keeps_its_prepared_statement(connections, group_commit):
+    connector = grouped_connector(1, group_commit=group_commit)
+    connector.prepare = True
+    connector.statement_cache = 2
+    for table in ("fuzz_a", "fuzz_b", "fuzz_c", "fuzz_a"):
+        with pytest.raises(RuntimeError):
+            connector.write_query(prepared_insert("'fail'", table))
+        connector.write_query(prepared_insert("1", table))
+    [conn] = [conn for conn in connections if conn.executed]
+    # the failed statements are reused, the cache still bounds the session
+    assert server_statements(conn)==len(conn.statements)==2
+    assert ';'.join(conn.executed).count("PREPARE ")==4
+
+def test_statement_missing_from_the_session_is_prepared_again(connections):
+    class MissingStatement(Exception):
+        pgcode = driver.MISSING_STATEMENT
+    connector = grouped_connector(1, group_commit=1)
+    connector.prepare = True
+    connector.write_query(prepared_insert("1"))
+    conn = connections[0]
+    def execute(query, params=None):
+        raise MissingStatement("prepared statement \"fuzz_stmt_0\" does not exist")
+    conn.cursor = lambda name=None: type("Cursor", (), {"execute": staticmethod(execute)})()
+    with pytest.raises(MissingStatement):
+        connector.write_query(prepared_insert("2"))
+    assert conn.statements=={}
+
+def test_write_many_executes_all_rows_in_one_round_trip(connections):
+    connector = grouped_connector(1, group_commit=1)
+    connector.write_many("INSERT INTO fuzz_t VALUES ($1,$2);", [["1", "'a'"], ["NULL", "'b'"]])
+    assert connections[0].executed[-1]=="EXECUTE fuzz_stmt_0(1,'a');EXECUTE fuzz_stmt_0(NULL,'b')"
+    assert connections[0].commits==1
+
+def test_sqlite_params_are_bound_values():
+    assert [driver._sqlite_param(literal) for literal in ("NULL", "'it''s'", "-3", "0.5")]==[None, "it's", -3, 0.5]
+    api = sqlite_connector()
+    api.prepare = True
+    api.write_query(Prepared("INSERT INTO fuzz_a VALUES (1,'it''s',NULL);", "INSERT INTO fuzz_a VALUES (?,?,?);", ["1", "'it''s'", "NULL"]))
+    api.write_many("INSERT INTO fuzz_a VALUES (?,?,?);", [["2", "'b'", "'2000-01-01T00:00:00'"]])
+    assert api.query("SELECT * FROM fuzz_a ORDER BY c0")==[(1, "it's", None), (2, "b", datetime.datetime(2000, 1, 1))]
+
+def test_sqlite_statement_past_its_budget_is_cancelled():
+    api = sqlite_connector()
+    budget = driver.StatementBudget(0.05)
+    endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i+1 FROM n) SELECT count(*) FROM n"
+    with pytest.raises(driver.StatementTimeout):
+        api.query_stream(endless, budget)
+    assert budget.timed_out and budget.elapsed>=0.05
+    assert driver.watchdog.watched=={}
+    assert api.query("SELECT 1")==[(1,)]
+
+def test_budget_is_spent_across_the_calls_of_a_statement():
+    watchdog = driver.Watchdog(0.01)
+    budget = driver.StatementBudget(0.1)
+    cancelled = []
+    with watchdog.watch(budget, lambda: cancelled.append(1)):
+        time.sleep(0.06)
+    assert not budget.timed_out
+    with pytest.raises(driver.StatementTimeout):
+        with watchdog.watch(budget, lambda: cancelled.append(1)):
+            # the deadline is what is left of the budget
+            time.sleep(0.1)
+            raise RuntimeError("canceling statement due to user request")
+    assert cancelled==[1] and watchdog.cancelled==1
+
+def test_unlimited_budget_only_measures():
+    watchdog = driver.Watchdog(0.01)
+    budget = driver.StatementBudget()
+    with watchdog.watch(budget, None):
+        time.sleep(0.02)
+    assert budget.elapsed>=0.02 and watchdog.thread is None
@@ -0,0 +1,112 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("tqdm")
+import main
+import fanout
+from driver import SQLiteConnector
+
+class ChunkStream:
+    def __init__(self, chunks, error=None):
+        self.chunks = list(chunks)
+        self.error = error
+        self.closed = False
+
+    def fetchmany(self, size):
+        if not self.chunks and self.error is not None:
+            raise self.error
+        return self.chunks.pop(0) if self.chunks else []
+
+    def close(self):
+        self.closed = True
+
+def read(reader):
+    chunks = []
+    while True:
+        chunk = reader.fetchmany(10)
+        if not chunk:
+            return chunks
+        chunks.append(chunk)
+
+def test_shared_stream_is_read_once_by_every_reader():
+    stream = ChunkStream([[1], [2], [3]])
+    shared = fanout.SharedStream(stream, 2)
+    first, second = shared.reader(0), shared.reader(1)
+    assert read(first)==[[1], [2], [3]]
+    # kept until the slower reader fetched them
+    assert len(shared.chunks)==3
+    assert second.fetchmany(10)==[1] and len(shared.chunks)==2
+    first.close()
+    assert not stream.closed
+    assert read(second)==[[2], [3]]
+    second.close()
+    assert stream.closed and len(shared.chunks)==0
+
+def test_closed_reader_does_not_hold_chunks():
+    shared = fanout.SharedStream(ChunkStream([[1], [2]]), 2)
+    shared.reader(1).close()
+    assert read(shared.reader(0))==[[1], [2]] and len(shared.chunks)==0
+
+def test_reference_error_is_seen_by_every_reader():
+    error = RuntimeError("fetch failed")
+    shared = fanout.SharedStream(ChunkStream([[1]], error), 2)
+    for reader in (0, 1):
+        assert shared.fetchmany(reader, 10)==[1]
+        with pytest.raises(RuntimeError):
+            shared.fetchmany(reader, 10)
+    assert shared.error is error
+
+def test_shared_stream_without_readers_is_closed():
+    stream = ChunkStream([[1]])
+    fanout.SharedStream(stream, 0)
+    assert stream.closed
+
+@pytest.fixture
+def targets(main_logs, tmp_path, monkeypatch):
+    # the target bug indexes are named after main's, kept in tmp_path
+    monkeypatch.setattr(main, "EVAL_CONFIG_BUG_INDEX", str(tmp_path/"bug_index.json"))
+    def target(name, rows):
+        api = SQLiteConnector(2)
+        api.write_query("CREATE TABLE fuzz_a (c0 INT);")
+        api.write_query(f"INSERT INTO fuzz_a VALUES {rows};")
+        return fanout.Target(name, api)
+    return target
+
+def test_targets_must_share_a_dialect_and_have_unique_names(targets):
+    nightly = targets("nightly", "(1)")
+    other = fanout.Target("other", type("Api", (), {"dialect": "questdb", "seed_methods": (), "pool": None})())
+    with pytest.raises(ValueError):
+        fanout.TargetGroup([nightly, other])
+    with pytest.raises(ValueError):
+        fanout.TargetGroup([nightly, targets("nightly", "(1)")])
+
+def test_only_the_differing_target_reports_a_bug(targets, main_logs):
+    reference = SQLiteConnector(2)
+    reference.write_query("CREATE TABLE fuzz_a (c0 INT);")
+    reference.write_query("INSERT INTO fuzz_a VALUES (1),(2);")
+    group = fanout.TargetGroup([targets("nightly", "(1),(3)"), targets("stable", "(1),(2)")])
+    try:
+        assert group.seed_methods==SQLiteConnector.seed_methods
+        assert fanout.fanout_testing(None, group, reference, ["SELECT c0 FROM fuzz_a"]*2)==(True, True, True)
+        assert fanout.fanout_testing(None, group, reference, ["SELECT c9 FROM fuzz_a"]*2)==(False, False, False)
+    finally:
+        group.close()
+    assert [len(main_logs.of(f"./bug_{name}.log")) for name in ("nightly", "stable")]==[1, 0]
+    assert "agreeing targets:['stable']" in main_logs.of("./bug_nightly.log")[0]
+    assert len(main_logs.of("./nightly_exception.log"))==1
+    assert group.stats()["nightly"]=={"statements": 2, "errors": 1, "mismatches": 1, "slow_pairs": 0}
+
+def test_target_failing_to_fetch_its_rows_fails(targets, main_logs):
+    reference = SQLiteConnector(2)
+    reference.write_query("CREATE TABLE fuzz_a (c0 INT);")
+    stable = targets("stable", "(1)")
+    # same dialect as stable, its statements fail once their rows are fetched
+    failing = type("FailingApi", (), {"dialect": "sqlite", "seed_methods": (), "pool": stable.api.pool,
+                                      "query_stream": lambda self, query, budget=None: ChunkStream([], RuntimeError("cast failed"))})()
+    group = fanout.TargetGroup([fanout.Target("nightly", failing), stable])
+    try:
+        assert fanout.fanout_testing(None, group, reference, ["SELECT c0 FROM fuzz_a"]*2)==(False, True, True)
+    finally:
+        group.close()
+    assert group.stats()["nightly"]=={"statements": 1, "errors": 1, "mismatches": 0, "slow_pairs": 0}
+    assert "cast failed" in main_logs.of("./nightly_exception.log")[0]
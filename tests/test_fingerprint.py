@@ -0,0 +1,104 @@
+import types
+from decimal import Decimal
+from fingerprint import fingerprint_analysis, fingerprint_query, probe_query
+
+class ListStream:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+class SummaryApi:
+    """
+    answers the probe with columns and the summary query with summary,
+    as an engine of the given dialect would
+    """
+
+    def __init__(self, dialect, columns, summary):
+        self.dialect = dialect
+        self.columns = columns
+        self.summary = summary
+        self.budgets = []
+
+    def describe(self, query, budget=None):
+        self.budgets.append(budget)
+        return self.columns
+
+    def query_stream(self, query, budget=None):
+        self.budgets.append(budget)
+        return ListStream([self.summary])
+
+QUERY = ("SELECT c0 FROM fuzz_t", "SELECT c0 FROM fuzz_t")
+INTEGER, BOOLEAN, VARCHAR, NUMERIC = 23, 16, 1043, 1700
+
+def analysis(columns, questdb_summary, postgres_summary, dialects=("questdb", "postgres")):
+    questdb_api = SummaryApi(dialects[0], columns, questdb_summary)
+    postgres_api = SummaryApi(dialects[1], columns, postgres_summary)
+    return fingerprint_analysis(None, questdb_api, postgres_api, QUERY)
+
+def test_no_weak_checksums_in_the_summary():
+    summary = fingerprint_query("postgres", "SELECT 1", [("a", INTEGER), ("b", VARCHAR), ("c", BOOLEAN)])
+    assert "length" not in summary
+    assert "sum(\"a\")" not in summary
+    assert "CASE WHEN \"c\" THEN 1" in summary
+
+def test_agreeing_counts_of_string_columns_are_not_conclusive():
+    # 'ab' and 'xy' have the same length, only the rows tell them apart;
+    # questdb has no min/max of strings to compare with postgres'
+    assert analysis([("c0", VARCHAR)], (1, 1), (1, 1, "ab", "ab")) is None
+
+def test_agreeing_extremes_of_several_rows_are_not_conclusive():
+    # {1, 2, 3} and {1, 3, 3}
+    assert analysis([("c0", INTEGER)], (3, 3, 1, 3), (3, 3, 1, 3)) is None
+
+def test_empty_results_are_decided():
+    assert analysis([("c0", INTEGER), ("c1", VARCHAR)], (0, 0, None, None, 0), (0, 0, None, None, 0, None, None)) is True
+
+def test_single_row_is_decided_by_its_extremes():
+    columns = [("c0", INTEGER), ("c1", NUMERIC)]
+    # postgres returns NUMERIC as Decimal, matched like the full comparison
+    assert analysis(columns, (1, 1, 7, 7, 1, 2.5, 2.5), (1, 1, 7, 7, 1, Decimal("2.5"), Decimal("2.5"))) is True
+    assert analysis(columns, (1, 1, 7, 7, 1, 2.5, 2.5), (1, 1, 7, 7, 1, Decimal("2.4"), Decimal("2.4"))) is False
+
+def test_single_row_with_a_string_is_not_decided_by_questdb():
+    columns = [("c0", INTEGER), ("c1", VARCHAR)]
+    assert analysis(columns, (1, 1, 7, 7, 1), (1, 1, 7, 7, 1, "ab", "ab")) is None
+    # unless the string is NULL
+    assert analysis(columns, (1, 1, 7, 7, 0), (1, 1, 7, 7, 0, None, None)) is True
+
+def test_single_boolean_column_is_decided():
+    assert analysis([("c0", BOOLEAN)], (4, 3, 2), (4, 3, 2)) is True
+    assert analysis([("c0", BOOLEAN)], (4, 3, 2), (4, 3, 1)) is False
+
+def test_several_boolean_columns_are_not_conclusive():
+    # (true, false), (false, true) and (true, true), (false, false) agree column by column
+    assert analysis([("c0", BOOLEAN), ("c1", BOOLEAN)], (2, 2, 1, 2, 1), (2, 2, 1, 2, 1)) is None
+
+def test_single_all_null_column_is_decided():
+    assert analysis([("c0", VARCHAR)], (5, 0), (5, 0, None, None)) is True
+
+def test_disagreeing_row_counts():
+    assert analysis([("c0", VARCHAR)], (1, 1), (2, 2, "a", "b")) is False
+
+def test_dialects_come_from_the_connectors():
+    # sqlite reports no column types, but has min/max of any value
+    columns = [("c0", None)]
+    assert analysis(columns, (2, 2, 1, 2), (2, 2, 1, 2), ("sqlite", "sqlite")) is None
+    assert analysis(columns, (1, 1, "x", "x"), (1, 1, "x", "x"), ("sqlite", "sqlite")) is True
+    assert analysis(columns, (0, 0, None, None), (0, 0, None, None), ("sqlite", "sqlite")) is True
+
+def test_budgets_are_spent_by_probe_and_summary():
+    questdb_api = SummaryApi("questdb", [("c0", BOOLEAN)], (1, 1, 1))
+    postgres_api = SummaryApi("postgres", [("c0", BOOLEAN)], (1, 1, 1))
+    budgets = (types.SimpleNamespace(), types.SimpleNamespace())
+    fingerprint_analysis(None, questdb_api, postgres_api, QUERY, budgets)
+    assert questdb_api.budgets==[budgets[0], budgets[0]]
+    assert postgres_api.budgets==[budgets[1], budgets[1]]
+
+def test_probe_returns_no_rows():
+    assert probe_query("SELECT 1").endswith("LIMIT 0")
@@ -0,0 +1,57 @@
+import os
+from log_writer import BufferedLogWriter
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+def test_records_are_buffered_until_flushed(tmp_path):
+    path = str(tmp_path/"testing.log")
+    writer = BufferedLogWriter(flush_interval=3600)
+    writer.write(path, "a\n")
+    writer.write(path, "b\n")
+    assert not os.path.exists(path) or read(path)==""
+    writer.flush()
+    assert read(path)=="a\nb\n"
+    writer.close()
+
+def test_sync_paths_are_written_at_once(tmp_path):
+    path = str(tmp_path/"bug.log")
+    writer = BufferedLogWriter(sync_paths=[path], flush_interval=3600)
+    writer.write(path, "bug\n")
+    assert read(path)=="bug\n"
+    writer.close()
+
+def test_flush_size(tmp_path):
+    path = str(tmp_path/"testing.log")
+    writer = BufferedLogWriter(flush_size=10, flush_interval=3600)
+    writer.write(path, "12345")
+    writer.write(path, "67890")
+    assert read(path)=="1234567890"
+    writer.close()
+
+def test_close_writes_the_buffers(tmp_path):
+    paths = [str(tmp_path/"a.log"), str(tmp_path/"b.log")]
+    writer = BufferedLogWriter(flush_interval=3600)
+    for path in paths:
+        writer.write(path, path)
+    writer.close()
+    assert [read(path) for path in paths]==paths
+
+def test_large_logs_are_rotated(tmp_path):
+    path = str(tmp_path/"testing.log")
+    writer = BufferedLogWriter(flush_size=1, flush_interval=3600, max_bytes=8, backup_count=2)
+    for record in ("first...\n", "second..\n", "third...\n", "fourth..\n"):
+        writer.write(path, record)
+    writer.close()
+    assert read(f"{path}.1")=="fourth..\n" and read(f"{path}.2")=="third...\n"
+    assert not os.path.exists(f"{path}.3")
+
+def test_rotate_keeps_the_previous_run(tmp_path):
+    path = str(tmp_path/"diff_input.log")
+    writer = BufferedLogWriter(flush_interval=3600)
+    writer.write(path, "run 1\n")
+    writer.rotate(path)
+    writer.write(path, "run 2\n")
+    writer.close()
+    assert read(f"{path}.1")=="run 1\n" and read(path)=="run 2\n"
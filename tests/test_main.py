@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+class ListStream:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.closed = False
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+class FailingStream(ListStream):
+    # a statement failing once its rows are fetched, e.g. a failed cast
+    def fetchmany(self, size):
+        raise RuntimeError("invalid input syntax for type integer")
+
+class RowsApi:
+    """
+    an engine answering every SELECT with rows; arrive/wait (events)
+    make it wait for the other engine of the pair to start
+    """
+
+    def __init__(self, rows, arrive=None, wait=None, fail_writes=False, stream=ListStream, write_error=RuntimeError):
+        self.rows = rows
+        self.stream = stream
+        self.write_error = write_error
+        self.pruned = 0
+        self.arrive = arrive
+        self.wait = wait
+        self.fail_writes = fail_writes
+        self.streams = []
+        self.writes = []
+
+    def rendezvous(self):
+        if self.arrive is not None:
+            self.arrive.set()
+            assert self.wait.wait(5)
+
+    def query_stream(self, query, budget=None):
+        self.rendezvous()
+        self.streams.append(self.stream(self.rows))
+        return self.streams[-1]
+
+    def write_query(self, query, budget=None):
+        self.rendezvous()
+        if self.fail_writes:
+            raise self.write_error("write failed")
+        self.writes.append(query)
+
+    def prune(self):
+        self.pruned += 1
+
+SELECT = ("SELECT c0 FROM fuzz_t", "SELECT c0 FROM fuzz_t")
+INSERT = ("INSERT INTO fuzz_t VALUES (1);", "INSERT INTO fuzz_t VALUES (1);")
+
+def test_pair_runs_on_both_engines_concurrently(main_logs):
+    import main
+    started = [threading.Event(), threading.Event()]
+    # each engine waits until the other one started the statement
+    questdb_api = RowsApi([(1,)], started[0], started[1])
+    postgres_api = RowsApi([(1,)], started[1], started[0])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert main.differential_testing(executor, questdb_api, postgres_api, SELECT)==(True, True, False)
+    assert questdb_api.streams[0].closed and postgres_api.streams[0].closed
+
+def test_sequential_pair_without_executor(main_logs):
+    import main
+    assert main.differential_testing(None, RowsApi([(1,), (2,)]), RowsApi([(2,), (1,)]), SELECT)==(True, True, False)
+    assert main_logs.of("./diff_input.log")==[str(list(SELECT))+'\n']
+    assert main_logs.of("./bug.log")==[]
+
+def test_mismatch_is_reported(main_logs):
+    import main
+    assert main.differential_testing(None, RowsApi([(-1, 'a')]), RowsApi([(-2, 'a')]), SELECT)==(True, True, True)
+    [report] = main_logs.of("./bug.log")
+    assert "(-1, 'a')" in report and "(-2, 'a')" in report
+
+def test_failing_fetch_fails_its_engine(main_logs, monkeypatch):
+    import main
+    from timeouts import AdaptiveTimeout
+    timeout = AdaptiveTimeout(1.0, 0.1, 10, warmup=1, refresh=1)
+    monkeypatch.setattr(main, "statement_timeouts", [timeout, None])
+    questdb_api = RowsApi([(1,)], stream=FailingStream)
+    assert main.differential_testing(None, questdb_api, RowsApi([(1,)]), SELECT)==(False, True, False)
+    assert questdb_api.streams[0].closed
+    assert "invalid input syntax" in main_logs.of("./questdb_exception.log")[0]
+    # the failed pair is not replayed, and its latency does not feed the timeout
+    assert main_logs.of("./diff_input.log")==[]
+    assert len(timeout.latencies)==0
+
+def test_write_fails_on_one_engine(main_logs):
+    import main
+    questdb_api, postgres_api = RowsApi([]), RowsApi([], fail_writes=True)
+    assert main.differential_testing(None, questdb_api, postgres_api, INSERT)==(True, False, False)
+    assert questdb_api.writes==[INSERT[0]]
+    assert "write failed" in main_logs.of("./postgres_exception.log")[0]
+    # a failed statement leaves the pool alone
+    assert postgres_api.pruned==0
+
+def test_connection_error_prunes_the_pool(main_logs):
+    import main
+    import psycopg2
+    postgres_api = RowsApi([], fail_writes=True, write_error=psycopg2.OperationalError)
+    assert main.differential_testing(None, RowsApi([]), postgres_api, INSERT)==(True, False, False)
+    assert postgres_api.pruned==1
+
+def test_sqlite_backend_pair_agrees_with_itself(main_logs, monkeypatch):
+    import main
+    from query_generation import QueryGenerator
+    monkeypatch.setattr(main, "EVAL_CONFIG_BACKENDS", ("sqlite", "sqlite"))
+    monkeypatch.setattr(main, "EVAL_CONFIG_ROUND_QUERIES", 100)
+    questdb_api, postgres_api = main.connect_backends(2)
+    assert questdb_api.dialect=="sqlite" and questdb_api.uri!=postgres_api.uri
+    query_generator = QueryGenerator(main.clauses_identifying(questdb_api, postgres_api), True, seed=3, dialects=main.EVAL_CONFIG_BACKENDS)
+    main.run_testing(questdb_api, postgres_api, query_generator, None, lambda *_: None, max_rounds=1, show_progress=False)
+    assert main.metrics.snapshot()["pairs"]>0
+    # the same engine on both sides never mismatches
+    assert main_logs.of("./bug.log")==[]
+
+def test_aggregate_pair_is_decided_by_its_summary(main_logs, monkeypatch):
+    import main
+    from driver import SQLiteConnector
+
+    class StreamLog(SQLiteConnector):
+        def __init__(self):
+            super().__init__(1)
+            self.streamed = []
+
+        def query_stream(self, query, budget=None):
+            self.streamed.append(query)
+            return super().query_stream(query, budget)
+
+    monkeypatch.setattr(main, "EVAL_CONFIG_FINGERPRINT", True)
+    questdb_api, postgres_api = StreamLog(), StreamLog()
+    for api in (questdb_api, postgres_api):
+        api.write_query("CREATE TABLE fuzz_a (c0 INTEGER, c1 REAL)")
+        api.write_query("INSERT INTO fuzz_a VALUES (1, 0.5), (2, NULL), (3, 1.5)")
+    query = ("SELECT COUNT(T1.c0), SUM(T1.c1) FROM fuzz_a AS T1 WHERE (T1.c0 > 1)",) * 2
+    assert main.differential_testing(None, questdb_api, postgres_api, query)==(True, True, False)
+    # only the summary crossed the connection, never the rows
+    for api in (questdb_api, postgres_api):
+        assert len(api.streamed)==1 and api.streamed[0].startswith("SELECT count(*),")
+
+def seeded_statements(main_logs, monkeypatch, executors):
+    import main
+    from query_generation import QueryGenerator
+    from scheduler import Scheduler
+    main_logs.records.clear()
+    monkeypatch.setattr(main, "EVAL_CONFIG_BACKENDS", ("sqlite", "sqlite"))
+    monkeypatch.setattr(main, "EVAL_CONFIG_ROUND_QUERIES", 300)
+    monkeypatch.setattr(main, "EVAL_CONFIG_PIPELINE_DEPTH", 256)
+    monkeypatch.setattr(main, "EVAL_CONFIG_PIPELINE_EXECUTORS", executors)
+    questdb_api, postgres_api = main.connect_backends(2*executors)
+    query_generator = QueryGenerator(main.clauses_identifying(questdb_api, postgres_api), True, seed=7,
+                                     dialects=main.EVAL_CONFIG_BACKENDS, scheduler=Scheduler(None))
+    main.run_testing(questdb_api, postgres_api, query_generator, None, lambda *_: None, max_rounds=2, show_progress=False)
+    return main_logs.of("./questdb_testing.log")
+
+@pytest.mark.parametrize("executors", [1, 2])
+def test_seeded_pipelined_run_with_scheduler_is_reproduced(main_logs, monkeypatch, executors):
+    # the producer runs up to the queue depth ahead of the scheduler feedback
+    first = seeded_statements(main_logs, monkeypatch, executors)
+    assert len(first)>0
+    for _ in range(2):
+        assert seeded_statements(main_logs, monkeypatch, executors)==first
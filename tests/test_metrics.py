@@ -0,0 +1,101 @@
+import json
+import time
+import pstats
+import threading
+from metrics import Histogram, Metrics, ProfileHook, LATENCY_BUCKETS
+
+def test_histogram_buckets_by_upper_bound():
+    histogram = Histogram()
+    for seconds in (0.0001, 0.0002, 3, 100):
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"]==4 and snapshot["sum"]==100+3+0.0003
+    assert snapshot["buckets"]["0.0001"]==1 and snapshot["buckets"]["0.00025"]==1
+    assert snapshot["buckets"]["5"]==1 and snapshot["buckets"]["+Inf"]==1
+    assert len(snapshot["buckets"])==len(LATENCY_BUCKETS)+1
+
+def test_pair_counts_statements_errors_and_clauses(tmp_path):
+    metrics = Metrics(str(tmp_path/"metrics"))
+    metrics.pair(["IN", "CASE"], True, False, 0.5)
+    metrics.pair(["IN"], False, True, 0.25)
+    metrics.duplicate()
+    metrics.timeout("questdb")
+    snapshot = metrics.snapshot()
+    assert snapshot["pairs"]==2 and snapshot["duplicates_skipped"]==1
+    assert snapshot["statements"]=={"questdb": 2, "postgres": 2}
+    assert snapshot["errors"]=={"questdb": 1, "postgres": 1}
+    assert snapshot["error_rate"]=={"questdb": 0.5, "postgres": 0.5}
+    assert snapshot["timeouts"]=={"questdb": 1, "postgres": 0}
+    assert snapshot["clauses"]["IN"]=={"pairs": 2, "questdb_errors": 1, "postgres_errors": 1, "seconds": 0.75}
+    assert snapshot["clauses"]["CASE"]["postgres_errors"]==1
+
+def test_timed_observes_failing_stages(tmp_path):
+    metrics = Metrics(str(tmp_path/"metrics"))
+    def fail():
+        raise ValueError
+    assert metrics.timed("compare", lambda a, b: a+b, 1, 2)==3
+    try:
+        metrics.timed("log", fail)
+    except ValueError:
+        pass
+    stages = metrics.snapshot()["stages"]
+    assert stages["compare"]["count"]==1 and stages["log"]["count"]==1
+
+def test_export_writes_json_and_prometheus(tmp_path):
+    path = str(tmp_path/"metrics")
+    metrics = Metrics(path, labels={"worker": "1"})
+    metrics.pair(["IN"], True, True, 0.1)
+    metrics.set_result_cache({"hits": 3, "misses": 1, "evictions": 0, "rows": 7})
+    metrics.export()
+    assert json.load(open(path+".json"))["pairs"]==1
+    prom = open(path+".prom").read()
+    assert 'fuzz_pairs_total{worker="1"} 1' in prom
+    assert 'fuzz_statements_total{worker="1",engine="questdb"} 1' in prom
+    assert 'fuzz_result_cache_lookups_total{worker="1",outcome="hit"} 3' in prom
+    assert 'fuzz_clause_pairs_total{worker="1",clause="IN"} 1' in prom
+    assert 'fuzz_stage_seconds_bucket{worker="1",stage="compare",le="+Inf"} 0' in prom
+    assert not (tmp_path/"metrics.json.tmp").exists()
+
+def test_maybe_export_waits_for_the_interval(tmp_path):
+    path = tmp_path/"metrics"
+    Metrics(str(path), export_interval=3600).maybe_export()
+    assert not (tmp_path/"metrics.json").exists()
+    Metrics(str(path), export_interval=0).maybe_export()
+    assert (tmp_path/"metrics.json").exists()
+
+def test_profile_hook_profiles_the_first_iterations(tmp_path):
+    hook = ProfileHook(2, mode="cprofile", path=str(tmp_path/"profile"))
+    for _ in range(4):
+        hook.step()
+        sum(range(100))
+    assert hook.profiler is None
+    assert pstats.Stats(str(tmp_path/"profile.pstats")).total_calls>0
+
+def test_disabled_profile_hook_writes_nothing(tmp_path):
+    hook = ProfileHook(0, path=str(tmp_path/"profile"))
+    hook.step()
+    hook.finish()
+    assert list(tmp_path.iterdir())==[]
+
+def busy_generation(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_sampling_profile_covers_the_pipeline_threads(tmp_path):
+    stop = threading.Event()
+    threads = [threading.Thread(target=busy_generation, args=(stop,), name=name) for name in ("pair-producer", "pair_1", "log-flusher")]
+    for thread in threads:
+        thread.start()
+    hook = ProfileHook(2, path=str(tmp_path/"profile"))
+    try:
+        hook.step()
+        time.sleep(0.1)
+        hook.step()
+        hook.step()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    roots = {line.split(';', 1)[0] for line in open(tmp_path/"profile.folded")}
+    assert roots=={threading.current_thread().name, "pair-producer", "pair"}
+    assert any(line.startswith("pair-producer;") and "busy_generation" in line for line in open(tmp_path/"profile.folded"))
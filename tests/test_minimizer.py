@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("tqdm")
+import minimizer
+from driver import SQLiteConnector
+
+def test_split_conjuncts_keeps_between_together():
+    assert minimizer.split_conjuncts("True AND c0 BETWEEN 1 AND 2 AND (a AND b)")==["True", "c0 BETWEEN 1 AND 2", "(a AND b)"]
+
+def test_parse_and_render_round_trip():
+    query = ("(SELECT T1.c0 FROM fuzz_a AS T1 INNER JOIN fuzz_b AS T2 ON True AND T2.c0 IN (1,2) "
+             "WHERE True AND CASE WHEN T1.c0 IS NULL THEN NULL ELSE T1.c0 IN (0) END) UNION (SELECT c0 FROM fuzz_c AS T1)")
+    tree = minimizer.parse(query)
+    assert minimizer.render(tree)==query
+    assert minimizer.shape(tree)==[(2, [2]), " UNION ", (0, [])]
+
+def test_candidates_reduce_both_queries_in_lockstep():
+    pair = ["SELECT c0 FROM fuzz_a AS T1 WHERE True AND CAST(T1.c1 AS SYMBOL)='a'",
+            "SELECT c0 FROM fuzz_a AS T1 WHERE True AND CAST(T1.c1 AS VARCHAR(64))='a'"]
+    candidates = minimizer.candidates(pair)
+    assert ["SELECT c0 FROM fuzz_a AS T1", "SELECT c0 FROM fuzz_a AS T1"] in candidates
+    assert ["SELECT c0 FROM fuzz_a AS T1 WHERE True AND T1.c1='a'", "SELECT c0 FROM fuzz_a AS T1 WHERE True AND T1.c1='a'"] in candidates
+
+def test_setup_records_keep_the_writes_of_the_pair_tables(tmp_path):
+    pair = ["SELECT c0 FROM fuzz_a", "SELECT c0 FROM fuzz_a"]
+    records = [
+        ["CREATE TABLE fuzz_a (c0 INT);", "CREATE TABLE fuzz_a (c0 INT);"],
+        ["CREATE TABLE fuzz_b (c0 INT);", "CREATE TABLE fuzz_b (c0 INT);"],
+        ["-- seed fuzz_a rows=5 seed=1", "-- seed fuzz_a rows=5 seed=1"],
+        ["SELECT c0 FROM fuzz_b", "SELECT c0 FROM fuzz_b"],
+        pair,
+        ["INSERT INTO fuzz_a VALUES (1);", "INSERT INTO fuzz_a VALUES (1);"],
+    ]
+    log = tmp_path/"diff_input.log"
+    log.write_text(''.join(str(record)+'\n' for record in records))
+    assert minimizer.setup_records(str(log), pair)==[records[0], records[2]]
+
+def test_minimize_keeps_the_mismatch(main_logs):
+    questdb_api, postgres_api = SQLiteConnector(2), SQLiteConnector(2)
+    for api, extra in ((questdb_api, 7), (postgres_api, None)):
+        api.write_query("CREATE TABLE fuzz_a (c0 INT, c1 TEXT);")
+        api.write_query("CREATE TABLE fuzz_b (c0 INT, c1 TEXT);")
+        api.write_query("INSERT INTO fuzz_a VALUES (1,'a'),(2,'b');")
+        api.write_query("INSERT INTO fuzz_b VALUES (1,'a');")
+        if extra is not None:
+            # the tested engine has one row more
+            api.write_query(f"INSERT INTO fuzz_a VALUES ({extra},'c');")
+    query = ("SELECT T1.c0 FROM fuzz_a AS T1 CROSS JOIN fuzz_b AS T2 "
+             "WHERE True AND T1.c0 BETWEEN 0 AND 10 AND T2.c1 IN ('a','b')")
+    reducer = minimizer.Minimizer(questdb_api, postgres_api, workers=2)
+    try:
+        reduced = reducer.minimize([query, query])
+        assert reduced==["SELECT T1.c0 FROM fuzz_a AS T1", "SELECT T1.c0 FROM fuzz_a AS T1"]
+        # agreeing pairs are not reduced
+        assert reducer.minimize(["SELECT c0 FROM fuzz_b AS T1"]*2) is None
+    finally:
+        reducer.close()
@@ -0,0 +1,68 @@
+import time
+import threading
+import pytest
+from pipeline import PairProducer, ProducerError, TableOrderedExecutor
+
+def numbers(count, skip=()):
+    produced = iter(range(count))
+    def produce():
+        item = next(produced)
+        return None if item in skip else item
+    return produce
+
+@pytest.mark.parametrize("depth", [0, 1, 4])
+def test_items_are_yielded_in_production_order(depth):
+    producer = PairProducer(numbers(10, skip={3, 7}), 10, depth)
+    assert list(producer)==[0, 1, 2, 4, 5, 6, 8, 9]
+    stats = producer.stats()
+    assert stats["produced"]==stats["consumed"]==8 and stats["capacity"]==depth
+
+def test_producer_error_is_raised_by_the_consumer():
+    def produce():
+        raise ValueError("bad statement")
+    with pytest.raises(ProducerError) as raised:
+        list(PairProducer(produce, 3, 2))
+    assert isinstance(raised.value.__cause__, ValueError)
+
+def test_stopped_consumer_releases_a_blocked_producer():
+    producer = PairProducer(numbers(100), 100, 1)
+    for item in producer:
+        time.sleep(0.05)
+        break
+    assert not producer.thread.is_alive()
+    assert producer.stats()["producer_blocked_seconds"]>0
+
+def run_pairs(queries, workers=2):
+    # each pair logs its start and end, and runs for its hold seconds
+    executor = TableOrderedExecutor(workers)
+    events = []
+    lock = threading.Lock()
+    def run(name, hold):
+        with lock:
+            events.append(f"start {name}")
+        time.sleep(hold)
+        with lock:
+            events.append(f"end {name}")
+    futures = [executor.submit([query, query], run, name, hold) for name, query, hold in queries]
+    for future in futures:
+        future.result(5)
+    executor.shutdown()
+    return events
+
+def test_reader_waits_for_the_writer_of_its_table():
+    events = run_pairs([("w", "INSERT INTO fuzz_a VALUES (1);", 0.05), ("r", "SELECT c0 FROM fuzz_a", 0)])
+    assert events==["start w", "end w", "start r", "end r"]
+
+def test_writer_waits_for_earlier_readers():
+    events = run_pairs([("r", "SELECT c0 FROM fuzz_a", 0.05), ("w", "UPDATE fuzz_a SET c0=1 WHERE True", 0)])
+    assert events.index("end r")<events.index("start w")
+
+def test_readers_and_other_tables_overlap():
+    events = run_pairs([("r1", "SELECT c0 FROM fuzz_a", 0.05), ("r2", "SELECT c0 FROM fuzz_a", 0.05),
+                        ("w", "INSERT INTO fuzz_b VALUES (1);", 0)], workers=3)
+    assert events.index("start r2")<events.index("end r1")
+    assert events.index("end w")<events.index("end r1")
+
+def test_unknown_statement_is_a_barrier():
+    events = run_pairs([("r", "SELECT c0 FROM fuzz_a", 0.05), ("x", "VACUUM", 0), ("s", "SELECT c0 FROM fuzz_b", 0)], workers=3)
+    assert events==["start r", "end r", "start x", "end x", "start s", "end s"]
@@ -0,0 +1,72 @@
+import pickle
+from clause_map import MAPPING_PROFILES
+from query_ast import *
+
+QUESTDB, POSTGRES, SQLITE = (MAPPING_PROFILES[dialect] for dialect in ("questdb", "postgres", "sqlite"))
+
+def select(where=None, sample=None):
+    node = Select()
+    node.data = Call("COUNT", [Raw("*")])
+    node.table = "fuzz_t"
+    node.alias = "T1"
+    node.where = where
+    node.sample = sample
+    return node
+
+def test_unmapped_rendering():
+    where = And([Raw("True"), In(Column("c0", "T1"), ["0", "NULL"]), Between(Column("c2", "T1"), Raw("NULL"), Now(), negated=True)])
+    assert select(where).render(None)==\
+        "SELECT COUNT(*) FROM fuzz_t AS T1 WHERE True AND T1.c0 IN (0,NULL) AND T1.c2 NOT BETWEEN NULL AND NOW()"
+
+def test_clause_mappings_per_dialect():
+    clause = In(Column("c0"), ["0", "NULL"], negated=True)
+    assert clause.render(QUESTDB)=="CASE WHEN c0 IS NULL THEN NULL::BOOLEAN ELSE c0 NOT IN (0,NULL) END"
+    assert clause.render(POSTGRES)=="CASE WHEN c0 IS NULL THEN NULL ELSE c0 NOT IN (0) END"
+    between = Between(Column("c0"), Raw("3"), Raw("1"))
+    assert between.render(POSTGRES)=="c0 BETWEEN SYMMETRIC 3 AND 1"
+    assert between.render(SQLITE)=="c0 BETWEEN MIN(3,1) AND MAX(3,1)"
+
+def test_mapped_operands_are_rendered_once_per_dialect():
+    column = Column("c1", "T2")
+    column.cast = "STRING"
+    clause = In(column, ["'a'"])
+    assert clause.render(QUESTDB)=="CASE WHEN CAST(T2.c1 AS SYMBOL) IS NULL THEN NULL::BOOLEAN ELSE CAST(T2.c1 AS SYMBOL) IN ('a') END"
+    assert clause.render(POSTGRES).startswith("CASE WHEN CAST(T2.c1 AS VARCHAR(64)) IS NULL")
+
+def test_sample_by_is_grouped_by_day():
+    node = select(sample="SAMPLE BY 1d")
+    assert node.render(QUESTDB)=="SELECT COUNT(*) FROM fuzz_t AS T1 SAMPLE BY 1d"
+    assert node.render(POSTGRES)==("SELECT sample_by_result FROM (SELECT COUNT(*) AS sample_by_result, "
+                                   "EXTRACT(DAY FROM T1.c2) AS d FROM fuzz_t AS T1 GROUP BY d) AS sample_by")
+
+def test_compound_and_now_in_sqlite():
+    node = Compound(select(Between(Column("c2"), Raw("NULL"), Now())), "UNION", select())
+    rendered = node.render(SQLITE)
+    assert rendered.startswith("SELECT * FROM (SELECT COUNT(*) FROM fuzz_t AS T1 WHERE c2 BETWEEN MIN(NULL,strftime(")
+    assert ") UNION SELECT * FROM (SELECT COUNT(*) FROM fuzz_t AS T1)" in rendered
+    assert node.render(None)=="(SELECT COUNT(*) FROM fuzz_t AS T1 WHERE c2 BETWEEN NULL AND NOW()) UNION (SELECT COUNT(*) FROM fuzz_t AS T1)"
+
+def test_create_table_per_dialect():
+    create = Create("fuzz_t", [("c0", "INT"), ("c1", "STRING"), ("c2", "TIMESTAMP")], "c2")
+    assert create.render(QUESTDB)=="CREATE TABLE fuzz_t (c0 INT,c1 SYMBOL,c2 TIMESTAMP) timestamp(c2);"
+    assert create.render(POSTGRES)=="CREATE TABLE fuzz_t (c0 INT,c1 VARCHAR(64),c2 TIMESTAMP);"
+    assert create.render(SQLITE)=="CREATE TABLE fuzz_t (c0 INT,c1 TEXT,c2 TEXT);"
+
+def test_join_rendering():
+    join = Join("INNER JOIN", "fuzz_u", "T2", And([Raw("True"), In(Column("c0", "T2"), ["1"])]))
+    assert join.render(None)=="INNER JOIN fuzz_u AS T2 ON True AND T2.c0 IN (1)"
+    assert Join("CROSS JOIN", "fuzz_u", "T3").render(POSTGRES)=="CROSS JOIN fuzz_u AS T3"
+
+def test_dml_renders_prepared_templates():
+    insert = Insert("fuzz_t", ["1", "'a'", "NULL"]).render(POSTGRES)
+    assert insert=="INSERT INTO fuzz_t VALUES (1,'a',NULL);"
+    assert insert.template=="INSERT INTO fuzz_t VALUES ($1,$2,$3);" and insert.params==["1", "'a'", "NULL"]
+    update = Update("fuzz_t", [("c0", "2"), ("c1", "'b'")], Raw("c0 IN (1)")).render(SQLITE)
+    assert update=="UPDATE fuzz_t SET c0=2,c1='b' WHERE c0 IN (1)"
+    # the predicates stay literal
+    assert update.template=="UPDATE fuzz_t SET c0=?,c1=? WHERE c0 IN (1)" and update.params==["2", "'b'"]
+
+def test_prepared_survives_pickling():
+    prepared = pickle.loads(pickle.dumps(Insert("fuzz_t", ["1"]).render(None)))
+    assert type(prepared) is Prepared and prepared=="INSERT INTO fuzz_t VALUES (1);"
+    assert prepared.template=="INSERT INTO fuzz_t VALUES ($1);" and prepared.params==["1"]
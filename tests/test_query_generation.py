@@ -0,0 +1,32 @@
+import io
+import contextlib
+from clause_identification import clauses_identifying
+from query_generation import QueryGenerator
+
+class CreateApi:
+    def __init__(self):
+        self.statements = []
+
+    def write_query(self, query, budget=None):
+        self.statements.append(query)
+
+def statements(seed, count=50, **options):
+    generator = QueryGenerator(clauses_identifying(None, None), True, seed=seed, **options)
+    apis = [CreateApi(), CreateApi()]
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.init_table(*apis)
+    return apis[0].statements+apis[1].statements+[generator.random_query() for _ in range(count)]
+
+def test_same_seed_same_statements():
+    assert statements(42)==statements(42)
+
+def test_different_seeds_differ():
+    assert statements(42)!=statements(43)
+
+def test_table_prefix():
+    created = statements(1, count=0, table_prefix="fuzz_w2_")
+    assert len(created)==6 and all(query.startswith("CREATE TABLE fuzz_w2_") for query in created)
+
+def test_statements_are_rendered_per_dialect():
+    for questdb, sqlite in statements(5, dialects=("questdb", "sqlite"))[6:]:
+        assert "SYMBOL" not in sqlite and "BETWEEN SYMMETRIC" not in sqlite
@@ -0,0 +1,90 @@
+import os
+import pytest
+from record_store import RecordStore, RecordReader, export, pair_outcome, read_pairs, record_kind
+
+SELECT = ["SELECT c0 FROM fuzz_a AS T1", "SELECT c0 FROM fuzz_a AS T1"]
+INSERT = ["INSERT INTO fuzz_b VALUES (1);", "INSERT INTO fuzz_b VALUES (1);"]
+COMMENT = ["-- generator seed 5", "-- generator seed 5"]
+
+def store(path, **options):
+    return RecordStore(str(path), **dict(dict(block_records=2, flush_interval=3600), **options))
+
+def test_outcome_and_kind():
+    assert [pair_outcome(True, True, False), pair_outcome(True, True, True), pair_outcome(False, True, False),
+            pair_outcome(True, False, False), pair_outcome(False, False, False)]==["ok", "mismatch", "questdb_error", "postgres_error", "both_error"]
+    assert [record_kind(SELECT), record_kind(INSERT), record_kind(COMMENT)]==["select", "write", "comment"]
+
+def test_nothing_is_created_before_the_first_record(tmp_path):
+    store(tmp_path/"records").close()
+    assert not (tmp_path/"records").exists()
+
+def test_records_are_found_by_seq_and_in_ranges(tmp_path):
+    writer = store(tmp_path/"records")
+    seqs = [writer.append(SELECT if i%2 else INSERT, 1, "ok", worker=3) for i in range(5)]
+    assert seqs==[1, 2, 3, 4, 5]
+    # full blocks are readable while the writer runs
+    reader = RecordReader(str(tmp_path/"records"))
+    assert len(reader)==4
+    writer.close()
+    assert len(reader)==5
+    record = reader.get(2)
+    assert record["queries"]==SELECT and record["kind"]=="select" and record["worker"]==3 and record["tables"]==["fuzz_a"]
+    assert [record["seq"] for record in reader.range(2, 5)]==[2, 3, 4]
+    assert [record["seq"] for record in reader.range(4)]==[4, 5]
+    with pytest.raises(KeyError):
+        reader.get(6)
+    reader.close()
+
+def test_find_by_round_kind_outcome_and_table(tmp_path):
+    writer = store(tmp_path/"records")
+    writer.append(COMMENT, 1)
+    writer.append(INSERT, 1, "ok")
+    writer.append(SELECT, 1, "mismatch")
+    writer.append(SELECT, 2, "questdb_error")
+    writer.close()
+    reader = RecordReader(str(tmp_path/"records"))
+    seqs = lambda **keys: [record["seq"] for record in reader.find(**keys)]
+    assert seqs(testing_round=1)==[1, 2, 3]
+    assert seqs(kind="select")==[3, 4]
+    assert seqs(outcome="mismatch")==[3]
+    assert seqs(table="fuzz_b")==[2]
+    assert seqs(testing_round=2, table="fuzz_a")==[4]
+    reader.close()
+
+def test_sessions_continue_the_sequence_in_new_segments(tmp_path):
+    path = tmp_path/"records"
+    for _ in range(2):
+        writer = store(path, segment_bytes=1)
+        for _ in range(3):
+            writer.append(SELECT, 1, "ok")
+        writer.close()
+    assert sorted(os.listdir(path))[-1]=="segment-000004.rec"
+    reader = RecordReader(str(path))
+    assert [record["seq"] for record in reader.range()]==[1, 2, 3, 4, 5, 6]
+    reader.close()
+
+def test_export_writes_the_text_logs(tmp_path):
+    writer = store(tmp_path/"records")
+    writer.append(COMMENT)
+    writer.append(INSERT, 1, "ok")
+    writer.append(["SELECT c9 FROM fuzz_a", "SELECT c9 FROM fuzz_a"], 1, "both_error")
+    writer.append(SELECT, 1, "mismatch")
+    writer.close()
+    assert export(str(tmp_path/"records"), str(tmp_path))==4
+    # failing SELECTs are not replayed
+    assert (tmp_path/"diff_input.log").read_text()==''.join(str(query)+'\n' for query in (COMMENT, INSERT, SELECT))
+    assert (tmp_path/"questdb_testing.log").read_text().count("===Query Records===")==3
+    assert list(read_pairs(str(tmp_path/"diff_input.log")))==[COMMENT, INSERT, SELECT]
+    assert list(read_pairs(str(tmp_path/"records")))[1:]==[INSERT, ["SELECT c9 FROM fuzz_a"]*2, SELECT]
+
+def test_rotate_keeps_previous_stores(tmp_path):
+    path = tmp_path/"records"
+    for session in range(3):
+        writer = store(path)
+        writer.append(SELECT, session, "ok")
+        writer.rotate(backup_count=2)
+    assert not path.exists()
+    assert sorted(os.listdir(tmp_path))==["records.1", "records.2"]
+    reader = RecordReader(str(tmp_path/"records.2"))
+    assert reader.get(1)["round"]==1
+    reader.close()
@@ -0,0 +1,33 @@
+import pytest
+
+def test_parse_seed_record():
+    pytest.importorskip("psycopg2")
+    pytest.importorskip("tqdm")
+    from replay import parse_seed_record
+    assert parse_seed_record("-- seed fuzz_abcdefgh rows=100 seed=42")==("fuzz_abcdefgh", 100, 42)
+
+def test_replay_of_a_diff_input_log(main_logs, tmp_path, monkeypatch):
+    import main
+    import replay
+    from log_writer import BufferedLogWriter
+    writer = BufferedLogWriter(sync_paths=["./bug.log"])
+    monkeypatch.setattr(main, "log_writer", writer)
+    monkeypatch.setattr(main, "EVAL_CONFIG_BACKENDS", ("sqlite", "sqlite"))
+    monkeypatch.setattr(main, "EVAL_CONFIG_STATEMENT_TIMEOUTS", (None, None))
+    create = "CREATE TABLE fuzz_abcdefgh (c0 INT, c1 TEXT, c2 TEXT);"
+    pairs = [
+        ["-- generator seed 1", "-- generator seed 1"],
+        [create, create],
+        ["-- seed fuzz_abcdefgh rows=20 seed=7", "-- seed fuzz_abcdefgh rows=20 seed=7"],
+        ["SELECT COUNT(*) FROM fuzz_abcdefgh", "SELECT COUNT(*) FROM fuzz_abcdefgh"],
+        # the tested engine gets another row: the next SELECT is a mismatch
+        ["INSERT INTO fuzz_abcdefgh VALUES (1,'a','2020-01-01');", "INSERT INTO fuzz_abcdefgh VALUES (2,'a','2020-01-01');"],
+        ["SELECT c0 FROM fuzz_abcdefgh WHERE c1='a'", "SELECT c0 FROM fuzz_abcdefgh WHERE c1='a'"],
+    ]
+    log = tmp_path/"diff_input.log"
+    log.write_text(''.join(str(pair)+'\n' for pair in pairs))
+    stats = replay.replay(str(log), workers=2)
+    writer.close()
+    assert (stats.statements, stats.selects, stats.bugs)==(4, 2, 1)
+    assert stats.questdb_success==4 and stats.postgres_success==4
+    assert "fuzz_abcdefgh" in (tmp_path/"bug.log").read_text()
@@ -0,0 +1,105 @@
+import types
+from result_cache import ResultCache
+from timeouts import slowdown
+
+class ListStream:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.position = 0
+        self.closed = False
+
+    def fetchmany(self, size):
+        chunk = self.rows[self.position:self.position+size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+class Engine:
+    # round_trip stand-in counting the statements that reached it
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def round_trip(self, api, query, budget=None):
+        self.statements.append(query)
+        if "SELECT " in query:
+            if budget is not None:
+                budget.elapsed = 2.0
+            return ListStream(self.rows)
+        return True
+
+def budget():
+    return types.SimpleNamespace(timeout=None, elapsed=0.0, timed_out=False, cached=False)
+
+def read(stream):
+    rows = []
+    while True:
+        chunk = stream.fetchmany(2)
+        if len(chunk)==0:
+            break
+        rows.extend(chunk)
+    stream.close()
+    return rows
+
+def test_repeat_is_answered_from_the_cache():
+    engine = Engine([(1,), (2,), (3,)])
+    cache = ResultCache()
+    query = "SELECT c0 FROM fuzz_t"
+    assert read(cache.execute(engine.round_trip, None, query))==[(1,), (2,), (3,)]
+    assert read(cache.execute(engine.round_trip, None, query))==[(1,), (2,), (3,)]
+    assert engine.statements==[query]
+    assert cache.stats()["hits"]==1
+
+def test_write_invalidates_the_table():
+    engine = Engine([(1,)])
+    cache = ResultCache()
+    query = "SELECT c0 FROM fuzz_t"
+    read(cache.execute(engine.round_trip, None, query))
+    cache.execute(engine.round_trip, None, "INSERT INTO fuzz_t VALUES (2)")
+    read(cache.execute(engine.round_trip, None, query))
+    read(cache.execute(engine.round_trip, None, query))
+    assert engine.statements.count(query)==2
+    assert cache.stats()["hits"]==1
+
+def test_partially_read_results_are_not_cached():
+    engine = Engine([(i,) for i in range(10)])
+    cache = ResultCache()
+    query = "SELECT c0 FROM fuzz_t"
+    stream = cache.execute(engine.round_trip, None, query)
+    stream.fetchmany(2)
+    stream.close()
+    read(cache.execute(engine.round_trip, None, query))
+    assert len(engine.statements)==2
+    assert cache.stats()["uncacheable"]==1
+
+def test_nondeterministic_queries_always_run():
+    engine = Engine([(1,)])
+    cache = ResultCache()
+    for _ in range(2):
+        read(cache.execute(engine.round_trip, None, "SELECT NOW() FROM fuzz_t"))
+    assert len(engine.statements)==2
+
+def test_rows_budget_evicts_least_recently_used():
+    engine = Engine([(1,), (2,)])
+    cache = ResultCache(max_rows=4)
+    for table in ("fuzz_a", "fuzz_b", "fuzz_c"):
+        read(cache.execute(engine.round_trip, None, f"SELECT c0 FROM {table}"))
+    assert cache.stats()["entries"]==2
+    assert cache.stats()["evictions"]==1
+
+def test_hit_budget_is_marked_cached_and_skipped_by_perf_analysis():
+    engine = Engine([(1,)])
+    cache = ResultCache()
+    query = "SELECT c0 FROM fuzz_t"
+    first = budget()
+    read(cache.execute(engine.round_trip, None, query, first))
+    assert not first.cached and first.elapsed==2.0
+    hit = budget()
+    read(cache.execute(engine.round_trip, None, query, hit))
+    assert hit.cached and hit.elapsed==0.0
+    tested = budget()
+    tested.elapsed = 30.0
+    assert slowdown((tested, hit), (True, True)) is None
+    assert slowdown((tested, first), (True, True))==15.0
@@ -0,0 +1,62 @@
+import decimal
+import pytest
+from result_compare import FetchError, ResultComparison, compare_streams
+
+class ListStream:
+    def __init__(self, rows, fail_after=None):
+        self.rows = list(rows)
+        self.fetched = 0
+        self.fail_after = fail_after
+
+    def fetchmany(self, size):
+        if self.fail_after is not None and self.fetched>=self.fail_after:
+            raise RuntimeError("connection lost")
+        chunk = self.rows[self.fetched:self.fetched+size]
+        self.fetched += len(chunk)
+        return chunk
+
+def compare(rows0, rows1, chunk_size=1000, max_pending=100000):
+    return compare_streams([ListStream(rows0), ListStream(rows1)], chunk_size, max_pending)
+
+def test_same_multiset_in_any_order():
+    rows = [(i, str(i%7)) for i in range(50)]
+    assert not compare(rows, list(reversed(rows)), chunk_size=7).differs()
+
+def test_hash_colliding_values_differ():
+    # hash(-1)==hash(-2) in CPython
+    assert compare([(-1, 'a')], [(-2, 'a')]).differs()
+    assert compare([(-1,)], [(-2,)]).differs()
+
+def test_hash_colliding_values_differ_without_pending_rows():
+    # with no row kept in memory only the digests tell the sides apart
+    comparison = compare([(-1, 'a')]*3, [(-2, 'a')]*3, max_pending=0)
+    assert comparison.overflow
+    assert comparison.differs()
+
+def test_multiplicity_counts():
+    comparison = compare([(1,), (1,), (2,)], [(1,), (2,), (2,)])
+    assert comparison.differs()
+    assert comparison.samples(0)==[((1,), 1)]
+    assert comparison.samples(1)==[((2,), 1)]
+
+def test_decimal_and_integer_floats_match():
+    assert not compare([(decimal.Decimal("1.5"), 2)], [(1.5, 2.0)]).differs()
+    assert not compare([(1.0,)], [(1,)], max_pending=0).differs()
+
+def test_stops_when_one_side_has_more_rows():
+    streams = [ListStream([(1,)]), ListStream([(i,) for i in range(100)])]
+    comparison = compare_streams(streams, 10)
+    assert comparison.differs()
+    assert streams[1].fetched<100
+    assert "+ rows" in comparison.describe(1)
+
+def test_fetch_error_names_the_side():
+    with pytest.raises(FetchError) as error:
+        compare_streams([ListStream([(1,)]), ListStream([(1,)], fail_after=0)], 10)
+    assert error.value.side==1
+
+def test_sample_size_is_bounded():
+    comparison = ResultComparison(sample_size=3)
+    comparison.add(0, [(i,) for i in range(10)])
+    assert len(comparison.samples(0))==3
+    assert comparison.samples(1)==[]
@@ -0,0 +1,102 @@
+import random
+import threading
+import pytest
+from scheduler import DelayedFeedback, FeedbackStopped, Scheduler, coverage, INITIAL_REWARD, MISMATCH_REWARD, ERROR_REWARD
+from clause_identification import clauses_identifying
+from query_generation import QueryGenerator
+
+def test_coverage_names_kind_clauses_and_mapping_rules():
+    query = ["SELECT c0 FROM fuzz_a AS T1 WHERE T1.c0 IN (1) AND c0 BETWEEN 1 AND 2"]*2
+    assert coverage(query)=="SELECT|IN|BETWEEN|mapping:in|mapping:between"
+    assert coverage(["INSERT INTO fuzz_a VALUES (1);"]*2)=="INSERT"
+
+def test_feedback_rewards_rare_combinations_and_bugs():
+    scheduler = Scheduler(None)
+    select = ["SELECT c0 FROM fuzz_a"]*2
+    assert scheduler.feedback(select, True, True, False)==1
+    assert scheduler.feedback(select, True, True, False)==pytest.approx(2**-0.5)
+    assert scheduler.feedback(select, True, False, False)==pytest.approx(3**-0.5+ERROR_REWARD)
+    # an invalid statement is no bug
+    assert scheduler.feedback(select, False, False, True)==pytest.approx(0.5+MISMATCH_REWARD)
+
+def test_reward_moves_the_chosen_arms():
+    scheduler = Scheduler(None, learning_rate=0.5)
+    rng = random.Random(0)
+    scheduler.begin()
+    option = scheduler.choose(rng, "joins", [0, 1, 2])
+    trace = scheduler.detach()
+    assert trace==[("joins", str(option))] and scheduler.trace==[]
+    scheduler.reward(3.0, trace)
+    assert scheduler.arms["joins"]=={str(option): INITIAL_REWARD+0.5*(3.0-INITIAL_REWARD)}
+    scheduler.skipped(trace)
+    assert scheduler.arms["joins"][str(option)]==pytest.approx(1.0)
+
+def test_rewarded_option_is_chosen_more_often():
+    scheduler = Scheduler(None)
+    scheduler.arms["kind"] = {"a": 10.0, "b": 0.0}
+    rng = random.Random(1)
+    chosen = [scheduler.choose(rng, "kind", ["a", "b"]) for _ in range(1000)]
+    # b keeps the exploration floor
+    assert 0<chosen.count("b")<50
+
+def test_priors_exclude_options():
+    scheduler = Scheduler(None)
+    rng = random.Random(2)
+    assert {scheduler.choose(rng, "statement", ["select", "update"], priors=[1, 0]) for _ in range(100)}=={"select"}
+
+def test_weights_are_saved_and_resumed(tmp_path):
+    path = str(tmp_path/"scheduler.json")
+    scheduler = Scheduler(path, save_interval=3600)
+    scheduler.choose(random.Random(0), "kind", ["a"])
+    scheduler.feedback(["SELECT c0 FROM fuzz_a"]*2, True, True, True)
+    scheduler.save()
+    resumed = Scheduler(path)
+    assert resumed.arms==scheduler.arms and resumed.combinations=={"SELECT": 1}
+    assert resumed.summary()["kind"][0][1]=="a"
+
+def test_generator_reports_its_decisions():
+    scheduler = Scheduler(None)
+    generator = QueryGenerator(clauses_identifying(None, None), True, seed=4, scheduler=scheduler)
+    generator.tables = [generator.random_create_query()[0] for _ in range(3)]
+    generator.random_statement()
+    decisions = [decision for decision, _ in scheduler.trace]
+    assert decisions[0]=="statement" and "statement" in scheduler.arms
+    scheduler.reward(1.0)
+    assert scheduler.trace==[]
+
+def test_delayed_feedback_is_applied_in_statement_order():
+    # outcomes reported in any order leave the same weights
+    weights = []
+    for order in ([0, 1, 2, 3], [3, 1, 0, 2]):
+        scheduler = Scheduler(None)
+        feedback = DelayedFeedback(scheduler, lag=5)
+        rng = random.Random(0)
+        numbers = []
+        for _ in range(4):
+            feedback.before()
+            scheduler.begin()
+            scheduler.choose(rng, "kind", ["a", "b"])
+            numbers.append(feedback.detach())
+        feedback.skipped(numbers[2])
+        for number in order:
+            if number!=2:
+                feedback.feedback(number, ["SELECT c0 FROM fuzz_a"]*2, True, number!=1, number==3)
+        assert scheduler.arms["kind"]=={} and scheduler.combinations=={}
+        feedback.finish()
+        weights.append((scheduler.arms, scheduler.combinations))
+    assert weights[0]==weights[1] and weights[0][1]=={"SELECT": 3}
+
+def test_generation_waits_for_the_feedback_lag_statements_back():
+    scheduler = Scheduler(None)
+    stopped = threading.Event()
+    feedback = DelayedFeedback(scheduler, lag=2, stopped=stopped)
+    for _ in range(2):
+        feedback.before()
+        feedback.detach()
+    feedback.feedback(0, ["SELECT c0 FROM fuzz_a"]*2, True, True, False)
+    feedback.before()
+    assert feedback.applied==1
+    feedback.detach()
+    stopped.set()
+    with pytest.raises(FeedbackStopped):
+        feedback.before()
@@ -0,0 +1,38 @@
+import sqlite3
+from seeding import SeedSpec, copy_text, generate_rows, ilp_lines, insert_statement, row_literals, sql_string
+
+def test_sql_string_doubles_quotes():
+    assert sql_string("abc")=="'abc'"
+    assert sql_string("it's")=="'it''s'"
+    # repr would switch to double quotes or backslash escapes here
+    assert sql_string("a'b\"c")=="'a''b\"c'"
+    assert sql_string("back\\slash")=="'back\\slash'"
+
+def test_row_literals():
+    assert row_literals((None, None, 0))==['NULL', 'NULL', "'1970-01-01T00:00:00'"]
+    assert row_literals((-5, "o'k", 1000000))==['-5', "'o''k'", "'1970-01-01T00:00:01'"]
+
+def test_insert_statement_loads_quoted_strings():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (c0 INT, c1 TEXT, c2 TEXT)")
+    rows = [(1, "it's", 0), (None, 'say "hi"', 1), (2, None, 2)]
+    conn.execute(insert_statement("t", rows))
+    assert [row[:2] for row in conn.execute("SELECT c0, c1 FROM t ORDER BY c2")]==[(1, "it's"), (None, 'say "hi"'), (2, None)]
+
+def test_generated_rows_are_reproducible():
+    spec = SeedSpec(200)
+    assert generate_rows(spec, 7)==generate_rows(spec, 7)
+    assert generate_rows(spec, 7)!=generate_rows(spec, 8)
+
+def test_generated_rows_follow_the_spec():
+    spec = SeedSpec(500, int_range=(-3, 3), null_rate=0.0)
+    rows = generate_rows(spec, 1)
+    assert len(rows)==500
+    assert all(-3<=c0<=3 and c1.isalpha() and c1.islower() for c0, c1, _ in rows)
+    timestamps = [c2 for _, _, c2 in rows]
+    assert timestamps==sorted(timestamps)
+
+def test_copy_and_line_protocol_formats():
+    rows = [(1, "ab", 5), (None, None, 6)]
+    assert copy_text(rows).read()=="1\tab\t5\n\\N\t\\N\t6\n"
+    assert ilp_lines("t", [(1, "ab", 5), (2, None, 6)])==b"t,c1=ab c0=1i 5000\nt c0=2i 6000\n"
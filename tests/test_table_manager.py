@@ -0,0 +1,77 @@
+import pytest
+from table_manager import TableManager, owned_tables
+
+class TableApi:
+    # an engine holding table names, with the statements it was sent
+    def __init__(self, tables=()):
+        self.tables = set(tables)
+        self.statements = []
+
+    def list_tables(self):
+        return sorted(self.tables)
+
+    def write_query(self, query, budget=None):
+        self.statements.append(query)
+        if query.startswith("DROP TABLE IF EXISTS "):
+            self.tables.discard(query[len("DROP TABLE IF EXISTS "):].rstrip(";"))
+
+    def truncate_table(self, table):
+        self.statements.append(f"TRUNCATE TABLE {table};")
+
+class TableGenerator:
+    def __init__(self, names):
+        self.names = names
+        self.tables = []
+
+    def init_table(self, questdb_api, postgres_api):
+        for api in (questdb_api, postgres_api):
+            api.tables.update(self.names)
+        self.tables = list(self.names)
+        return self.names, ["create 1"], ["create 2"], ["create 3"]
+
+CAMPAIGN_TABLES = {"fuzz_w3_abcdefgh", "fuzz_w3_template0", "fuzz_w12_qwertyui_seed"}
+
+def test_sweep_leaves_campaign_worker_tables_alone():
+    own = {"fuzz_abcdefgh", "fuzz_zyxwvuts_seed", "fuzz_template1"}
+    others = CAMPAIGN_TABLES | {"users", "fuzz_", "fuzz_abc", "fuzz_abcdefghi"}
+    apis = [TableApi(own | others), TableApi(own | others)]
+    manager = TableManager(*apis, "fuzz_")
+    assert manager.sweep()==2*len(own)
+    for api in apis:
+        assert api.tables==others
+
+def test_worker_sweep_leaves_other_workers_alone():
+    apis = [TableApi(CAMPAIGN_TABLES | {"fuzz_abcdefgh"}), TableApi()]
+    TableManager(*apis, "fuzz_w3_").sweep()
+    assert apis[0].tables=={"fuzz_w12_qwertyui_seed", "fuzz_abcdefgh"}
+
+def test_owned_tables_escapes_the_prefix():
+    assert owned_tables("a.b_").fullmatch("a.b_abcdefgh")
+    assert not owned_tables("a.b_").fullmatch("axb_abcdefgh")
+
+def test_empty_prefix_sweeps_nothing():
+    api = TableApi({"abcdefgh"})
+    assert TableManager(api, TableApi(), "").sweep()==0
+    assert api.tables=={"abcdefgh"}
+
+def test_truncated_tables_are_reused_by_the_next_round():
+    apis = [TableApi(), TableApi()]
+    manager = TableManager(*apis, "fuzz_", round_end="truncate")
+    generator = TableGenerator(["fuzz_aaaaaaaa", "fuzz_bbbbbbbb", "fuzz_cccccccc"])
+    first = manager.new_round(generator)
+    manager.end_round()
+    generator.names = ["fuzz_dddddddd", "fuzz_eeeeeeee", "fuzz_ffffffff"]
+    assert manager.new_round(generator)==first
+    assert generator.tables==first[0]
+    assert "TRUNCATE TABLE fuzz_aaaaaaaa;" in apis[1].statements
+
+def test_dropped_round_tables():
+    apis = [TableApi(), TableApi()]
+    manager = TableManager(*apis, "fuzz_")
+    manager.new_round(TableGenerator(["fuzz_aaaaaaaa", "fuzz_bbbbbbbb", "fuzz_cccccccc"]))
+    manager.end_round()
+    assert apis[0].tables==set() and manager.dropped==3
+
+def test_unknown_round_end_policy():
+    with pytest.raises(ValueError):
+        TableManager(TableApi(), TableApi(), "fuzz_", round_end="archive")
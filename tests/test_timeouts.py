@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+import pytest
+from timeouts import AdaptiveTimeout, slowdown
+
+def budget(elapsed, timed_out=False, cached=False):
+    return SimpleNamespace(elapsed=elapsed, timed_out=timed_out, cached=cached)
+
+def test_initial_timeout_until_warmup():
+    timeout = AdaptiveTimeout(5.0, 0.1, 60, warmup=10, refresh=1)
+    for _ in range(9):
+        timeout.observe(0.01)
+    assert timeout.current()==5.0
+    timeout.observe(0.01)
+    # clamped to the minimum
+    assert timeout.current()==0.1
+
+def test_timeout_follows_the_percentile_of_the_window():
+    timeout = AdaptiveTimeout(5.0, 0.01, 60, percentile=0.9, factor=10, window=100, warmup=10, refresh=10)
+    for i in range(100):
+        timeout.observe(0.001*(i+1))
+    assert timeout.current()==pytest.approx(10*0.091)
+    # older latencies leave the window
+    for _ in range(100):
+        timeout.observe(10.0)
+    assert timeout.current()==60
+
+def test_timeout_is_refreshed_every_refresh_latencies():
+    timeout = AdaptiveTimeout(5.0, 0.01, 60, factor=1, warmup=1, refresh=3)
+    timeout.observe(1.0)
+    timeout.observe(2.0)
+    assert timeout.current()==5.0
+    timeout.observe(2.0)
+    assert timeout.current()==2.0
+
+def test_slowdown_of_the_tested_engine():
+    assert slowdown((budget(2.0), budget(0.5)), (True, True))==4.0
+    # a cancelled tested statement counts with its timeout
+    assert slowdown((budget(3.0, timed_out=True), budget(1.0)), (False, True))==3.0
+
+def test_no_slowdown_without_two_comparable_latencies():
+    assert slowdown((budget(2.0), budget(0.5)), (False, True)) is None
+    assert slowdown((budget(2.0), budget(0.5)), (True, False)) is None
+    assert slowdown((budget(2.0), budget(0.5, timed_out=True)), (True, False)) is None
+    assert slowdown((budget(2.0), budget(0.0, cached=True)), (True, True)) is None
@@ -0,0 +1,67 @@
+"""
+adaptive per-engine statement timeouts
+the timeout of an engine follows a high percentile of the latencies of
+its recent successful statements: a statement is cancelled once it runs
+factor times longer than almost every statement before it, whatever the
+table sizes of the campaign have grown to
+"""
+
+import threading
+import collections
+
+DEFAULT_PERCENTILE = 0.99
+DEFAULT_FACTOR = 10.0
+# latencies the percentile is taken over, the most recent ones
+DEFAULT_WINDOW = 1000
+# latencies observed before the initial timeout is replaced
+DEFAULT_WARMUP = 50
+# the percentile is recomputed every so many latencies
+DEFAULT_REFRESH = 100
+
+class AdaptiveTimeout:
+    """
+    initial: the timeout (seconds) until warmup latencies were observed,
+    then factor * percentile of the window, kept within [minimum, maximum]
+    """
+
+    def __init__(self, initial, minimum, maximum, percentile=DEFAULT_PERCENTILE, factor=DEFAULT_FACTOR,
+                 window=DEFAULT_WINDOW, warmup=DEFAULT_WARMUP, refresh=DEFAULT_REFRESH):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.percentile = percentile
+        self.factor = factor
+        self.warmup = warmup
+        self.refresh = refresh
+        self.value = initial
+        self.latencies = collections.deque(maxlen=window)
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def current(self):
+        return self.value
+
+    def observe(self, seconds):
+        # timed-out and cached statements are not observed, their latency is unknown
+        with self.lock:
+            self.latencies.append(seconds)
+            self.pending += 1
+            if len(self.latencies)<self.warmup or self.pending<self.refresh:
+                return
+            self.pending = 0
+            latencies = sorted(self.latencies)
+        high = latencies[min(len(latencies)-1, int(self.percentile*len(latencies)))]
+        self.value = min(self.maximum, max(self.minimum, high*self.factor))
+
+def slowdown(budgets, successes):
+    """
+    how many times the tested engine (side 0) was slower than the reference
+    on a pair, a timed-out tested statement counts with its timeout;
+    None when the reference failed or the tested statement failed otherwise,
+    or when a cached result answered either side
+    """
+    tested, reference = budgets
+    if tested.cached or reference.cached:
+        return None
+    if not successes[1] or reference.timed_out or not (successes[0] or tested.timed_out):
+        return None
+    return tested.elapsed/max(reference.elapsed, 1e-6)